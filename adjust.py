@@ -0,0 +1,162 @@
+from PIL import Image
+from decode import estimate_decode_bytes, fit_size, open_raw, preview_covers_view, raw_size, DEMOSAIC_ALGORITHMS
+from profiling import span
+
+# Adjustment ranges and the size of one key press
+LOOK_RANGES = {'exposure': (-5.0, 5.0), 'temperature': (-100, 100), 'tint': (-100, 100), 'highlights': (0, 100)}
+LOOK_STEPS = {'exposure': 1 / 3, 'temperature': 10, 'tint': 10, 'highlights': 25}
+
+# Number of distinct channel LUTs kept per proxy, enough for stepping back and forth
+LUT_CACHE_SIZE = 12
+
+class LookAdjustments:
+    """Exposure, white balance and highlight recovery applied on top of a decode
+
+    exposure is in stops. temperature and tint shift the red/blue and the
+    green channel gains by up to half a stop either way at +-100.
+    highlights at 0 clips like rawpy's own render; raising it rolls off
+    the brightest values instead, recovering what exposure pushed past white.
+    """
+
+    def __init__(self, exposure=0.0, temperature=0, tint=0, highlights=0):
+        self.exposure = exposure
+        self.temperature = temperature
+        self.tint = tint
+        self.highlights = highlights
+
+    def step(self, name, direction):
+        """Move one adjustment by a key press up (1) or down (-1), within its range"""
+        low, high = LOOK_RANGES[name]
+        value = getattr(self, name) + direction * LOOK_STEPS[name]
+        # 'or 0' turns a -0.0 left by stepping back into 0
+        setattr(self, name, min(max(round(value, 4), low), high) or 0)
+
+    def key(self):
+        return (self.exposure, self.temperature, self.tint, self.highlights)
+
+    def is_neutral(self):
+        return self.key() == (0, 0, 0, 0)
+
+    def channel_gains(self):
+        """Return the linear red, green and blue gains"""
+        exposure = 2.0 ** self.exposure
+        warm = 2.0 ** (self.temperature / 200)
+        return (exposure * warm, exposure * 2.0 ** (-self.tint / 200), exposure / warm)
+
+    def describe(self):
+        """Return a short summary of the adjustments for the status bar"""
+        return (f"EV {self.exposure:+.1f} · temp {self.temperature:+d} · tint {self.tint:+d}"
+                f" · highlights {self.highlights}")
+
+def build_tone_lut(gain, highlights):
+    """Precompute the 16-bit linear to 8-bit display mapping of one channel with its gain"""
+    import numpy as np
+    x = np.arange(65536, dtype=np.float32) * np.float32(gain / 65535)
+    if highlights > 0:
+        # Soft shoulder from the knee up, approaching white instead of clipping at it
+        knee = 1 - 0.6 * highlights / 100
+        over = x > knee
+        x[over] = knee + (1 - knee) * np.tanh((x[over] - knee) / (1 - knee))
+    x = np.minimum(x, 1)
+    # rawpy's default output curve, BT.709 with gamma (2.222, 4.5)
+    y = np.where(x < 0.018, 4.5 * x, 1.099 * np.power(x, 0.45) - 0.099)
+    return (y * 255 + 0.5).astype(np.uint8)
+
+class LinearProxy:
+    """Linear 16-bit RGB decode that look adjustments are rendered from
+
+    The channels are stored as separate planes so each can go through its
+    LUT with a single np.take. A LUT folds the channel's gain and the tone
+    curve together, so a render is three table lookups with no floating
+    point work per pixel.
+    """
+
+    def __init__(self, planes):
+        self.planes = planes                # uint16 array of shape (3, height, width)
+        self._luts = {}                     # (gain, highlights) -> uint8 LUT
+
+    @property
+    def size(self):
+        return (self.planes.shape[2], self.planes.shape[1])
+
+    def covers(self, view_size):
+        """Check whether the proxy fills view_size without upscaling"""
+        return preview_covers_view(self.size, view_size)
+
+    def lut(self, gain, highlights):
+        key = (round(gain, 6), highlights)
+        lut = self._luts.get(key)
+        if lut is None:
+            if len(self._luts) >= LUT_CACHE_SIZE:
+                self._luts.pop(next(iter(self._luts)))
+            lut = self._luts[key] = build_tone_lut(gain, highlights)
+        return lut
+
+    def render(self, look):
+        """Return the proxy rendered with a LookAdjustments as an 8-bit PIL image"""
+        import numpy as np
+        with span('adjust'):
+            out = np.empty(self.planes.shape, dtype=np.uint8)
+            for channel, gain in enumerate(look.channel_gains()):
+                np.take(self.lut(gain, look.highlights), self.planes[channel], out=out[channel])
+            bands = [Image.frombuffer('L', self.size, out[channel], 'raw', 'L', 0, 1) for channel in range(3)]
+            return Image.merge('RGB', bands)
+
+def plan_linear_decode(raw, target_size=None, memory_budget_mb=None):
+    """Pick whether a linear decode of an open RAW file runs at half size
+
+    A half-size decode skips demosaicing and is still sharp enough when it
+    covers target_size; a full resolution one is also cut to half size when
+    it doesn't fit the memory budget. Returns None when not even a half-size
+    decode fits.
+    """
+    full_size = raw_size(raw)
+    half_size = target_size is not None and preview_covers_view((full_size[0] // 2, full_size[1] // 2), target_size)
+    if memory_budget_mb is None:
+        return half_size
+    budget = memory_budget_mb * 1024 * 1024
+    for half in (False, True) if not half_size else (True,):
+        if estimate_decode_bytes(raw, 16, half) <= budget:
+            return half
+    return None
+
+def linear_proxy_from_raw(raw, half_size, target_size=None):
+    """Decode an open RAW file to a LinearProxy, downscaled to fit target_size if given"""
+    import numpy as np
+    import rawpy
+    algorithm = DEMOSAIC_ALGORITHMS['half' if half_size else 'full']
+    with span('postprocess_linear'):
+        rgb = raw.postprocess(
+            use_camera_wb=True,
+            demosaic_algorithm=getattr(rawpy.DemosaicAlgorithm, algorithm),
+            no_auto_bright=True,
+            output_bps=16,
+            gamma=(1, 1),
+            half_size=half_size
+        )
+    height, width = rgb.shape[:2]
+    size = fit_size((width, height), target_size) if target_size else (width, height)
+    if size == (width, height):
+        planes = np.ascontiguousarray(rgb.transpose(2, 0, 1))
+    else:
+        # PIL resizes 16-bit single-channel images, one plane at a time
+        with span('resize_linear'):
+            planes = np.stack([np.asarray(Image.fromarray(np.ascontiguousarray(rgb[..., channel]))
+                                          .resize(size, Image.Resampling.BOX))
+                               for channel in range(3)])
+    del rgb
+    return LinearProxy(planes)
+
+def decode_linear(source, target_size=None, memory_budget_mb=None):
+    """Open a RAW file and decode it to a LinearProxy, downscaled to fit target_size if given
+
+    Without a target size the proxy is at full resolution, for zooming in
+    and exporting, unless the memory budget only leaves room for half size.
+    The viewer normally gets its display resolution proxy from the decode
+    pipeline, which has the file open already; this is for when it
+    couldn't, e.g. the embedded preview was all that was shown.
+    """
+    with open_raw(source) as raw:
+        half_size = plan_linear_decode(raw, target_size, memory_budget_mb)
+        # Over budget even at half size: the smallest decode is the best there is
+        return linear_proxy_from_raw(raw, True if half_size is None else half_size, target_size)
@@ -0,0 +1,110 @@
+import weakref
+from collections import OrderedDict
+from PIL import Image
+
+# Channel values at or beyond which a pixel counts as clipped
+CLIP_LOW = 2
+CLIP_HIGH = 253
+
+# Sum of the horizontal and vertical luma steps (out of 510) that marks a sharp edge
+PEAKING_THRESHOLD = 60
+
+# Overlay colours, RGBA
+CLIP_HIGH_COLOR = (255, 40, 40, 210)
+CLIP_LOW_COLOR = (40, 100, 255, 210)
+PEAKING_COLOR = (60, 255, 60, 230)
+
+def luma(arr):
+    """Return the Rec. 601 luma of an RGB uint8 array as uint8, in integer arithmetic"""
+    import numpy as np
+    y = arr[..., 0].astype(np.uint16) * 77
+    y += arr[..., 1].astype(np.uint16) * 150
+    y += arr[..., 2].astype(np.uint16) * 29
+    y >>= 8
+    return y.astype(np.uint8)
+
+def compute_histogram(img):
+    """Return the red, green, blue and luma histograms of an RGB image as a (4, 256) array"""
+    import numpy as np
+    # PIL counts in C, several times faster than np.bincount over the interleaved channels
+    img = img.convert('RGB')
+    return np.array(img.histogram() + img.convert('L').histogram()).reshape(4, 256)
+
+def peaking_mask(arr):
+    """Return a boolean mask of the sharp edges of an RGB uint8 array"""
+    import numpy as np
+    y = luma(arr).astype(np.int16)
+    strength = np.zeros(y.shape, dtype=np.int16)
+    strength[:, :-1] += np.abs(np.diff(y, axis=1))
+    strength[:-1, :] += np.abs(np.diff(y, axis=0))
+    return strength >= PEAKING_THRESHOLD
+
+def _packed(color):
+    """Return an RGBA colour as the native-endian uint32 of its four bytes"""
+    import numpy as np
+    return np.frombuffer(bytes(color), dtype=np.uint32)[0]
+
+def compute_overlay(img, clipping, peaking):
+    """Return an RGBA image marking the clipped pixels and/or sharp edges of an RGB image"""
+    import numpy as np
+    arr = np.asarray(img.convert('RGB'))
+    # One uint32 per pixel, so masked writes set all four bytes at once
+    out = np.zeros(arr.shape[:2], dtype=np.uint32)
+    if clipping:
+        # Highlights clip when any channel does, shadows only when all of them do
+        brightest = np.maximum(np.maximum(arr[..., 0], arr[..., 1]), arr[..., 2])
+        out[brightest >= CLIP_HIGH] = _packed(CLIP_HIGH_COLOR)
+        out[brightest <= CLIP_LOW] = _packed(CLIP_LOW_COLOR)
+    if peaking:
+        out[peaking_mask(arr)] = _packed(PEAKING_COLOR)
+    return Image.frombuffer('RGBA', img.size, out, 'raw', 'RGBA', 0, 1)
+
+class DisplayAnalysis:
+    """Histograms and overlays of the images on screen, cached per image
+
+    Everything is computed from display buffers: the image fitted to the
+    window, or the tiles of a zoomed view. Results are keyed by the image
+    they were computed from, so they are reused for as long as that image
+    is, and a pan only analyses the tiles coming into view. The cache holds
+    weak references, so it never keeps a decoded image alive.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()         # (id(image), kind) -> (weak reference to image, result)
+
+    def _cached(self, owner, kind, compute):
+        key = (id(owner), kind)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0]() is owner:
+            self._cache.move_to_end(key)
+            return entry[1]
+        result = compute()
+        self._cache[key] = (weakref.ref(owner), result)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    def histogram(self, img, view_size, source=None):
+        """Return the histograms of an image, reduced to about view_size first if it is larger
+
+        source is the image a display image was resized from; keying on it
+        lets a new resize of the same image, or a zoomed view of it, reuse
+        the result.
+        """
+        def compute():
+            factor = int(min(img.width / view_size[0], img.height / view_size[1]))
+            return compute_histogram(img.reduce(factor) if factor > 1 else img)
+        return self._cached(source or img, 'histogram', compute)
+
+    def overlay(self, img, clipping, peaking, source=None):
+        """Return the RGBA clipping and/or peaking overlay of a display image, keyed like histogram()"""
+        kind = ('overlay', img.size, clipping, peaking)
+        return self._cached(source or img, kind, lambda: compute_overlay(img, clipping, peaking))
+
+    def composite(self, tile, clipping, peaking):
+        """Return a tile with its clipping and/or peaking overlay drawn in"""
+        def compute():
+            overlay = compute_overlay(tile, clipping, peaking)
+            return Image.alpha_composite(tile.convert('RGBA'), overlay).convert('RGB')
+        return self._cached(tile, ('composite', clipping, peaking), compute)
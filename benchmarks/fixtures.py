@@ -0,0 +1,112 @@
+"""Synthetic DNG fixtures, generated locally so the benchmarks need no network"""
+import io
+import os
+import struct
+import numpy as np
+from PIL import Image
+
+# TIFF field types
+BYTE, ASCII, SHORT, LONG, RATIONAL, SRATIONAL = 1, 2, 3, 4, 5, 10
+_PACK = {BYTE: 'B', SHORT: 'H', LONG: 'I'}
+
+def _ifd(entries, offset):
+    """Serialize an IFD placed at offset; returns (ifd bytes, out-of-line data bytes)"""
+    entries = sorted(entries)
+    ifd_size = 2 + len(entries) * 12 + 4
+    body = struct.pack('<H', len(entries))
+    extra = b''
+    for tag, field_type, values in entries:
+        if field_type in (RATIONAL, SRATIONAL):
+            fmt = '<ii' if field_type == SRATIONAL else '<II'
+            payload = b''.join(struct.pack(fmt, *value) for value in values)
+            count = len(values)
+        elif field_type == ASCII:
+            payload = values.encode('ascii') + b'\0'
+            count = len(payload)
+        else:
+            payload = b''.join(struct.pack('<' + _PACK[field_type], value) for value in values)
+            count = len(values)
+        if len(payload) <= 4:
+            body += struct.pack('<HHI', tag, field_type, count) + payload.ljust(4, b'\0')
+        else:
+            body += struct.pack('<HHII', tag, field_type, count, offset + ifd_size + len(extra))
+            extra += payload + b'\0' * (len(payload) % 2)
+    return body + struct.pack('<I', 0), extra
+
+def _scene(width, height, seed):
+    """A smooth pattern with fine detail and noise, so demosaicing does real work"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = seed * 0.7
+    base = (np.sin(x / 37.0 + phase) * 0.5 + 0.5) * (np.cos(y / 23.0 - phase) * 0.5 + 0.5)
+    detail = (np.sin((x + y) / 3.0) * 0.5 + 0.5) * 0.2
+    noise = rng.random((height, width), dtype=np.float32) * 0.05
+    return np.clip(base * 0.75 + detail + noise, 0, 1)
+
+def make_dng(path, width=6000, height=4000, preview_size=(1616, 1080), seed=0):
+    """Write a Bayer DNG with an embedded JPEG preview
+
+    IFD0 holds the JPEG preview (like most camera DNGs) and points to a
+    SubIFD with the uncompressed 16-bit RGGB mosaic.
+    """
+    scene = _scene(width, height, seed)
+    mosaic = (scene * 3800 + 256).astype('<u2')
+    # Make the green sites of the mosaic a little brighter, as real sensors do
+    mosaic[0::2, 1::2] = np.minimum(mosaic[0::2, 1::2] * 1.2, 4095).astype('<u2')
+    mosaic[1::2, 0::2] = np.minimum(mosaic[1::2, 0::2] * 1.2, 4095).astype('<u2')
+    raw_data = mosaic.tobytes()
+    del mosaic
+
+    rgb = (np.dstack([scene, scene ** 1.5, 1 - scene]) * 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb).resize(preview_size, Image.Resampling.BILINEAR).save(buffer, 'JPEG', quality=85)
+    jpeg_data = buffer.getvalue()
+    del rgb, scene
+
+    def preview_ifd(sub_ifd_offset, jpeg_offset):
+        return [
+            (254, LONG, [1]), (256, LONG, [preview_size[0]]), (257, LONG, [preview_size[1]]),
+            (258, SHORT, [8, 8, 8]), (259, SHORT, [7]), (262, SHORT, [6]),
+            (271, ASCII, 'fastraw'), (272, ASCII, 'Synthetic'), (273, LONG, [jpeg_offset]),
+            (274, SHORT, [1]), (277, SHORT, [3]), (278, LONG, [preview_size[1]]),
+            (279, LONG, [len(jpeg_data)]), (330, LONG, [sub_ifd_offset]),
+            (50706, BYTE, [1, 4, 0, 0]), (50708, ASCII, 'fastraw Synthetic'),
+            (50721, SRATIONAL, [(1, 1), (0, 1), (0, 1), (0, 1), (1, 1), (0, 1), (0, 1), (0, 1), (1, 1)]),
+            (50728, RATIONAL, [(1, 2), (1, 1), (1, 2)]), (50778, SHORT, [21]),
+        ]
+
+    def raw_ifd(raw_offset):
+        return [
+            (254, LONG, [0]), (256, LONG, [width]), (257, LONG, [height]), (258, SHORT, [16]),
+            (259, SHORT, [1]), (262, SHORT, [32803]), (273, LONG, [raw_offset]), (277, SHORT, [1]),
+            (278, LONG, [height]), (279, LONG, [len(raw_data)]), (284, SHORT, [1]),
+            (33421, SHORT, [2, 2]), (33422, BYTE, [0, 1, 1, 2]),
+            (50714, SHORT, [256]), (50717, SHORT, [4095]),
+        ]
+
+    # Lay out header | IFD0 | SubIFD | JPEG | mosaic; offsets don't change the IFD sizes
+    ifd0, extra0 = _ifd(preview_ifd(0, 0), 8)
+    sub_ifd_offset = 8 + len(ifd0) + len(extra0)
+    ifd1, extra1 = _ifd(raw_ifd(0), sub_ifd_offset)
+    jpeg_offset = sub_ifd_offset + len(ifd1) + len(extra1)
+    jpeg_padding = b'\0' * (len(jpeg_data) % 2)
+    raw_offset = jpeg_offset + len(jpeg_data) + len(jpeg_padding)
+    ifd0, extra0 = _ifd(preview_ifd(sub_ifd_offset, jpeg_offset), 8)
+    ifd1, extra1 = _ifd(raw_ifd(raw_offset), sub_ifd_offset)
+
+    with open(path, 'wb') as f:
+        f.write(b'II*\0' + struct.pack('<I', 8))
+        f.write(ifd0 + extra0 + ifd1 + extra1 + jpeg_data + jpeg_padding)
+        f.write(raw_data)
+    return path
+
+def make_fixture_set(directory, count=8, width=6000, height=4000):
+    """Generate count DNGs in a directory, reusing ones that already exist"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"synthetic_{width}x{height}_{index:03d}.dng")
+        if not os.path.exists(path):
+            make_dng(path, width, height, seed=index)
+        paths.append(path)
+    return paths
@@ -0,0 +1,206 @@
+"""Benchmark the paths behind fastraw's time-to-first-pixel and time-to-full-quality
+
+Runs headless against a folder of RAW files and/or synthetic DNG fixtures and
+prints a JSON report, so runs from different versions can be compared:
+
+    python -m benchmarks.run ~/shoots/sample --synthetic 4 --output after.json
+    python -m benchmarks.run --synthetic 4 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+if __package__ in (None, ''):
+    # Allow running as a script from a checkout: python benchmarks/run.py
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import PIL
+import rawpy
+from decode import Generation, list_raw_files, run_decode_pipeline
+from decode_engine import ENGINE_NAMES, create_engine
+from memory import PeakRSSMonitor
+from render import CrossfadeBlender, ImagePyramid, resize_to_fit
+from benchmarks.fixtures import make_fixture_set
+
+# Canvas sizes used for the resize and fade measurements
+CANVAS_SIZES = ((1200, 800), (1920, 1080), (3840, 2160))
+
+def percentiles(samples):
+    """Summarize a list of samples with p50, p95, min, max and count"""
+    if not samples:
+        return None
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'n': len(samples),
+    }
+
+def measure_open(path, engine):
+    """Time one open through the viewer's decode pipeline
+
+    Returns (seconds to preview, seconds to full image, peak RSS in MB, full image).
+    """
+    generation = Generation()
+    token = generation.advance()
+    marks = {}
+    images = {}
+
+    def on_preview(img):
+        marks['preview'] = time.perf_counter()
+
+    def on_full(img):
+        marks['full'] = time.perf_counter()
+        images['full'] = img
+
+    with PeakRSSMonitor() as monitor:
+        start = time.perf_counter()
+        run_decode_pipeline(path, token, generation, on_preview, on_full, engine=engine, target_size=(1920, 1080))
+    return marks['preview'] - start, marks['full'] - start, monitor.peak_mb, images['full']
+
+def measure_resize(img, repeat):
+    """Time fit-to-canvas resizes straight from the full image and through its pyramid"""
+    pyramid = ImagePyramid(img).build()
+    results = {}
+    for width, height in CANVAS_SIZES:
+        direct, pyramid_times = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            resize_to_fit(img, width, height)
+            direct.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            resize_to_fit(img, width, height, pyramid)
+            pyramid_times.append(time.perf_counter() - start)
+        results[f"{width}x{height}"] = {'direct_s': percentiles(direct), 'pyramid_s': percentiles(pyramid_times)}
+    return results
+
+def measure_fade(img, duration=1.0):
+    """Measure blended frames per second of the crossfade at each canvas size"""
+    results = {}
+    for width, height in CANVAS_SIZES:
+        end = resize_to_fit(img, width, height)
+        # A blurred copy stands in for the embedded preview
+        start_img = end.reduce(4).resize(end.size)
+        blender = CrossfadeBlender(start_img, end)
+        frames = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            blender.blend((frames % 100) / 100)
+            frames += 1
+        elapsed = time.perf_counter() - start
+        results[f"{width}x{height}"] = {'fps': frames / elapsed, 'frame_s': elapsed / frames}
+    return results
+
+def environment():
+    """Describe the code and machine a run was made on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'rawpy': rawpy.__version__,
+        'libraw': '.'.join(str(part) for part in rawpy.libraw_version),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+    }
+
+def run(paths, engine_name, workers, repeat):
+    """Run every measurement over a list of RAW files and return the report"""
+    engine = create_engine(engine_name, workers)
+    engine.warm_up()
+    preview_times, full_times, peaks = [], [], []
+    resize_results = fade_results = None
+    try:
+        # One untimed open so imports, worker processes and the OS file cache are warm
+        measure_open(paths[0], engine)
+        for _ in range(repeat):
+            for path in paths:
+                preview_s, full_s, peak_mb, full_img = measure_open(path, engine)
+                preview_times.append(preview_s)
+                full_times.append(full_s)
+                if peak_mb is not None:
+                    peaks.append(peak_mb)
+        resize_results = measure_resize(full_img, max(repeat, 3))
+        fade_results = measure_fade(full_img)
+    finally:
+        engine.shutdown()
+    return {
+        'environment': environment(),
+        'settings': {'engine': engine_name, 'workers': engine.workers, 'repeat': repeat, 'files': len(paths)},
+        'time_to_preview_s': percentiles(preview_times),
+        'time_to_full_s': percentiles(full_times),
+        'peak_rss_mb': percentiles(peaks),
+        'resize': resize_results,
+        'fade': fade_results,
+    }
+
+def flatten(report, prefix=''):
+    """Flatten the numeric leaves of a report into {'a.b.c': value}"""
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+def compare(baseline, current):
+    """Print the p50/fps metrics of two reports side by side"""
+    before, after = flatten(baseline), flatten(current)
+    for name in sorted(after):
+        if name in before and (name.endswith('.p50') or name.endswith('.p95') or name.endswith('.fps')):
+            ratio = after[name] / before[name] if before[name] else float('nan')
+            print(f"{name:45} {before[name]:12.4f} {after[name]:12.4f} {ratio:8.2f}x", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark fastraw decode, resize and fade paths')
+    parser.add_argument('folders', nargs='*', help='Folders of RAW files to benchmark')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N', help='Also benchmark N synthetic DNG fixtures')
+    parser.add_argument('--synthetic-size', default='6000x4000', metavar='WxH', help='Size of the synthetic DNGs')
+    parser.add_argument('--fixture-dir', default=os.path.join(tempfile.gettempdir(), 'fastraw-bench-fixtures'),
+                        help='Where synthetic fixtures are generated and reused')
+    parser.add_argument('--limit', type=int, default=None, help='Use at most this many files per folder')
+    parser.add_argument('--engine', choices=ENGINE_NAMES, default='thread', help='Decode engine (default: thread)')
+    parser.add_argument('--workers', type=int, default=None, help='Decode worker count')
+    parser.add_argument('--repeat', type=int, default=1, help='Passes over the file set (default: 1)')
+    parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', metavar='BASELINE', help='Print a comparison against an earlier JSON report')
+    args = parser.parse_args(argv)
+
+    paths = []
+    for folder in args.folders:
+        paths.extend(list_raw_files(folder)[:args.limit])
+    if args.synthetic:
+        width, height = (int(part) for part in args.synthetic_size.lower().split('x'))
+        paths.extend(make_fixture_set(args.fixture_dir, args.synthetic, width, height))
+    if not paths:
+        parser.error('no RAW files: pass a folder or --synthetic N')
+
+    report = run(paths, args.engine, args.workers, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+import math
+import os
+import tkinter as tk
+from PIL import ImageTk
+from decode import file_key, load_preview_image
+from imagecache import DecodedImageCache
+from scheduler import PRIORITY_BACKGROUND_PREVIEW
+
+# Longest edge of a thumbnail, and the space around it and below it for the file name
+THUMB_SIZE = 160
+CELL_PADDING = 10
+LABEL_HEIGHT = 18
+
+# Rows kept on the canvas above and below the visible ones, so slow scrolling never shows gaps
+OVERSCAN_ROWS = 1
+
+class ThumbnailGrid:
+    """Virtualized grid of the thumbnails of a folder of RAW files
+
+    Canvas items only exist for the rows crossing the visible area: scrolling
+    moves them, creates the rows coming into view and deletes the ones that
+    left it, so a folder of thousands of files costs no more than a screenful.
+    Thumbnails are the embedded previews decoded at thumbnail size, queued on
+    the DecodeScheduler only for the cells in view, and the decoded
+    thumbnails are kept in a DecodedImageCache bounded by memory.
+    """
+
+    def __init__(self, root, on_open, scheduler, disk_cache=None, cache_mb=64, thumb_size=THUMB_SIZE,
+                 metadata_index=None):
+        self.root = root
+        self.on_open = on_open              # Called with the path of a thumbnail that is opened
+        self.scheduler = scheduler
+        self.disk_cache = disk_cache
+        self.metadata_index = metadata_index  # Optional MetadataIndex with the embedded JPEG locations
+        self.thumb_size = thumb_size
+        self.cache = DecodedImageCache(max_mb=cache_mb)
+        self.canvas = tk.Canvas(root, bg="#121212", highlightthickness=0)
+
+        self.active = False
+        self.files = []
+        self.selected = 0
+        self.offset = 0                     # Scroll position in pixels
+        self.columns = 1
+        self.cells = {}                     # index -> [image item, label item, PhotoImage or None]
+        self.selection_item = None
+        self.scroll_item = None
+
+        # Results carrying an older generation belong to a previous folder
+        self.generation = 0
+        self.requested = {}                 # Scheduler key -> future of the thumbnails for the cells in view
+        self.failed = set()                 # Files whose thumbnail could not be decoded
+
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        self.canvas.bind("<ButtonPress-1>", self.on_click)
+        self.canvas.bind("<Double-Button-1>", lambda e: self.open_selected())
+
+    def show(self, files, selected=0):
+        """Show the grid for a list of files with one of them selected"""
+        if files != self.files:
+            self.clear()
+            self.files = list(files)
+            self.generation += 1
+            self.offset = 0
+        self.active = True
+        self.selected = min(max(selected, 0), len(self.files) - 1) if self.files else 0
+        self.render()
+        self.scroll_to(self.selected)
+
+    def hide(self):
+        """Stop the grid; its thumbnails stay cached for the next time it is shown"""
+        self.active = False
+        self.request([])
+
+    def clear(self):
+        """Remove every cell from the canvas"""
+        for image_item, label_item, _ in self.cells.values():
+            self.canvas.delete(image_item)
+            self.canvas.delete(label_item)
+        self.cells = {}
+
+    def cell_size(self):
+        """Return the width and height of one grid cell"""
+        size = self.thumb_size + 2 * CELL_PADDING
+        return size, size + LABEL_HEIGHT
+
+    def cell_origin(self, index):
+        """Return the canvas position of a cell's top-left corner at the current scroll offset"""
+        cell_width, cell_height = self.cell_size()
+        margin = (self.canvas.winfo_width() - self.columns * cell_width) // 2
+        row, column = divmod(index, self.columns)
+        return margin + column * cell_width, row * cell_height - self.offset
+
+    def content_height(self):
+        """Return the height of all rows together"""
+        return math.ceil(len(self.files) / self.columns) * self.cell_size()[1]
+
+    def render(self):
+        """Lay out the cells of the visible rows and queue their missing thumbnails"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        if not self.active or width <= 1 or height <= 1:
+            return
+        cell_width, cell_height = self.cell_size()
+        self.columns = max(1, width // cell_width)
+        self.offset = min(max(self.offset, 0), max(0, self.content_height() - height))
+
+        first_row = max(0, self.offset // cell_height - OVERSCAN_ROWS)
+        last_row = (self.offset + height) // cell_height + OVERSCAN_ROWS
+        visible = range(first_row * self.columns, min(len(self.files), (last_row + 1) * self.columns))
+
+        for index in visible:
+            x, y = self.cell_origin(index)
+            center = (x + cell_width // 2, y + CELL_PADDING + self.thumb_size // 2)
+            label = (x + cell_width // 2, y + cell_height - LABEL_HEIGHT // 2 - 2)
+            cell = self.cells.get(index)
+            if cell:
+                self.canvas.coords(cell[0], *center)
+                self.canvas.coords(cell[1], *label)
+                continue
+            # Cells whose thumbnail isn't decoded yet get an empty image item to fill in later
+            photo = self.cached_photo(index)
+            image_item = self.canvas.create_image(*center, image=photo or '')
+            label_item = self.canvas.create_text(*label, text=self.short_name(index), fill="#AAAAAA",
+                                                 font=("Helvetica", 9))
+            self.cells[index] = [image_item, label_item, photo]
+
+        # Drop the cells that scrolled out of view
+        for index in set(self.cells) - set(visible):
+            image_item, label_item, _ = self.cells.pop(index)
+            self.canvas.delete(image_item)
+            self.canvas.delete(label_item)
+
+        self.draw_selection()
+        self.draw_scroll_indicator()
+        self.request([index for index in visible if self.cells[index][2] is None])
+
+    def short_name(self, index):
+        """Return a file name short enough for its cell"""
+        name = os.path.basename(self.files[index])
+        limit = self.thumb_size // 7
+        return name if len(name) <= limit else name[:limit - 1] + '…'
+
+    def cached_photo(self, index):
+        """Return a PhotoImage of a thumbnail that is already decoded, or None"""
+        try:
+            img = self.cache.get(file_key(self.files[index]), 'thumb')
+        except OSError:
+            return None
+        return ImageTk.PhotoImage(img) if img is not None else None
+
+    def draw_selection(self):
+        """Outline the selected cell"""
+        if not self.files:
+            return
+        x, y = self.cell_origin(self.selected)
+        cell_width, cell_height = self.cell_size()
+        coords = (x + 2, y + 2, x + cell_width - 2, y + cell_height - 2)
+        if self.selection_item:
+            self.canvas.coords(self.selection_item, *coords)
+        else:
+            self.selection_item = self.canvas.create_rectangle(*coords, outline="#AAAAAA", width=2)
+
+    def draw_scroll_indicator(self):
+        """Show where the view is within the folder as a thin bar on the right edge"""
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        total = self.content_height()
+        if total <= height:
+            coords = (0, 0, 0, 0)
+        else:
+            top = height * self.offset / total
+            coords = (width - 5, top, width - 1, top + max(20, height * height / total))
+        if self.scroll_item:
+            self.canvas.coords(self.scroll_item, *coords)
+        else:
+            self.scroll_item = self.canvas.create_rectangle(*coords, fill="#3D3D3D", outline="")
+
+    def scroll_by(self, pixels):
+        """Scroll the grid by a number of pixels"""
+        self.offset += pixels
+        self.render()
+
+    def scroll_to(self, index):
+        """Scroll just enough to bring a cell fully into view"""
+        cell_height = self.cell_size()[1]
+        height = self.canvas.winfo_height()
+        top = index // self.columns * cell_height
+        if top < self.offset:
+            self.offset = top
+        elif top + cell_height > self.offset + height:
+            self.offset = top + cell_height - height
+        else:
+            return
+        self.render()
+
+    def move_selection(self, step):
+        """Move the selection by a number of cells, e.g. one row with step=columns"""
+        if not self.files:
+            return
+        self.selected = min(max(self.selected + step, 0), len(self.files) - 1)
+        self.draw_selection()
+        self.scroll_to(self.selected)
+
+    def open_selected(self):
+        """Open the selected file"""
+        if self.files:
+            self.on_open(self.files[self.selected])
+
+    def on_mouse_wheel(self, event):
+        """Scroll by one row per wheel step"""
+        direction = -1 if event.num == 4 or getattr(event, 'delta', 0) > 0 else 1
+        self.scroll_by(direction * self.cell_size()[1])
+
+    def on_click(self, event):
+        """Select the cell under the pointer"""
+        cell_width, cell_height = self.cell_size()
+        margin = self.cell_origin(0)[0]
+        column = (event.x - margin) // cell_width
+        index = (event.y + self.offset) // cell_height * self.columns + column
+        if 0 <= column < self.columns and 0 <= index < len(self.files):
+            self.selected = index
+            self.draw_selection()
+
+    def request(self, indices):
+        """Queue the thumbnails of the given cells, in order, and drop those of cells that left the view"""
+        requested = {}
+        for index in indices:
+            file_path = self.files[index]
+            if file_path in self.failed:
+                continue
+            job_key = ('thumb', file_path)
+            future = self.scheduler.submit(job_key, lambda job, p=file_path: self.thumbnail_job(p),
+                                           PRIORITY_BACKGROUND_PREVIEW)
+            if self.requested.get(job_key) is not future:
+                future.add_done_callback(lambda f, g=self.generation, i=index: self.thumbnail_done(g, i, f))
+            requested[job_key] = future
+        for job_key in set(self.requested) - set(requested):
+            self.scheduler.cancel(job_key)
+        self.requested = requested
+
+    def load_thumbnail(self, file_path):
+        """Decode the embedded preview of a file at thumbnail size"""
+        size = (self.thumb_size, self.thumb_size)
+        img = load_preview_image(file_path, self.disk_cache, size, self.metadata_index)
+        img = img.convert('RGB') if img.mode != 'RGB' else img.copy()
+        img.thumbnail(size)
+        return img
+
+    def show_thumbnail(self, generation, index, img):
+        """Put a decoded thumbnail into its cell if the cell is still on the canvas"""
+        cell = self.cells.get(index)
+        if generation != self.generation or cell is None or cell[2] is not None:
+            return
+        cell[2] = ImageTk.PhotoImage(img)
+        self.canvas.itemconfig(cell[0], image=cell[2])
+
+    def thumbnail_job(self, file_path):
+        """Scheduler job: the thumbnail of a file, from the cache or decoded"""
+        key = file_key(file_path)
+        img = self.cache.get(key, 'thumb')
+        if img is None:
+            img = self.load_thumbnail(file_path)
+            self.cache.put(key, 'thumb', img)
+        return img
+
+    def thumbnail_done(self, generation, index, future):
+        """Hand a finished thumbnail to the UI thread; called from the worker that decoded it"""
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            print(f"Error loading thumbnail: {error}")
+            self.failed.add(future.job.key[1])
+            return
+        img = future.result()
+        self.root.after(0, lambda: self.show_thumbnail(generation, index, img))
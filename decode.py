@@ -0,0 +1,385 @@
+import io
+import math
+import os
+import threading
+from PIL import Image
+from embedded import read_embedded_jpeg, read_jpeg_at
+from profiling import span
+
+# rawpy and numpy take longer to import than Tk takes to open a window, so they
+# are imported where they are first needed: previews come from the embedded
+# JPEG reader and only full decodes (or files without a usable JPEG) load them
+
+# File extensions recognised as RAW images
+RAW_EXTENSIONS = ('.raw', '.arw', '.cr2', '.cr3', '.nef', '.dng', '.raf', '.orf', '.pef', '.rw2', '.srw', '.x3f')
+
+def is_raw_file(file_path):
+    """Check whether a path looks like a RAW image file"""
+    return os.path.splitext(file_path)[1].lower() in RAW_EXTENSIONS
+
+def list_raw_files(directory):
+    """List the RAW files of a directory in a stable, case-insensitive name order"""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    paths = [os.path.join(directory, name) for name in names if is_raw_file(name)]
+    return sorted((path for path in paths if os.path.isfile(path)), key=lambda p: os.path.basename(p).lower())
+
+def file_key(file_path):
+    """Build a cache key that changes whenever the file on disk changes"""
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+def fit_size(size, target_size):
+    """Return the size of an image scaled down to fit inside target_size, keeping its aspect ratio"""
+    scale = min(target_size[0] / size[0], target_size[1] / size[1], 1.0)
+    return (max(1, math.ceil(size[0] * scale)), max(1, math.ceil(size[1] * scale)))
+
+def draft_to_fit(img, target_size):
+    """Ask libjpeg for the smallest 1/2, 1/4 or 1/8 scale that still fills target_size"""
+    if target_size:
+        img.draft('RGB', fit_size(img.size, target_size))
+    return img
+
+def open_jpeg(data, target_size=None):
+    """Decode JPEG bytes, at a reduced scale close to target_size when one is given"""
+    with span('jpeg_decode'):
+        img = draft_to_fit(Image.open(io.BytesIO(data)), target_size)
+        # Decode now, while the source data is still around
+        img.load()
+    return img
+
+def read_embedded_preview(file_path, target_size=None, location=None):
+    """Decode the largest embedded JPEG of a RAW file without rawpy
+
+    location is the JPEG's (offset, length, ...) when it is already known,
+    e.g. from the metadata index, which skips parsing the file's structure.
+    Returns the preview image and its JPEG bytes, or (None, None) when the
+    file has no JPEG the built-in reader can find.
+    """
+    with span('extract_embedded'):
+        jpeg_data = read_jpeg_at(file_path, location[0], location[1]) if location else None
+        if jpeg_data is None:
+            jpeg_data, _ = read_embedded_jpeg(file_path)
+    if jpeg_data is None:
+        return None, None
+    try:
+        return open_jpeg(jpeg_data, target_size), jpeg_data
+    except OSError:
+        return None, None
+
+def extract_preview(raw, target_size=None):
+    """Get the embedded preview of an open RAW file, or a quick low-res render
+
+    Returns the preview image together with the embedded JPEG bytes it was
+    decoded from, or None for the data when a render had to be made. With a
+    target_size, JPEG previews are decoded at the smallest scale that still
+    covers it.
+    """
+    import rawpy
+    try:
+        # Try to extract the thumbnail
+        with span('extract_thumb'):
+            thumb = raw.extract_thumb()
+        if thumb.format == rawpy.ThumbFormat.JPEG:
+            preview_img = open_jpeg(thumb.data, target_size)
+            return preview_img, thumb.data
+    except (AttributeError, RuntimeError):
+        pass
+    # If the thumbnail isn't a usable JPEG, create a quick low-res render
+    with span('postprocess_half'):
+        rgb = raw.postprocess(use_camera_wb=True, half_size=True, no_auto_bright=True)
+    with span('fromarray'):
+        return Image.fromarray(rgb), None
+
+def read_raw_buffer(file_path):
+    """Read a whole RAW file into memory so every decode stage shares a single read"""
+    with span('read_file'), open(file_path, 'rb') as f:
+        return f.read()
+
+def open_raw(source):
+    """Open a RAW image from a path or from file contents already in memory"""
+    import rawpy
+    with span('rawpy.imread'):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            # rawpy hands file objects to LibRaw's open_buffer
+            return rawpy.imread(io.BytesIO(source))
+        return rawpy.imread(source)
+
+def load_preview_image(file_path, disk_cache=None, target_size=None, metadata_index=None):
+    """Load the embedded preview of a RAW file, going through the disk cache if given
+
+    With a metaindex.MetadataIndex the JPEG is read straight from the offset
+    stored for the file.
+    """
+    if disk_cache is not None:
+        preview_img = disk_cache.get(file_path, target_size)
+        if preview_img is not None:
+            return preview_img
+
+    location = metadata_index.preview_location(file_path) if metadata_index is not None else None
+    preview_img, jpeg_data = read_embedded_preview(file_path, target_size, location)
+    if preview_img is None:
+        with open_raw(file_path) as raw:
+            preview_img, jpeg_data = extract_preview(raw, target_size)
+
+    if disk_cache is not None:
+        disk_cache.put(file_path, preview_img, jpeg_data)
+    return preview_img
+
+# Full decode levels from cheapest to best; 'preview' means the embedded preview is shown as is
+DECODE_LEVELS = ('preview', 'half', 'fast', 'full')
+
+# LibRaw demosaic per level; half size decodes skip demosaicing altogether
+DEMOSAIC_ALGORITHMS = {'half': 'LINEAR', 'fast': 'AHD', 'full': 'DCB'}
+
+def decode_level_of(img):
+    """Return the level a full decode was made at; images from elsewhere count as full"""
+    return img.info.get('decode_level', 'full')
+
+def requested_level_of(img):
+    """Return the level a full decode was asked for, which the memory budget may have lowered, or None"""
+    return img.info.get('requested_level')
+
+def is_better_level(level, than):
+    """Check whether one decode level is better than another (None ranks lowest)"""
+    return than is None or DECODE_LEVELS.index(level) > DECODE_LEVELS.index(than)
+
+def satisfies_level(img, level):
+    """Check whether a full decode can stand in for a new one at a level
+
+    That is when it is at least as good, or when it was already asked for at
+    that level and the memory budget made it a half size decode, as another
+    try would be too.
+    """
+    return not is_better_level(level, decode_level_of(img)) or requested_level_of(img) == level
+
+def preview_covers_view(preview_size, view_size):
+    """Check whether a preview fills view_size when fitted to it, i.e. needs no upscaling"""
+    return min(view_size[0] / preview_size[0], view_size[1] / preview_size[1]) <= 1.0
+
+def raw_size(raw):
+    """Return the (width, height) of an open RAW file's full decode"""
+    sizes = raw.sizes
+    if sizes.flip in (5, 6):
+        return sizes.height, sizes.width
+    return sizes.width, sizes.height
+
+def choose_decode_level(full_size, view_size, zoom=None):
+    """Pick the cheapest full decode that looks the same as a DCB decode in the current view
+
+    Zoomed views inspect pixels and always get the full DCB decode. A view
+    fitted to the window shows the image at view_size, so a half size decode
+    is enough when it still covers that, and otherwise a faster demosaic is,
+    as the downscale hides the difference.
+    """
+    if zoom is not None or not view_size:
+        return 'full'
+    if preview_covers_view((full_size[0] // 2, full_size[1] // 2), view_size):
+        return 'half'
+    if preview_covers_view(full_size, view_size):
+        return 'fast'
+    return 'full'
+
+def estimate_decode_bytes(raw, output_bps=16, half_size=False):
+    """Estimate the peak memory of a full decode of an open RAW file"""
+    sizes = raw.sizes
+    pixels = sizes.width * sizes.height
+    if half_size:
+        pixels //= 4
+    # LibRaw keeps the raw mosaic plus a 4 x 16-bit working image, then the
+    # postprocessed array and the PIL copy of it exist side by side
+    raw_data = sizes.raw_width * sizes.raw_height * 2
+    working = pixels * 4 * 2
+    output = pixels * 3 * output_bps // 8
+    pil_image = pixels * 4
+    return raw_data + working + output + pil_image
+
+def plan_full_decode(raw, memory_budget_mb=None):
+    """Pick the (output_bps, half_size) settings for a full decode
+
+    Without a budget the decode runs at full quality with 16-bit output. With
+    one, the first setting whose estimated peak fits is used: nothing after
+    the decode needs 16 bits, so 8-bit output comes first, and a half-size
+    decode is the last resort.
+    """
+    if memory_budget_mb is None:
+        return 16, False
+    budget = memory_budget_mb * 1024 * 1024
+    for output_bps, half_size in ((8, False), (8, True)):
+        if estimate_decode_bytes(raw, output_bps, half_size) <= budget:
+            break
+    return output_bps, half_size
+
+def postprocess_full(raw, memory_budget_mb=None, level='full'):
+    """Demosaic an open RAW file into an 8-bit PIL image at one of the DECODE_LEVELS
+
+    The level that actually ran is recorded in the image's info, see
+    decode_level_of, along with the one asked for (requested_level_of).
+    """
+    import numpy as np
+    import rawpy
+    output_bps, half_size = plan_full_decode(raw, memory_budget_mb)
+    requested_level = level
+    if half_size:
+        # Only a half size decode fits the memory budget, which is the 'half' level whatever was asked
+        level = 'half'
+    if level != 'full':
+        # Reduced levels are only ever shown downscaled, 8 bits are plenty
+        output_bps = 8
+        half_size = level == 'half'
+    with span('postprocess'):
+        rgb = raw.postprocess(
+            use_camera_wb=True,
+            demosaic_algorithm=getattr(rawpy.DemosaicAlgorithm, DEMOSAIC_ALGORITHMS[level]),
+            no_auto_bright=True,
+            output_bps=output_bps,
+            half_size=half_size
+        )
+
+    if rgb.dtype == np.uint8:
+        with span('fromarray'):
+            img = Image.fromarray(rgb)
+    else:
+        # Convert to 8-bit for display: PIL's 16-bit unpacker keeps the high byte
+        # of each sample, the same as dividing by 256, without numpy temporaries
+        with span('convert_8bit'):
+            height, width = rgb.shape[:2]
+            img = Image.frombuffer('RGB', (width, height), np.ascontiguousarray(rgb), 'raw', 'RGB;16N', 0, 1)
+        del rgb
+    img.info['decode_level'] = level
+    img.info['requested_level'] = requested_level
+    return img
+
+def decode_full_image(source, memory_budget_mb=None, level='full'):
+    """Load and process the full RAW image from a path or in-memory file contents"""
+    with open_raw(source) as raw:
+        return postprocess_full(raw, memory_budget_mb, level)
+
+class DecodeCancelled(Exception):
+    """Raised inside a decode pipeline once its generation is no longer current"""
+
+class Generation:
+    """Monotonic counter that tells the current decode job from stale ones
+
+    Every open advances the counter and hands the new value to its pipeline
+    as a token. Work carrying an older token is dropped.
+    """
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def advance(self):
+        """Start a new generation and return its token"""
+        with self._lock:
+            self._value += 1
+            return self._value
+
+    def is_current(self, token):
+        """Check whether a token still belongs to the latest generation"""
+        return token == self._value
+
+    def check(self, token):
+        """Raise DecodeCancelled if the token is stale"""
+        if token != self._value:
+            raise DecodeCancelled()
+
+def store_preview(file_path, key, preview_img, jpeg_data, image_cache=None, disk_cache=None):
+    """Keep a freshly decoded preview in the memory and disk caches"""
+    if image_cache is not None:
+        image_cache.put(key, 'preview', preview_img)
+    if disk_cache is not None:
+        disk_cache.put(file_path, preview_img, jpeg_data)
+
+def run_decode_pipeline(file_path, token, generation, on_preview, on_full,
+                        preview_img=None, image_cache=None, disk_cache=None, engine=None, target_size=None,
+                        memory_budget_mb=None, decode_level='full', metadata_index=None, on_linear=None):
+    """Decode a RAW file for display: embedded preview first, then the full image
+
+    The preview comes from the disk cache or the embedded JPEG reader, which
+    only touches the parts of the file it needs, so it is shown before
+    rawpy is even imported. The file is then read into memory once for the
+    full decode, which also covers the preview when there is no usable JPEG.
+    The generation token is checked before each expensive step, and a stale
+    pipeline stops with DecodeCancelled. Finished images are stored in the
+    given caches even when stale, since the user may come back to the file.
+    The full decode runs on the given engine (see decode_engine), or in the
+    calling thread when there is none. target_size is the display size the
+    preview is decoded for, and memory_budget_mb caps the in-thread decode
+    (engines carry their own budget).
+
+    decode_level is one of DECODE_LEVELS, or 'auto' to pick it for a view
+    fitted to target_size: when the preview already covers the view the file
+    is not even read, and otherwise choose_decode_level decides. Returns the
+    level the pipeline settled on; on_full is not called for 'preview'.
+    A metadata_index lets the embedded JPEG be read from its stored offset.
+
+    on_linear, if given, is called after on_full with an adjust.LinearProxy
+    of the file at target_size for the look adjustments, made from the file
+    while it is still open. It is skipped unless a half-size pass covers
+    target_size and fits the memory budget, so it stays cheap next to the
+    full decode.
+    """
+    key = file_key(file_path)
+
+    if preview_img is None and disk_cache is not None:
+        with span('disk_cache_read'):
+            preview_img = disk_cache.get(file_path, target_size)
+        if preview_img is not None:
+            on_preview(preview_img)
+            if image_cache is not None:
+                image_cache.put(key, 'preview', preview_img)
+
+    if preview_img is None:
+        generation.check(token)
+        location = metadata_index.preview_location(file_path) if metadata_index is not None else None
+        preview_img, jpeg_data = read_embedded_preview(file_path, target_size, location)
+        if preview_img is not None:
+            store_preview(file_path, key, preview_img, jpeg_data, image_cache, disk_cache)
+            on_preview(preview_img)
+
+    auto = decode_level == 'auto'
+    if auto and preview_img is not None and target_size and preview_covers_view(preview_img.size, target_size):
+        return 'preview'
+
+    generation.check(token)
+    data = read_raw_buffer(file_path)
+    generation.check(token)
+
+    with open_raw(data) as raw:
+        if engine is None or not engine.needs_file_data:
+            # rawpy has the contents now, don't hold a second reference through the decode
+            data = None
+        if preview_img is None:
+            preview_img, jpeg_data = extract_preview(raw, target_size)
+            store_preview(file_path, key, preview_img, jpeg_data, image_cache, disk_cache)
+            on_preview(preview_img)
+            if auto and target_size and preview_covers_view(preview_img.size, target_size):
+                return 'preview'
+        if auto:
+            decode_level = choose_decode_level(raw_size(raw), target_size)
+
+        # A background prefetch may have finished a good enough full decode in the meantime
+        cached_img = image_cache.get(key, 'full') if image_cache is not None else None
+        if cached_img is not None and satisfies_level(cached_img, decode_level):
+            full_img = cached_img
+        else:
+            # Last chance to bail out before the expensive demosaic
+            generation.check(token)
+            if engine is not None:
+                full_img = engine.decode(data, raw=raw, level=decode_level)
+            else:
+                full_img = postprocess_full(raw, memory_budget_mb, decode_level)
+            data = None
+            if image_cache is not None:
+                image_cache.put(key, 'full', full_img)
+
+        on_full(full_img)
+        if on_linear is not None and target_size and generation.is_current(token):
+            from adjust import linear_proxy_from_raw, plan_linear_decode
+            budget = memory_budget_mb if engine is None else engine.memory_budget_mb
+            if plan_linear_decode(raw, target_size, budget):
+                on_linear(linear_proxy_from_raw(raw, True, target_size))
+    return decode_level_of(full_img)
@@ -0,0 +1,204 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+from PIL import Image
+from decode import open_raw, postprocess_full, decode_full_image, read_raw_buffer
+from profiling import span
+from defaults import ENGINE_NAMES
+
+def _create_shared_memory(size):
+    """Create a shared memory block; whoever receives it is responsible for unlinking it
+
+    Spawned workers share the parent's resource tracker, so a block created
+    on one side and unlinked on the other is still accounted for exactly once.
+    """
+    return shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+def _decode_to_shared_memory(source, input_size, memory_budget_mb=None, level='full'):
+    """Worker entry point: demosaic a RAW file and leave the RGB array in shared memory
+
+    source is either a file path or the name of a shared memory block holding
+    input_size bytes of file contents. Returns (name, shape, dtype, info) of
+    the output block and the image's info, which holds its decode level; the
+    caller unlinks the block.
+    """
+    if input_size is not None:
+        shm_in = shared_memory.SharedMemory(name=source)
+        try:
+            source = bytes(shm_in.buf[:input_size])
+        finally:
+            shm_in.close()
+
+    import numpy as np
+    with open_raw(source) as raw:
+        img = postprocess_full(raw, memory_budget_mb, level)
+    rgb = np.asarray(img)
+    info = img.info
+    del img
+
+    shm_out = _create_shared_memory(rgb.nbytes)
+    try:
+        np.ndarray(rgb.shape, dtype=rgb.dtype, buffer=shm_out.buf)[...] = rgb
+        return shm_out.name, rgb.shape, rgb.dtype.str, info
+    finally:
+        shm_out.close()
+
+def _warm_up():
+    """No-op task used to start worker processes ahead of the first decode"""
+    return os.getpid()
+
+class ThreadDecodeEngine:
+    """Full decodes run in the calling thread, the way the viewer always has"""
+
+    name = 'thread'
+    needs_file_data = False     # Decodes from the pipeline's open rawpy object
+
+    def __init__(self, workers=None, memory_budget_mb=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_budget_mb = memory_budget_mb
+
+    def decode(self, source, raw=None, level='full'):
+        """Decode a path or in-memory RAW file into an 8-bit PIL image at a decode.DECODE_LEVELS level"""
+        if raw is not None:
+            return postprocess_full(raw, self.memory_budget_mb, level)
+        return decode_full_image(source, self.memory_budget_mb, level)
+
+    def decode_many(self, paths):
+        """Decode several files in parallel, yielding (path, image) in input order"""
+        # LibRaw releases the GIL while demosaicing, so threads do overlap
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            images = executor.map(lambda path: decode_full_image(path, self.memory_budget_mb), paths)
+            yield from zip(paths, images)
+
+    def warm_up(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+class ProcessDecodeEngine:
+    """Full decodes run in a pool of worker processes
+
+    The postprocess, the 16 to 8-bit conversion and the array handling all
+    happen in the worker, so they never hold the GIL of the UI process. The
+    RGB result comes back through multiprocessing.shared_memory instead of
+    being pickled, and in-memory file contents are sent the same way.
+    """
+
+    name = 'process'
+    needs_file_data = True      # Ships the file contents to a worker process
+
+    def __init__(self, workers=None, memory_budget_mb=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_budget_mb = memory_budget_mb
+        # Never fork a process that is running Tk and decode threads
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+
+    def decode(self, source, raw=None, level='full'):
+        """Decode a path or in-memory RAW file into an 8-bit PIL image at a decode.DECODE_LEVELS level"""
+        # The stages inside the worker aren't visible here, time the round trip
+        with span('process_decode'):
+            return self._collect(self._submit(source, level))
+
+    def decode_many(self, paths):
+        """Decode several files in parallel across cores, yielding (path, image) in input order"""
+        futures = [(path, self._submit(path)) for path in paths]
+        for path, future in futures:
+            yield path, self._collect(future)
+
+    def warm_up(self):
+        """Start the worker processes so the first decode doesn't pay for interpreter startup"""
+        for _ in range(self.workers):
+            self._executor.submit(_warm_up)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, source, level='full'):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            shm_in = _create_shared_memory(len(source))
+            shm_in.buf[:len(source)] = source
+            future = self._executor.submit(_decode_to_shared_memory, shm_in.name, len(source),
+                                           self.memory_budget_mb, level)
+            future.add_done_callback(lambda _: self._release(shm_in))
+            return future
+        return self._executor.submit(_decode_to_shared_memory, source, None, self.memory_budget_mb, level)
+
+    def _collect(self, future):
+        import numpy as np
+        name, shape, dtype, info = future.result()
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            rgb = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            # PIL copies the pixels into its own storage
+            img = Image.fromarray(rgb)
+            del rgb
+            img.info.update(info)
+            return img
+        finally:
+            self._release(shm)
+
+    @staticmethod
+    def _release(shm):
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+def create_engine(name, workers=None, memory_budget_mb=None):
+    """Build a decode engine by its CLI name"""
+    if name == 'process':
+        return ProcessDecodeEngine(workers, memory_budget_mb)
+    return ThreadDecodeEngine(workers, memory_budget_mb)
+
+def measure_engine(engine, paths):
+    """Measure per-file latency and multi-file throughput of an engine"""
+    latencies = []
+    for path in paths:
+        data = read_raw_buffer(path)
+        start = time.perf_counter()
+        engine.decode(data)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in engine.decode_many(paths):
+        pass
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'engine': engine.name,
+        'workers': engine.workers,
+        'files': len(paths),
+        'latency_median_s': latencies[len(latencies) // 2],
+        'latency_max_s': latencies[-1],
+        'throughput_files_per_s': len(paths) / elapsed if elapsed else 0.0,
+    }
+
+def main(argv=None):
+    """Compare the decode engines on a set of RAW files"""
+    parser = argparse.ArgumentParser(description='Compare fastraw full-decode engines')
+    parser.add_argument('files', nargs='+', help='RAW files to decode')
+    parser.add_argument('--engine', choices=ENGINE_NAMES, action='append',
+                        help='Engine to measure, may be repeated (default: all)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker count (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    for name in args.engine or ENGINE_NAMES:
+        engine = create_engine(name, args.workers)
+        try:
+            engine.warm_up()
+            # Decode once untimed so caches and worker imports are warm
+            engine.decode(args.files[0])
+            result = measure_engine(engine, args.files)
+        finally:
+            engine.shutdown()
+        print(f"{result['engine']:>8}: median {result['latency_median_s'] * 1000:.0f} ms, "
+              f"max {result['latency_max_s'] * 1000:.0f} ms, "
+              f"{result['throughput_files_per_s']:.2f} files/s with {result['workers']} workers")
+
+if __name__ == '__main__':
+    main()
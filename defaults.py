@@ -0,0 +1,10 @@
+"""Defaults the command line shows before the window is up, so they import nothing"""
+
+# Names accepted by --decode-engine
+ENGINE_NAMES = ('thread', 'process')
+
+# Default length of the preview to full image fade
+DEFAULT_FADE_MS = 500
+
+# How long a watched file's size must stay the same before it counts as written, when nothing reports it closed
+DEFAULT_SETTLE_SECONDS = 1.0
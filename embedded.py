@@ -0,0 +1,477 @@
+import mmap
+import struct
+import time
+
+# Byte sizes of the TIFF field types
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4, 16: 8, 17: 8, 18: 8}
+
+# Header magics of TIFF based RAW formats: plain TIFF (ARW, NEF, CR2, DNG, PEF),
+# Olympus ORF and Panasonic RW2
+TIFF_MAGICS = (b'II*\x00', b'MM\x00*', b'IIRO', b'IIRS', b'MMOR', b'IIU\x00')
+
+RAF_MAGIC = b'FUJIFILMCCD-RAW '
+
+# TIFF tags that lead to an embedded JPEG or to further IFDs
+TAG_NEW_SUBFILE_TYPE = 254
+TAG_IMAGE_WIDTH = 256
+TAG_IMAGE_LENGTH = 257
+TAG_COMPRESSION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_SUB_IFDS = 330
+TAG_JPEG_OFFSET = 513
+TAG_JPEG_LENGTH = 514
+TAG_EXIF_IFD = 34665
+TAG_MAKER_NOTE = 37500
+TAG_PANASONIC_JPEG = 46
+
+# EXIF tags read by read_metadata, by the name they are returned under
+METADATA_TAGS = {
+    271: 'make',
+    272: 'model',
+    274: 'orientation',
+    306: 'datetime',
+    18246: 'rating',
+    33434: 'exposure_time',
+    33437: 'fnumber',
+    34855: 'iso',
+    36867: 'datetime_original',
+    37386: 'focal_length',
+    37521: 'subsec_original',
+    40962: 'pixel_width',
+    40963: 'pixel_height',
+    42036: 'lens',
+}
+
+# CR3 uuid boxes holding the THMB and PRVW previews, with the bytes to skip before their children
+CR3_CANON_UUID = bytes.fromhex('85c0b687820f11e08111f4ce462b6a48')
+CR3_UUIDS = {
+    CR3_CANON_UUID: 0,
+    bytes.fromhex('eaf42b5e1c984b88b9fbb7dc406e4d16'): 8,
+}
+
+# CR3 boxes inside the Canon uuid box holding IFD0 and the EXIF IFD as small TIFF files
+CR3_METADATA_BOXES = (b'CMT1', b'CMT2')
+CR3_CONTAINERS = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+# JPEG start-of-frame markers; the lossless ones hold RAW data, not previews
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+LOSSLESS_SOF_MARKERS = frozenset((0xC3, 0xC7, 0xCB, 0xCF))
+
+# Bounds that keep a corrupt file from sending the parser in circles
+MAX_IFDS = 64
+MAX_IFD_ENTRIES = 1000
+MAX_BOX_DEPTH = 8
+
+def jpeg_dimensions(buf, offset, length):
+    """Return (width, height) of a displayable JPEG stored at offset, or None
+
+    Only the markers up to the start of frame are parsed. Lossless JPEGs,
+    which is how several formats store the RAW data itself, give None.
+    """
+    end = min(offset + length, len(buf))
+    if offset < 0 or end - offset < 4 or buf[offset:offset + 2] != b'\xff\xd8':
+        return None
+    pos = offset + 2
+    while pos + 4 <= end:
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            pos += 2
+            continue
+        if marker == 0xDA or marker == 0xD9:
+            return None
+        if marker in SOF_MARKERS:
+            if marker in LOSSLESS_SOF_MARKERS or pos + 9 > end:
+                return None
+            height, width = struct.unpack_from('>HH', buf, pos + 5)
+            return (width, height) if width and height else None
+        pos += 2 + struct.unpack_from('>H', buf, pos + 2)[0]
+    return None
+
+class _TiffReader:
+    """Walk the IFDs of a TIFF structure collecting (offset, length) of JPEG candidates
+
+    The METADATA_TAGS met on the way are kept in tags, first value seen wins,
+    along with raw_width and raw_height of the largest full resolution image.
+    """
+
+    def __init__(self, buf, base, order):
+        self.buf = buf
+        self.base = base                # File offset that IFD offsets are relative to
+        self.order = order              # '<' or '>'
+        self.visited = set()
+        self.candidates = []
+        self.tags = {}
+
+    def walk(self, ifd_offset):
+        """Follow an IFD chain, its SubIFDs, the EXIF IFD and known maker notes"""
+        while ifd_offset and len(self.visited) < MAX_IFDS:
+            ifd_offset = self.read_ifd(ifd_offset)
+
+    def read_entries(self, ifd_offset):
+        """Parse an IFD into {tag: (type, count, field position)} and the position after it
+
+        Returns (None, None) for IFDs already seen or out of bounds.
+        """
+        position = self.base + ifd_offset
+        if ifd_offset in self.visited or position + 2 > len(self.buf):
+            return None, None
+        self.visited.add(ifd_offset)
+        count = struct.unpack_from(self.order + 'H', self.buf, position)[0]
+        end = position + 2 + count * 12
+        if count > MAX_IFD_ENTRIES or end + 4 > len(self.buf):
+            return None, None
+        entries = {}
+        for field in range(position + 2, end, 12):
+            tag, type_, value_count = struct.unpack_from(self.order + 'HHI', self.buf, field)
+            entries[tag] = (type_, value_count, field + 8)
+        return entries, end
+
+    def read_ifd(self, ifd_offset):
+        """Read one IFD and return the offset of the next one in the chain"""
+        entries, end = self.read_entries(ifd_offset)
+        if entries is None:
+            return 0
+        self.collect(entries)
+        return struct.unpack_from(self.order + 'I', self.buf, end)[0]
+
+    def collect(self, entries):
+        """Add the JPEG candidates of an IFD and descend into the IFDs it points at"""
+        self.record_tags(entries)
+        if self.values(entries, TAG_NEW_SUBFILE_TYPE)[:1] == [0]:
+            self.record_size(entries)
+        jpeg_offset = self.values(entries, TAG_JPEG_OFFSET)
+        jpeg_length = self.values(entries, TAG_JPEG_LENGTH)
+        if jpeg_offset and jpeg_length:
+            self.candidates.append((self.base + jpeg_offset[0], jpeg_length[0]))
+
+        # Single-strip JPEG images, e.g. the full size preview in IFD0 of a CR2
+        strips = self.values(entries, TAG_STRIP_OFFSETS)
+        strip_lengths = self.values(entries, TAG_STRIP_BYTE_COUNTS)
+        if self.values(entries, TAG_COMPRESSION)[:1] in ([6], [7]) and len(strips) == 1 and strip_lengths:
+            self.candidates.append((self.base + strips[0], strip_lengths[0]))
+
+        # Panasonic keeps its preview as a whole JPEG file inside a tag
+        if TAG_PANASONIC_JPEG in entries:
+            type_, value_count, _ = entries[TAG_PANASONIC_JPEG]
+            if type_ == 7 and value_count > 4:
+                self.candidates.append((self.value_position(entries[TAG_PANASONIC_JPEG]), value_count))
+
+        for sub_ifd in self.values(entries, TAG_SUB_IFDS) + self.values(entries, TAG_EXIF_IFD):
+            self.walk(sub_ifd)
+
+        if TAG_MAKER_NOTE in entries:
+            self.read_maker_note(self.value_position(entries[TAG_MAKER_NOTE]))
+
+    def value_position(self, entry):
+        """File position of an entry's value, inline or at its offset"""
+        type_, value_count, field = entry
+        if TIFF_TYPE_SIZES.get(type_, 1) * value_count <= 4:
+            return field
+        return self.base + struct.unpack_from(self.order + 'I', self.buf, field)[0]
+
+    def values(self, entries, tag):
+        """Integer values of a SHORT, LONG or IFD entry, or an empty list"""
+        entry = entries.get(tag)
+        if entry is None:
+            return []
+        type_, value_count, _ = entry
+        code = {3: 'H', 4: 'I', 13: 'I'}.get(type_)
+        if code is None or not 0 < value_count <= 256:
+            return []
+        position = self.value_position(entry)
+        if position + value_count * TIFF_TYPE_SIZES[type_] > len(self.buf):
+            return []
+        return list(struct.unpack_from(f'{self.order}{value_count}{code}', self.buf, position))
+
+    def record_tags(self, entries):
+        """Keep the value of each METADATA_TAGS entry of an IFD not seen before"""
+        for tag, name in METADATA_TAGS.items():
+            if tag in entries and name not in self.tags:
+                value = self.tag_value(entries[tag])
+                if value is not None:
+                    self.tags[name] = value
+
+    def record_size(self, entries):
+        """Keep the dimensions of a full resolution image if it is the largest one so far"""
+        size = self.values(entries, TAG_IMAGE_WIDTH)[:1] + self.values(entries, TAG_IMAGE_LENGTH)[:1]
+        if len(size) == 2 and size[0] * size[1] > self.tags.get('raw_width', 0) * self.tags.get('raw_height', 0):
+            self.tags['raw_width'], self.tags['raw_height'] = size
+
+    def tag_value(self, entry):
+        """Decode an ASCII entry, or the first value of a SHORT, LONG or RATIONAL one; None otherwise"""
+        type_, value_count, _ = entry
+        position = self.value_position(entry)
+        if not value_count or position + TIFF_TYPE_SIZES.get(type_, 1) * value_count > len(self.buf):
+            return None
+        if type_ == 2:
+            text = bytes(self.buf[position:position + value_count]).split(b'\x00')[0]
+            return text.decode('ascii', 'replace').strip() or None
+        if type_ in (3, 4):
+            return struct.unpack_from(self.order + ('H' if type_ == 3 else 'I'), self.buf, position)[0]
+        if type_ in (5, 10):
+            numerator, denominator = struct.unpack_from(self.order + ('II' if type_ == 5 else 'ii'), self.buf, position)
+            return numerator / denominator if denominator else None
+        return None
+
+    def read_maker_note(self, position):
+        """Follow the preview tags of the Olympus and Pentax maker notes"""
+        header = bytes(self.buf[position:position + 12])
+        if header.startswith(b'OLYMPUS\x00'):
+            # Offsets are relative to the maker note; CameraSettings (0x2020)
+            # holds PreviewImageStart (0x101) and PreviewImageLength (0x102)
+            note = _TiffReader(self.buf, position, '<' if header[8:10] == b'II' else '>')
+            note.read_preview_ifd(12, 0x101, 0x102, sub_ifd_tag=0x2020)
+            self.candidates.extend(note.candidates)
+        elif header.startswith(b'AOC\x00'):
+            # Offsets are relative to the TIFF header; PreviewImageLength
+            # (0x0003) and PreviewImageStart (0x0004) sit in the first IFD
+            order = {b'II': '<', b'MM': '>'}.get(header[4:6], self.order)
+            note = _TiffReader(self.buf, self.base, order)
+            note.read_preview_ifd(position + 6 - self.base, 0x0004, 0x0003)
+            self.candidates.extend(note.candidates)
+
+    def read_preview_ifd(self, ifd_offset, start_tag, length_tag, sub_ifd_tag=None):
+        """Read a maker note IFD, and optionally one sub-IFD of it, for the preview start and length tags"""
+        entries, _ = self.read_entries(ifd_offset)
+        if entries is None:
+            return
+        start = self.values(entries, start_tag)
+        length = self.values(entries, length_tag)
+        if start and length:
+            self.candidates.append((self.base + start[0], length[0]))
+        entry = entries.get(sub_ifd_tag)
+        if entry is not None:
+            # Stored either as a pointer to the sub-IFD or inline as undefined bytes
+            if entry[0] in (4, 13):
+                pointers = self.values(entries, sub_ifd_tag)
+                if not pointers:
+                    # No count or an out of range pointer, as in a corrupt maker note
+                    return
+                sub_ifd = pointers[0]
+            else:
+                sub_ifd = self.value_position(entry) - self.base
+            self.read_preview_ifd(sub_ifd, start_tag, length_tag)
+
+def _tiff_reader(buf, base=0):
+    """Walk a whole TIFF structure starting at base and return the reader"""
+    order = '<' if bytes(buf[base:base + 2]) == b'II' else '>'
+    reader = _TiffReader(buf, base, order)
+    reader.walk(struct.unpack_from(order + 'I', buf, base + 4)[0])
+    return reader
+
+def _tiff_candidates(buf):
+    return _tiff_reader(buf).candidates
+
+def _raf_candidates(buf):
+    # The RAF header stores the offset and length of a whole JPEG file
+    if len(buf) < 92:
+        return []
+    return [struct.unpack_from('>II', buf, 84)]
+
+def _boxes(buf, start, end):
+    """Yield (type, payload_start, box_end) for the ISO base media boxes in a range"""
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', buf, position)
+        header = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size = struct.unpack_from('>Q', buf, position + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header or position + size > end:
+            return
+        yield box_type, position + header, position + size
+        position += size
+
+def _cr3_candidates(buf, start=0, end=None, depth=0):
+    """Collect the PRVW/THMB previews and the JPEG track samples of a CR3 file"""
+    end = len(buf) if end is None else end
+    candidates = []
+    if depth > MAX_BOX_DEPTH:
+        return candidates
+    for box_type, payload, box_end in _boxes(buf, start, end):
+        if box_type in CR3_CONTAINERS:
+            candidates += _cr3_candidates(buf, payload, box_end, depth + 1)
+        elif box_type == b'uuid' and bytes(buf[payload:payload + 16]) in CR3_UUIDS:
+            skip = CR3_UUIDS[bytes(buf[payload:payload + 16])]
+            candidates += _cr3_candidates(buf, payload + 16 + skip, box_end, depth + 1)
+        elif box_type in (b'PRVW', b'THMB'):
+            # A small fixed header (dimensions, JPEG size) precedes the JPEG
+            soi = bytes(buf[payload:min(payload + 32, box_end)]).find(b'\xff\xd8')
+            if soi >= 0:
+                candidates.append((payload + soi, box_end - payload - soi))
+        elif box_type == b'stsz':
+            sample_size, sample_count = struct.unpack_from('>II', buf, payload + 4)
+            if sample_size == 0 and sample_count:
+                sample_size = struct.unpack_from('>I', buf, payload + 12)[0]
+            candidates.append(('size', sample_size))
+        elif box_type in (b'stco', b'co64'):
+            if struct.unpack_from('>I', buf, payload + 4)[0]:
+                code = '>I' if box_type == b'stco' else '>Q'
+                candidates.append(('offset', struct.unpack_from(code, buf, payload + 8)[0]))
+    # Pair each track's first chunk offset with its sample size
+    tracks = dict(c for c in candidates if isinstance(c[0], str))
+    candidates = [c for c in candidates if not isinstance(c[0], str)]
+    if 'size' in tracks and 'offset' in tracks:
+        candidates.append((tracks['offset'], tracks['size']))
+    return candidates
+
+def _cr3_metadata(buf, start=0, end=None, depth=0):
+    """Collect the METADATA_TAGS of the CMT1/CMT2 boxes of a CR3 file"""
+    end = len(buf) if end is None else end
+    tags = {}
+    if depth > MAX_BOX_DEPTH:
+        return tags
+    for box_type, payload, box_end in _boxes(buf, start, end):
+        if box_type == b'moov':
+            tags.update(_cr3_metadata(buf, payload, box_end, depth + 1))
+        elif box_type == b'uuid' and bytes(buf[payload:payload + 16]) == CR3_CANON_UUID:
+            tags.update(_cr3_metadata(buf, payload + 16, box_end, depth + 1))
+        elif box_type in CR3_METADATA_BOXES:
+            # Each box is a TIFF file of its own with a single IFD
+            order = '<' if bytes(buf[payload:payload + 2]) == b'II' else '>'
+            reader = _TiffReader(buf, payload, order)
+            entries, _ = reader.read_entries(struct.unpack_from(order + 'I', buf, payload + 4)[0])
+            if entries is not None:
+                reader.record_tags(entries)
+                tags.update({name: value for name, value in reader.tags.items() if name not in tags})
+    return tags
+
+def _jpeg_metadata(buf, offset, length):
+    """Collect the METADATA_TAGS of the EXIF block of a JPEG, e.g. the preview of a RAF file"""
+    position = offset + 2
+    end = min(offset + length, len(buf))
+    while position + 4 <= end and buf[position] == 0xFF:
+        marker = buf[position + 1]
+        if marker in SOF_MARKERS or marker == 0xDA:
+            break
+        if marker == 0xE1 and bytes(buf[position + 4:position + 10]) == b'Exif\x00\x00':
+            return _tiff_reader(buf, position + 10).tags
+        position += 2 + struct.unpack_from('>H', buf, position + 2)[0]
+    return {}
+
+def find_metadata(buf):
+    """Read the METADATA_TAGS of RAW file contents as {name: value}
+
+    Tags come from the RAW file's own TIFF or CR3 structure, or from the
+    EXIF block of its embedded JPEG for formats without one (RAF).
+    """
+    head = bytes(buf[:16])
+    tags = {}
+    try:
+        if head[:4] in TIFF_MAGICS:
+            tags = _tiff_reader(buf).tags
+        elif head[4:8] == b'ftyp':
+            tags = _cr3_metadata(buf)
+        if not tags:
+            location = find_embedded_jpeg(buf)
+            if location is not None:
+                tags = _jpeg_metadata(buf, location[0], location[1])
+    except struct.error:
+        pass
+    return tags
+
+def read_metadata(file_path):
+    """Read the METADATA_TAGS of a RAW file without loading its image data, {} if unreadable"""
+    try:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return find_metadata(buf)
+    except (OSError, ValueError):
+        return {}
+
+def capture_timestamp(tags):
+    """Return the capture time of METADATA_TAGS as seconds since the epoch in local time, or None"""
+    stamp = tags.get('datetime_original') or tags.get('datetime')
+    if not isinstance(stamp, str):
+        return None
+    try:
+        seconds = time.mktime(time.strptime(stamp[:19], '%Y:%m:%d %H:%M:%S'))
+    except (ValueError, OverflowError):
+        return None
+    subsec = tags.get('subsec_original')
+    return seconds + (float('0.' + subsec) if isinstance(subsec, str) and subsec.isdigit() else 0.0)
+
+def read_file_info(file_path):
+    """Read the METADATA_TAGS and the embedded JPEG location of a RAW file in one pass
+
+    Returns (tags, location) where location is (offset, length, width,
+    height) as from find_embedded_jpeg, or None. Unreadable files give
+    ({}, None).
+    """
+    try:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return find_metadata(buf), find_embedded_jpeg(buf)
+    except (OSError, ValueError):
+        return {}, None
+
+def read_jpeg_at(file_path, offset, length):
+    """Read an embedded JPEG whose location is already known, e.g. from the metadata index
+
+    Returns the JPEG bytes, or None when the bytes there are not a JPEG.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+    except (OSError, ValueError):
+        return None
+    if len(data) != length or data[:2] != b'\xff\xd8':
+        return None
+    return data
+
+def find_embedded_jpeg(buf):
+    """Locate the largest displayable JPEG embedded in RAW file contents
+
+    buf is anything sliceable with bytes semantics, typically an mmap.
+    Returns (offset, length, width, height) or None when the format is not
+    recognised or holds no usable JPEG.
+    """
+    head = bytes(buf[:16])
+    try:
+        if head[:4] in TIFF_MAGICS:
+            candidates = _tiff_candidates(buf)
+        elif head == RAF_MAGIC:
+            candidates = _raf_candidates(buf)
+        elif head[4:8] == b'ftyp':
+            candidates = _cr3_candidates(buf)
+        else:
+            return None
+    except struct.error:
+        return None
+
+    best = None
+    for offset, length in candidates:
+        size = jpeg_dimensions(buf, offset, length)
+        if size is None or offset + length > len(buf):
+            continue
+        if best is None or size[0] * size[1] > best[2] * best[3]:
+            best = (offset, length, size[0], size[1])
+    return best
+
+def read_embedded_jpeg(file_path):
+    """Read the largest embedded JPEG of a RAW file without loading the rest of it
+
+    The file is memory mapped, so only the pages holding the IFDs or boxes
+    and the JPEG itself are read from disk. Returns the JPEG bytes together
+    with its (offset, length, width, height), or (None, None).
+    """
+    try:
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            location = find_embedded_jpeg(buf)
+            if location is None:
+                return None, None
+            offset, length = location[:2]
+            return buf[offset:offset + length], location
+    except (OSError, ValueError):
+        # Empty files cannot be mapped
+        return None, None
@@ -0,0 +1,184 @@
+import argparse
+import glob
+import json
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from PIL import Image
+from decode import is_raw_file, load_preview_image, decode_full_image
+from adjust import LookAdjustments, decode_linear
+
+# Output formats: file extension and PIL save format
+OUTPUT_FORMATS = {
+    'jpeg': ('.jpg', 'JPEG'),
+    'tiff': ('.tif', 'TIFF'),
+}
+
+def collect_sources(inputs, recursive=False):
+    """Expand directories, globs and files into (source, relative output stem) pairs
+
+    Files found under a directory input keep their path relative to it, so
+    same-named files from different subfolders don't collide.
+    """
+    sources = []
+    seen = set()
+
+    def add(path, relative):
+        path = os.path.abspath(path)
+        if path not in seen and os.path.isfile(path) and is_raw_file(path):
+            seen.add(path)
+            sources.append((path, os.path.splitext(relative)[0]))
+
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for dirpath, dirnames, filenames in os.walk(pattern):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    path = os.path.join(dirpath, name)
+                    add(path, os.path.relpath(path, pattern))
+                if not recursive:
+                    break
+        else:
+            matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+            for path in sorted(matches):
+                add(path, os.path.basename(path))
+    return sources
+
+def is_up_to_date(source, output):
+    """Check whether an output exists and is newer than its source"""
+    try:
+        return os.path.getmtime(output) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+def render_file(source, mode, long_edge, look=None):
+    """Produce the export image for one RAW file"""
+    target_size = (long_edge, long_edge) if long_edge else None
+    if look is not None and not look.is_neutral():
+        # Adjustments need the linear sensor data, whatever the mode
+        img = decode_linear(source, target_size).render(look)
+    elif mode == 'preview':
+        # Same fast path as the viewer: embedded JPEG, decoded at reduced scale
+        img = load_preview_image(source, target_size=target_size)
+    else:
+        img = decode_full_image(source)
+    if target_size and max(img.size) > long_edge:
+        img.thumbnail(target_size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return img.convert('RGB')
+
+def _create_temp_file(directory):
+    """Create a new temporary file in a directory, returning (fd, path)
+
+    Unlike tempfile.mkstemp, which makes the file private to its owner, the
+    file is created with mode 0666 and the kernel applies the umask at that
+    moment, so the output ends up with the usual permissions.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        temp_path = os.path.join(directory, f'.fastraw-{secrets.token_hex(8)}.tmp')
+        try:
+            return os.open(temp_path, flags, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+def export_file(source, output, mode, output_format, long_edge, quality, look=None):
+    """Worker entry point: render one file and write it atomically, returning the seconds taken"""
+    start = time.perf_counter()
+    img = render_file(source, mode, long_edge, look)
+
+    _, pil_format = OUTPUT_FORMATS[output_format]
+    save_options = {'quality': quality} if pil_format == 'JPEG' else {'compression': 'tiff_deflate'}
+    directory = os.path.dirname(output) or '.'
+    os.makedirs(directory, exist_ok=True)
+    # Write next to the target and rename, so an interrupted run never leaves
+    # a partial file that looks up to date
+    fd, temp_path = _create_temp_file(directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, pil_format, **save_options)
+        os.replace(temp_path, output)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return time.perf_counter() - start
+
+def emit(event, **fields):
+    """Write one JSON progress line to stdout"""
+    print(json.dumps({'event': event, **fields}), flush=True)
+
+def parse_arguments(argv):
+    """Parse command line arguments for the export subcommand"""
+    parser = argparse.ArgumentParser(prog='fastraw export',
+                                     description='Export previews or full renders of RAW files without a display')
+    parser.add_argument('inputs', nargs='+', help='RAW files, directories or glob patterns')
+    parser.add_argument('-o', '--output', default='.', help='Output directory (default: current directory)')
+    parser.add_argument('--mode', choices=('preview', 'full'), default='preview',
+                        help='Export the embedded preview or a full demosaiced render (default: preview)')
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='jpeg', help='Output format (default: jpeg)')
+    parser.add_argument('--long-edge', type=int, default=None, metavar='PX',
+                        help='Downscale so the longest side is at most PX pixels')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality (default: 90)')
+    parser.add_argument('--exposure', type=float, default=0.0, metavar='EV',
+                        help='Exposure adjustment in stops; any adjustment renders from the RAW data')
+    parser.add_argument('--temperature', type=int, default=0, help='White balance warmer (+) or cooler (-), -100 to 100')
+    parser.add_argument('--tint', type=int, default=0, help='White balance tint towards magenta (+) or green (-), -100 to 100')
+    parser.add_argument('--highlights', type=int, default=0, help='Highlight recovery, 0 to 100')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Descend into subdirectories')
+    parser.add_argument('--force', action='store_true', help='Re-export files whose output is already up to date')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run a headless batch export, streaming progress as JSON lines"""
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+    extension, _ = OUTPUT_FORMATS[args.format]
+    output_dir = os.path.abspath(args.output)
+
+    look = LookAdjustments(args.exposure, args.temperature, args.tint, args.highlights)
+    jobs = []
+    skipped = 0
+    sources = collect_sources(args.inputs, args.recursive)
+    emit('start', total=len(sources), workers=args.workers, mode=args.mode, format=args.format)
+    for source, stem in sources:
+        output = os.path.join(output_dir, stem + extension)
+        if not args.force and is_up_to_date(source, output):
+            skipped += 1
+            emit('file', source=source, output=output, status='skipped')
+        else:
+            jobs.append((source, output))
+
+    start = time.perf_counter()
+    written = errors = 0
+    # rawpy's OpenMP runtime can deadlock in forked workers
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=get_context('spawn')) as executor:
+        futures = {
+            executor.submit(export_file, source, output, args.mode, args.format, args.long_edge, args.quality, look):
+                (source, output)
+            for source, output in jobs
+        }
+        for future in as_completed(futures):
+            source, output = futures[future]
+            try:
+                seconds = future.result()
+            except Exception as e:
+                errors += 1
+                emit('file', source=source, output=output, status='error', error=str(e))
+            else:
+                written += 1
+                emit('file', source=source, output=output, status='written', seconds=round(seconds, 4),
+                     done=written + errors, remaining=len(jobs) - written - errors)
+
+    elapsed = time.perf_counter() - start
+    emit('done', written=written, skipped=skipped, errors=errors, seconds=round(elapsed, 3),
+         files_per_minute=round(written / elapsed * 60, 1) if elapsed else None)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
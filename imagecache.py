@@ -0,0 +1,277 @@
+import hashlib
+import io
+import math
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# Number of leading bytes hashed into a file's disk cache fingerprint
+FINGERPRINT_HEADER_BYTES = 4096
+
+def default_cache_dir():
+    """Return the per-user cache directory for fastraw"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(os.path.join('~', 'AppData', 'Local'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'fastraw')
+
+def image_nbytes(img):
+    """Estimate the memory held by a decoded PIL image"""
+    return img.width * img.height * len(img.getbands())
+
+class DecodedImageCache:
+    """Thread-safe LRU cache of decoded images, bounded by memory usage
+
+    Entries are keyed by (path, mtime, size) as returned by decode.file_key and
+    hold an embedded preview and/or a full decode of the same file.
+    """
+
+    def __init__(self, max_mb=1024):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()   # key -> {'preview': img, 'full': img}
+        self._pinned = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, kind):
+        """Return the cached 'preview' or 'full' image for a key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or kind not in entry:
+                return None
+            self._entries.move_to_end(key)
+            return entry[kind]
+
+    def contains(self, key, kind):
+        """Check for a cached image without touching the LRU order"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and kind in entry
+
+    def put(self, key, kind, img):
+        """Store an image and evict the least recently used entries over the cap"""
+        size = image_nbytes(img)
+        if size > self.max_bytes:
+            # Never let a single image flush the whole cache
+            return
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            if kind in entry:
+                self._bytes -= image_nbytes(entry[kind])
+            entry[kind] = img
+            self._bytes += size
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def pin(self, keys):
+        """Protect the given keys (e.g. the image on screen) from eviction"""
+        with self._lock:
+            self._pinned = set(keys)
+
+    def clear(self):
+        """Drop every cached image"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return the number of cached files and the memory they use"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+    def _evict(self):
+        for key in list(self._entries):
+            if self._bytes <= self.max_bytes:
+                break
+            if key in self._pinned:
+                continue
+            entry = self._entries.pop(key)
+            self._bytes -= sum(image_nbytes(img) for img in entry.values())
+
+class PreviewDiskCache:
+    """Persistent, size-bounded cache of display-ready preview JPEGs
+
+    Files are named after a content fingerprint (path, size, mtime and a hash
+    of the header bytes) so edited or replaced RAWs never hit a stale preview.
+    Writes are atomic and the least recently used previews are evicted once
+    the total size goes over the cap. Entry sizes are tracked in memory in LRU
+    order, loaded from one scan of the directory the first time they are
+    needed, so eviction never walks the directory again.
+    """
+
+    def __init__(self, directory=None, max_mb=512, max_edge=2560, quality=90):
+        self.directory = directory or os.path.join(default_cache_dir(), 'previews')
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_edge = max_edge
+        self.quality = quality
+        self._entries = None            # entry path -> size, least recently used first; loaded on first use
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def fingerprint(self, file_path):
+        """Build a key for a file that changes whenever its contents change"""
+        stat = os.stat(file_path)
+        digest = hashlib.sha1()
+        digest.update(f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            digest.update(f.read(FINGERPRINT_HEADER_BYTES))
+        return digest.hexdigest()
+
+    def _entry_path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint[:2], fingerprint + '.jpg')
+
+    def get(self, file_path, target_size=None):
+        """Return the cached preview of a file, or None
+
+        With a target_size the JPEG is decoded at a reduced scale close to it.
+        """
+        try:
+            entry_path = self._entry_path(self.fingerprint(file_path))
+            with open(entry_path, 'rb') as f:
+                data = f.read()
+            # Bump the modification time so the next session's scan sees this entry as recently used
+            os.utime(entry_path)
+        except OSError:
+            return None
+        with self._lock:
+            self._touch(entry_path, len(data))
+        try:
+            img = Image.open(io.BytesIO(data))
+            if target_size:
+                # Decode at a reduced scale that still fills the target
+                scale = min(target_size[0] / img.width, target_size[1] / img.height, 1.0)
+                img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            img.load()
+            return img
+        except OSError:
+            # Unreadable entry, drop it and fall back to the RAW file
+            with self._lock:
+                self._discard(entry_path)
+            return None
+
+    def put(self, file_path, img, jpeg_data=None):
+        """Store a preview, reusing the embedded JPEG bytes when they are small enough
+
+        img may have been decoded from jpeg_data at a reduced scale, so the
+        cap is checked against the JPEG's own size, and a JPEG over it is
+        stored downscaled from the JPEG rather than from img.
+        """
+        try:
+            fingerprint = self.fingerprint(file_path)
+        except OSError:
+            return
+        if jpeg_data is not None:
+            try:
+                # Only reads the headers
+                source = Image.open(io.BytesIO(jpeg_data))
+            except OSError:
+                return
+            if max(source.size) > self.max_edge:
+                scale = self.max_edge / max(source.size)
+                source.draft('RGB', (math.ceil(source.width * scale), math.ceil(source.height * scale)))
+                img, jpeg_data = source, None
+        if jpeg_data is None:
+            if max(img.size) > self.max_edge:
+                img = img.copy()
+                img.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            img.convert('RGB').save(buffer, 'JPEG', quality=self.quality)
+            jpeg_data = buffer.getvalue()
+        if len(jpeg_data) > self.max_bytes:
+            return
+
+        entry_path = self._entry_path(fingerprint)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            # Write to a temporary file in the same directory and rename it into
+            # place, so readers never see a partially written preview
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(jpeg_data)
+                os.replace(temp_path, entry_path)
+            except BaseException:
+                self._remove(temp_path)
+                raise
+        except OSError as e:
+            print(f"Error writing preview cache: {e}")
+            return
+
+        with self._lock:
+            self._touch(entry_path, len(jpeg_data))
+            self._evict()
+
+    def stats(self):
+        """Return the number of cached previews and their total size"""
+        with self._lock:
+            self._load()
+            return {
+                'directory': self.directory,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def clear(self):
+        """Delete every cached preview"""
+        with self._lock:
+            for entry_path, _, _ in self._scan():
+                self._remove(entry_path)
+            self._entries = OrderedDict()
+            self._bytes = 0
+
+    def _scan(self):
+        """List (path, size, mtime) for every entry in the cache directory"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith('.jpg'):
+                    continue
+                entry_path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    continue
+                entries.append((entry_path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _load(self):
+        """Fill the entry table from the directory, oldest first, unless already loaded"""
+        if self._entries is None:
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            self._entries = OrderedDict((entry_path, size) for entry_path, size, _ in entries)
+            self._bytes = sum(self._entries.values())
+
+    def _touch(self, entry_path, size):
+        """Record an entry as the most recently used one"""
+        self._load()
+        self._bytes += size - self._entries.pop(entry_path, 0)
+        self._entries[entry_path] = size
+
+    def _discard(self, entry_path):
+        """Delete an entry and forget it"""
+        self._remove(entry_path)
+        if self._entries is not None:
+            self._bytes -= self._entries.pop(entry_path, 0)
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is under its cap"""
+        while self._bytes > self.max_bytes and self._entries:
+            entry_path, size = self._entries.popitem(last=False)
+            # Already gone if another process evicted it; forget it either way
+            self._remove(entry_path)
+            self._bytes -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
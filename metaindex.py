@@ -0,0 +1,220 @@
+import os
+import re
+import sqlite3
+import threading
+from decode import is_raw_file
+from embedded import capture_timestamp, read_file_info
+from imagecache import default_cache_dir
+
+# Bumped whenever the table changes; an index of another version is rebuilt from scratch
+INDEX_VERSION = 1
+
+# Files indexed per scheduler job, few enough that a job never holds a worker for long
+INDEX_BATCH = 200
+
+# Columns filled from each file's metadata, after its path, directory, name, mtime and size
+COLUMNS = ('capture_time', 'make', 'model', 'lens', 'iso', 'exposure_time', 'fnumber', 'focal_length',
+           'orientation', 'rating', 'width', 'height',
+           'thumb_format', 'thumb_offset', 'thumb_length', 'thumb_width', 'thumb_height')
+
+# Navigation orders: name -> (column, descending); files missing the value go last
+SORT_ORDERS = {
+    'name': ('name COLLATE NOCASE', False),
+    'time': ('capture_time', False),
+    'iso': ('iso', False),
+    'shutter': ('exposure_time', False),
+    'aperture': ('fnumber', False),
+    'focal': ('focal_length', False),
+    'lens': ('lens COLLATE NOCASE', False),
+    'rating': ('rating', True),
+}
+
+# Filter fields: numbers compare with = != < <= > >=, text matches a substring with ':'
+NUMERIC_FIELDS = {'iso': 'iso', 'shutter': 'exposure_time', 'aperture': 'fnumber', 'f': 'fnumber',
+                  'focal': 'focal_length', 'rating': 'rating', 'orientation': 'orientation'}
+TEXT_FIELDS = {'make': 'make', 'model': 'model', 'lens': 'lens', 'name': 'name'}
+
+# EXIF orientations 5 to 8 turn the image by 90 degrees, swapping width and height
+_ROTATED = 'orientation IN (5, 6, 7, 8)'
+_TALL = 'coalesce(height, thumb_height) > coalesce(width, thumb_width)'
+_WIDE = 'coalesce(width, thumb_width) > coalesce(height, thumb_height)'
+SHAPES = {
+    'portrait': f'(CASE WHEN {_ROTATED} THEN {_WIDE} ELSE {_TALL} END)',
+    'landscape': f'(CASE WHEN {_ROTATED} THEN {_TALL} ELSE {_WIDE} END)',
+}
+
+_TERM = re.compile(r'^([a-z]+)(>=|<=|!=|=|>|<|:)(.+)$')
+
+def parse_number(text):
+    """Parse a filter value such as 1600, 2.8 or 1/250"""
+    numerator, _, denominator = text.partition('/')
+    value = float(numerator)
+    return value / float(denominator) if denominator else value
+
+def parse_filter(text):
+    """Turn a filter such as 'iso>=1600 lens:70-200 portrait' into an SQL condition and its parameters
+
+    Terms are separated by spaces and must all match. Raises ValueError for
+    terms it doesn't understand.
+    """
+    conditions = []
+    params = []
+    for term in text.lower().split():
+        if term in SHAPES:
+            conditions.append(SHAPES[term])
+            continue
+        match = _TERM.match(term)
+        if not match:
+            raise ValueError(f"Unknown filter term '{term}'")
+        field, operator, value = match.groups()
+        if operator == ':' and field in TEXT_FIELDS:
+            conditions.append(f"{TEXT_FIELDS[field]} LIKE ?")
+            params.append(f"%{value}%")
+        elif operator != ':' and field in NUMERIC_FIELDS:
+            try:
+                params.append(parse_number(value))
+            except (ValueError, ZeroDivisionError):
+                raise ValueError(f"Not a number in '{term}'")
+            conditions.append(f"{NUMERIC_FIELDS[field]} {operator} ?")
+        else:
+            raise ValueError(f"Unknown filter term '{term}'")
+    return ' AND '.join(conditions) or '1', params
+
+def read_record(file_path):
+    """Read the indexed columns of a file, without decoding any image data"""
+    tags, location = read_file_info(file_path)
+    record = {
+        'capture_time': capture_timestamp(tags),
+        'make': tags.get('make'),
+        'model': tags.get('model'),
+        'lens': tags.get('lens'),
+        'iso': tags.get('iso'),
+        'exposure_time': tags.get('exposure_time'),
+        'fnumber': tags.get('fnumber'),
+        'focal_length': tags.get('focal_length'),
+        'orientation': tags.get('orientation'),
+        'rating': tags.get('rating'),
+        'width': tags.get('raw_width') or tags.get('pixel_width'),
+        'height': tags.get('raw_height') or tags.get('pixel_height'),
+        'thumb_format': None,
+        'thumb_offset': None,
+        'thumb_length': None,
+        'thumb_width': None,
+        'thumb_height': None,
+    }
+    if location is not None:
+        record.update(zip(('thumb_offset', 'thumb_length', 'thumb_width', 'thumb_height'), location))
+        record['thumb_format'] = 'jpeg'
+    return record
+
+def _scan_folder(directory):
+    """Return {path: (mtime_ns, size)} of the RAW files of a directory"""
+    files = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if is_raw_file(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        pass
+    return files
+
+class MetadataIndex:
+    """SQLite index of the EXIF fields and embedded preview location of RAW files
+
+    Rows are keyed by path and only trusted while the file's mtime and size
+    still match, so a folder is revalidated with one directory scan and one
+    query. The index is filled in batches by index_files(), normally from
+    background jobs, and answers sorted and filtered listings of a folder
+    without opening any file. The connection is shared between threads
+    behind a lock.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(default_cache_dir(), 'metadata.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            if self._db.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS files')
+                self._db.execute(f'PRAGMA user_version={INDEX_VERSION}')
+            columns = ', '.join(COLUMNS)
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, directory TEXT NOT NULL, '
+                             f'name TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, {columns})')
+            self._db.execute('CREATE INDEX IF NOT EXISTS files_directory ON files (directory)')
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stale_files(self, directory):
+        """Return the RAW files of a directory that are new or changed since they were indexed
+
+        Rows of files that are gone are dropped on the way.
+        """
+        directory = os.path.abspath(directory)
+        files = _scan_folder(directory)
+        with self._lock:
+            rows = self._db.execute('SELECT path, mtime_ns, size FROM files WHERE directory = ?', (directory,))
+            indexed = {path: (mtime_ns, size) for path, mtime_ns, size in rows}
+            gone = [(path,) for path in indexed if path not in files]
+            if gone:
+                self._db.executemany('DELETE FROM files WHERE path = ?', gone)
+                self._db.commit()
+        stale = [path for path, stat in files.items() if indexed.get(path) != stat]
+        return sorted(stale, key=lambda p: os.path.basename(p).lower())
+
+    def index_files(self, paths):
+        """Read and store the metadata of some files; unreadable files are indexed without any"""
+        rows = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            record = read_record(path)
+            rows.append((path, os.path.dirname(path), os.path.basename(path), stat.st_mtime_ns, stat.st_size)
+                        + tuple(record[column] for column in COLUMNS))
+        placeholders = ', '.join('?' * (5 + len(COLUMNS)))
+        with self._lock:
+            self._db.executemany(f'INSERT OR REPLACE INTO files VALUES ({placeholders})', rows)
+            self._db.commit()
+        return len(rows)
+
+    def files(self, directory, sort='name', reverse=False, where=None):
+        """Return the indexed files of a directory in a SORT_ORDERS order, optionally filtered
+
+        where is a filter string for parse_filter().
+        """
+        column, descending = SORT_ORDERS[sort]
+        direction = 'ASC' if descending == reverse else 'DESC'
+        condition, params = parse_filter(where or '')
+        query = (f'SELECT path FROM files WHERE directory = ? AND {condition} '
+                 f'ORDER BY {column} IS NULL, {column} {direction}, name COLLATE NOCASE')
+        with self._lock:
+            return [row[0] for row in self._db.execute(query, [os.path.abspath(directory)] + params)]
+
+    def lookup(self, file_path):
+        """Return the indexed columns of a file as a dict, or None if it isn't indexed as it is now"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        with self._lock:
+            row = self._db.execute(f'SELECT {", ".join(COLUMNS)} FROM files '
+                                   'WHERE path = ? AND mtime_ns = ? AND size = ?',
+                                   (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def preview_location(self, file_path):
+        """Return the stored (offset, length, width, height) of a file's embedded JPEG, or None"""
+        record = self.lookup(file_path)
+        if record is None or record['thumb_format'] != 'jpeg':
+            return None
+        return (record['thumb_offset'], record['thumb_length'], record['thumb_width'], record['thumb_height'])
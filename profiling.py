@@ -0,0 +1,159 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+# Shared no-op context manager, so disabled spans cost one call and a with block
+_NULL_SPAN = contextlib.nullcontext()
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'token', 'start')
+
+    def __init__(self, profiler, name, token):
+        self.profiler = profiler
+        self.name = name
+        self.token = token
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start, time.perf_counter(), self.token)
+        return False
+
+class Profiler:
+    """Collect timing spans for each image open and report a per-stage breakdown
+
+    Spans are attributed to an open by its generation token: worker threads
+    bind their token with bind_token(), spans on the UI thread fall back to
+    the token of the image currently on screen and unbound background work
+    such as prefetching is ignored. When disabled, span() returns a shared
+    no-op context manager.
+
+    Finished opens are appended to a trace file, either as JSON lines with one
+    summary per open, or as Chrome trace events (chrome://tracing, Perfetto)
+    using the array format whose closing bracket is optional.
+    """
+
+    def __init__(self, enabled=False, trace_path=None, trace_format='jsonl'):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.trace_format = trace_format
+        self.current_token = None
+        self._opens = {}                # token -> {'file': path, 'start': t, 'spans': [...]}
+        self._summaries = {}            # token -> summary text of finished opens
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._epoch = time.perf_counter()
+
+    def begin_open(self, token, file_path):
+        """Start collecting spans for a new open"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.current_token = token
+            self._opens[token] = {'file': file_path, 'start': time.perf_counter(), 'spans': []}
+            # Forget opens that never finished, e.g. skipped past while decoding
+            for stale in [t for t in self._opens if t < token - 8]:
+                del self._opens[stale]
+
+    @contextlib.contextmanager
+    def bind_token(self, token):
+        """Attribute spans recorded by this thread to the given open"""
+        previous = getattr(self._local, 'token', None)
+        self._local.token = token
+        try:
+            yield
+        finally:
+            self._local.token = previous
+
+    def span(self, name, token=None):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, token)
+
+    def record(self, name, start, end, token=None):
+        """Record a span that has already been measured"""
+        if not self.enabled:
+            return
+        if token is None:
+            token = getattr(self._local, 'token', None)
+        if token is None and threading.current_thread() is threading.main_thread():
+            token = self.current_token
+        with self._lock:
+            entry = self._opens.get(token)
+            if entry is not None:
+                entry['spans'].append((name, start, end - start, threading.get_ident()))
+
+    def finish_open(self, token):
+        """Close an open, append it to the trace and return its breakdown text
+
+        Calling it again for the same token returns the same text.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if token in self._summaries:
+                return self._summaries[token]
+            entry = self._opens.pop(token, None)
+            if entry is None:
+                return None
+            total = time.perf_counter() - entry['start']
+            stages = {}
+            for name, _, duration, _ in entry['spans']:
+                stages[name] = stages.get(name, 0.0) + duration
+            summary = ' · '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in stages.items())
+            summary = f"{summary} · total {total * 1000:.0f}ms" if summary else f"total {total * 1000:.0f}ms"
+            self._summaries = {t: s for t, s in self._summaries.items() if t > token - 8}
+            self._summaries[token] = summary
+        self._write_trace(entry, stages, total)
+        return summary
+
+    def _write_trace(self, entry, stages, total):
+        if not self.trace_path:
+            return
+        try:
+            if self.trace_format == 'chrome':
+                lines = self._chrome_events(entry)
+                if not os.path.exists(self.trace_path) or os.path.getsize(self.trace_path) == 0:
+                    lines.insert(0, '[')
+            else:
+                lines = [json.dumps({
+                    'file': entry['file'],
+                    'start_s': entry['start'] - self._epoch,
+                    'total_ms': total * 1000,
+                    'stages_ms': {name: seconds * 1000 for name, seconds in stages.items()},
+                    'spans': [{'name': name, 'start_ms': (start - entry['start']) * 1000,
+                               'duration_ms': duration * 1000, 'thread': thread}
+                              for name, start, duration, thread in entry['spans']],
+                })]
+            with open(self.trace_path, 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+        except OSError as e:
+            print(f"Error writing profile trace: {e}")
+
+    def _chrome_events(self, entry):
+        events = []
+        pid = os.getpid()
+        for name, start, duration, thread in entry['spans']:
+            events.append(json.dumps({
+                'name': name, 'cat': 'fastraw', 'ph': 'X', 'pid': pid, 'tid': thread,
+                'ts': (start - self._epoch) * 1e6, 'dur': duration * 1e6,
+                'args': {'file': entry['file']},
+            }) + ',')
+        return events
+
+# The profiler used by the decode helpers; the viewer replaces it when --profile is on
+PROFILER = Profiler()
+
+def span(name, token=None):
+    """Time a stage with the active profiler"""
+    return PROFILER.span(name, token)
+
+def set_profiler(profiler):
+    """Make a profiler the active one for the decode helpers"""
+    global PROFILER
+    PROFILER = profiler
@@ -0,0 +1,184 @@
+import math
+import threading
+from collections import OrderedDict
+from PIL import Image
+from defaults import DEFAULT_FADE_MS
+
+def resize_to_fit(img, width, height, pyramid=None):
+    """Resize an image to fit within width x height while maintaining aspect ratio
+
+    With a pyramid of the image, the resample starts from its smallest level
+    that still covers the new size.
+    """
+    img_width, img_height = img.size
+
+    # Calculate the scaling factor
+    scale_factor = min(width / img_width, height / img_height)
+
+    # Calculate new size
+    new_size = (int(img_width * scale_factor), int(img_height * scale_factor))
+
+    if pyramid:
+        return pyramid.resize(new_size)
+    return img.resize(new_size, Image.Resampling.LANCZOS)
+
+class CrossfadeBlender:
+    """Crossfade between two images using precomputed fixed-point buffers
+
+    Both images are converted once into uint16 buffers holding the start
+    image in 8.8 fixed point and the start-to-end difference. A frame is then
+    one multiply and one add with an 8-bit weight; the arithmetic wraps
+    modulo 2**16 but the true result always fits, so its high byte is the
+    blended pixel, which PIL unpacks directly from the native-endian buffer
+    with the RGB;16N raw mode.
+    """
+
+    # Weights run from 0 to 1 << WEIGHT_BITS
+    WEIGHT_BITS = 8
+
+    def __init__(self, start_img, end_img):
+        if start_img.size != end_img.size:
+            start_img = start_img.resize(end_img.size, Image.Resampling.LANCZOS)
+        import numpy as np
+        self.size = end_img.size
+        start = np.asarray(start_img.convert('RGB'), dtype=np.uint16)
+        end = np.asarray(end_img.convert('RGB'), dtype=np.uint16)
+        self._base = start << self.WEIGHT_BITS
+        self._diff = end - start
+        self._work = np.empty_like(self._base)
+
+    def blend(self, alpha):
+        """Return the frame at alpha (0 = start, 1 = end) as a PIL image"""
+        import numpy as np
+        weight = min(max(int(alpha * (1 << self.WEIGHT_BITS) + 0.5), 0), 1 << self.WEIGHT_BITS)
+        np.multiply(self._diff, weight, out=self._work)
+        np.add(self._work, self._base, out=self._work)
+        return Image.frombuffer('RGB', self.size, self._work, 'raw', 'RGB;16N', 0, 1)
+
+class ImagePyramid:
+    """Halved copies (1/2, 1/4, 1/8 ...) of an image for fast downscaling
+
+    Resampling from the smallest level that is still at least as large as
+    the target keeps resize cost roughly constant whatever the sensor
+    resolution. Levels can be built in a background thread; until they are
+    ready, lookups fall back to the largest level available.
+    """
+
+    def __init__(self, img, min_edge=256):
+        self.levels = [img]
+        self.min_edge = min_edge
+
+    @property
+    def source(self):
+        return self.levels[0]
+
+    def build(self):
+        """Build the remaining levels in the calling thread"""
+        level = self.levels[-1]
+        while min(level.size) // 2 >= self.min_edge:
+            # reduce() is a fast box filter, the final resample does the smoothing
+            level = level.reduce(2)
+            self.levels.append(level)
+        return self
+
+    def build_async(self):
+        """Build the remaining levels in a background thread"""
+        threading.Thread(target=self.build, daemon=True).start()
+        return self
+
+    def level_for(self, width, height):
+        """Return (level image, scale) of the smallest level covering width x height"""
+        best, best_scale = self.levels[0], 1.0
+        for level in list(self.levels):
+            if level.width < width or level.height < height:
+                break
+            best, best_scale = level, level.width / self.levels[0].width
+        return best, best_scale
+
+    def resize(self, size):
+        """Resample to a size from the best level"""
+        level, _ = self.level_for(*size)
+        return level.resize(size, Image.Resampling.LANCZOS)
+
+class TileRenderer:
+    """Render a zoomed image as fixed-size tiles, only for the visible viewport
+
+    Tiles are resampled on demand from the source image and kept in an LRU
+    cache keyed by (zoom level, tile x, tile y), so panning only has to render
+    the tiles that scroll into view instead of resizing the whole image.
+    """
+
+    def __init__(self, tile_size=256, max_tiles=256):
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.source = None
+        self.pyramid = None
+        self._tiles = OrderedDict()     # (zoom, tx, ty) -> PIL tile
+        self._lock = threading.Lock()
+
+    def set_source(self, img, pyramid=None):
+        """Switch to a new source image, dropping tiles rendered from the old one
+
+        When a pyramid of the image is given, zoomed-out tiles are resampled
+        from its smaller levels.
+        """
+        if img is not self.source:
+            with self._lock:
+                self.source = img
+                self._tiles.clear()
+        self.pyramid = pyramid
+
+    def zoomed_size(self, zoom):
+        """Size of the whole source image at a zoom level"""
+        return (max(1, round(self.source.width * zoom)), max(1, round(self.source.height * zoom)))
+
+    def visible_tiles(self, zoom, origin, viewport_size):
+        """List the (tx, ty) tiles that cross a viewport
+
+        origin is the position of the zoomed image's top-left corner in viewport
+        coordinates, so it is negative once the image has been panned.
+        """
+        width, height = self.zoomed_size(zoom)
+        size = self.tile_size
+        first_x = max(0, math.floor(-origin[0] / size))
+        first_y = max(0, math.floor(-origin[1] / size))
+        last_x = min(math.ceil(width / size), math.floor((viewport_size[0] - 1 - origin[0]) / size) + 1)
+        last_y = min(math.ceil(height / size), math.floor((viewport_size[1] - 1 - origin[1]) / size) + 1)
+        return [(tx, ty) for ty in range(first_y, last_y) for tx in range(first_x, last_x)]
+
+    def tile(self, zoom, tx, ty):
+        """Return one tile of the zoomed image, rendering it if it isn't cached"""
+        key = (zoom, tx, ty)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                return tile
+
+        tile = self._render(zoom, tx, ty)
+
+        with self._lock:
+            self._tiles[key] = tile
+            while len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        return tile
+
+    def _render(self, zoom, tx, ty):
+        width, height = self.zoomed_size(zoom)
+        size = self.tile_size
+        left, top = tx * size, ty * size
+        right, bottom = min(left + size, width), min(top + size, height)
+
+        # Map the tile back to the region of the source image it covers
+        box = (left / zoom, top / zoom, right / zoom, bottom / zoom)
+        if zoom == 1:
+            return self.source.crop(tuple(round(v) for v in box))
+        if zoom > 1:
+            # Show individual pixels when magnifying
+            return self.source.resize((right - left, bottom - top), Image.Resampling.NEAREST, box=box)
+
+        source, scale = self.source, 1.0
+        if self.pyramid is not None:
+            source, scale = self.pyramid.level_for(*self.zoomed_size(zoom))
+        box = tuple(v * scale for v in box)
+        return source.resize((right - left, bottom - top), Image.Resampling.LANCZOS, box=box)
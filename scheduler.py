@@ -0,0 +1,183 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from decode import Generation
+
+# Priority classes, most urgent first
+PRIORITY_PREVIEW = 0                # Preview of the image on screen
+PRIORITY_FULL = 1                   # Full decode of the image on screen
+PRIORITY_BACKGROUND_PREVIEW = 2     # Previews of neighbours and grid thumbnails
+PRIORITY_BACKGROUND = 3             # Full decodes of neighbours
+
+PRIORITY_NAMES = {PRIORITY_PREVIEW: 'preview', PRIORITY_FULL: 'full',
+                  PRIORITY_BACKGROUND_PREVIEW: 'background_preview', PRIORITY_BACKGROUND: 'background'}
+
+# Number of recent queue wait times kept for the statistics
+WAIT_SAMPLES = 256
+
+class Job:
+    """A unit of decode work queued on a DecodeScheduler
+
+    Each job has its own Generation, and its function is called with the job
+    so it can pass job.token and job.generation to run_decode_pipeline;
+    cancelling a running job advances the generation, which stops the
+    pipeline at its next check.
+    """
+
+    def __init__(self, key, func, priority):
+        self.key = key
+        self.func = func
+        self.priority = priority
+        self.future = Future()
+        self.generation = Generation()
+        self.token = self.generation.advance()
+        self.state = 'pending'              # 'pending', 'running' or 'done'
+        self.cancelled = False
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        # Exposed on the future so callers can see how long the job waited
+        self.future.job = self
+
+    def cancel(self):
+        """Stop the job at its next generation check"""
+        self.cancelled = True
+        self.generation.advance()
+
+class DecodeScheduler:
+    """Fixed pool of worker threads running decode jobs by priority class
+
+    Jobs are identified by a key. Submitting a key that is already queued or
+    running returns the existing job's future, raising its priority when the
+    new request is more urgent, so navigating back and forth never decodes a
+    file twice. Within a class, jobs run in submission order.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._heap = []                     # (priority, sequence, job); stale entries are skipped
+        self._jobs = {}                     # key -> queued or running Job
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._counts = {'submitted': 0, 'deduplicated': 0, 'completed': 0, 'cancelled': 0}
+        self._shutdown = False
+        self._threads = [threading.Thread(target=self._run, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, func, priority):
+        """Queue func(job) under a key and return a Future of its result"""
+        with self._condition:
+            self._counts['submitted'] += 1
+            job = self._jobs.get(key)
+            if job is not None and not job.cancelled:
+                self._counts['deduplicated'] += 1
+                if priority < job.priority:
+                    self._set_priority(job, priority)
+                return job.future
+            job = Job(key, func, priority)
+            self._jobs[key] = job
+            self._push(job, priority)
+            return job.future
+
+    def reprioritize(self, key, priority):
+        """Move a job to another priority class, up or down
+
+        A running job keeps running; its class only decides whether cancel()
+        may stop it.
+        """
+        with self._condition:
+            job = self._jobs.get(key)
+            if job is None or job.priority == priority:
+                return False
+            self._set_priority(job, priority)
+            return True
+
+    def cancel(self, key, min_priority=PRIORITY_PREVIEW):
+        """Drop a queued job, or stop a running one, unless it is more urgent than min_priority"""
+        with self._condition:
+            job = self._jobs.get(key)
+            if job is None or job.priority < min_priority:
+                return False
+            self._counts['cancelled'] += 1
+            job.cancel()
+            if job.state == 'pending':
+                del self._jobs[key]
+                job.future.cancel()
+            return True
+
+    def stats(self):
+        """Return the queue depth per priority class, running jobs and recent queue wait times"""
+        with self._condition:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            running = 0
+            for job in self._jobs.values():
+                if job.state == 'pending':
+                    queued[PRIORITY_NAMES[job.priority]] += 1
+                else:
+                    running += 1
+            waits = sorted(self._waits)
+            stats = dict(self._counts, workers=self.workers, running=running, queued=sum(queued.values()),
+                         queued_by_priority=queued)
+        stats['wait_ms_p50'] = waits[len(waits) // 2] * 1000 if waits else 0.0
+        stats['wait_ms_p95'] = waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000 if waits else 0.0
+        return stats
+
+    def shutdown(self):
+        """Stop the workers once their current jobs finish; queued jobs are dropped"""
+        with self._condition:
+            self._shutdown = True
+            for job in self._jobs.values():
+                if job.state == 'pending':
+                    job.future.cancel()
+            self._jobs.clear()
+            self._heap.clear()
+            self._condition.notify_all()
+
+    def _set_priority(self, job, priority):
+        if job.state == 'pending':
+            self._push(job, priority)
+        else:
+            job.priority = priority
+
+    def _push(self, job, priority):
+        job.priority = priority
+        heapq.heappush(self._heap, (priority, next(self._sequence), job))
+        self._condition.notify()
+
+    def _next_job(self):
+        """Pop the most urgent queued job, skipping entries left behind by reprioritizing"""
+        while self._heap:
+            priority, _, job = heapq.heappop(self._heap)
+            if job.state == 'pending' and not job.cancelled and job.priority == priority:
+                return job
+        return None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None and not self._shutdown:
+                    self._condition.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+                job.state = 'running'
+                job.started_at = time.perf_counter()
+                self._waits.append(job.started_at - job.submitted_at)
+
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.func(job))
+                except BaseException as e:
+                    job.future.set_exception(e)
+
+            with self._condition:
+                job.state = 'done'
+                self._counts['completed'] += 1
+                if self._jobs.get(job.key) is job:
+                    del self._jobs[job.key]
@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from decode import list_raw_files, load_preview_image, read_embedded_preview
+from embedded import capture_timestamp, read_metadata
+from imagecache import default_cache_dir
+
+# Previews are scored at this long edge, so frames of different resolutions compare fairly
+SCORE_SIZE = 1024
+
+# Share of the frame's width and height scored as its center, where the AF point usually is
+CENTER_FRACTION = 1 / 3
+
+# Largest gap in capture time between two frames of the same burst
+BURST_GAP_SECONDS = 2.0
+
+# Bumped whenever scores are computed differently, so old score files are ignored
+SCORES_VERSION = 1
+
+def laplacian_variance(gray):
+    """Return the variance of the 4-neighbour Laplacian of a 2D float array, higher is sharper"""
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.var())
+
+def capture_time(file_path, tags=None):
+    """Return when a file was shot in seconds, from its EXIF date or else its modification time"""
+    seconds = capture_timestamp(read_metadata(file_path) if tags is None else tags)
+    return os.path.getmtime(file_path) if seconds is None else seconds
+
+def score_file(file_path):
+    """Worker entry point: score the sharpness of a file's embedded preview
+
+    Returns {'overall': ..., 'center': ..., 'time': capture time}.
+    """
+    import numpy as np
+    size = (SCORE_SIZE, SCORE_SIZE)
+    img, _ = read_embedded_preview(file_path, size)
+    if img is None:
+        img = load_preview_image(file_path, target_size=size)
+    img = img.convert('L')
+    img.thumbnail(size)
+    gray = np.asarray(img, dtype=np.float32)
+    height, width = gray.shape
+    top = int(height * (1 - CENTER_FRACTION) / 2)
+    left = int(width * (1 - CENTER_FRACTION) / 2)
+    return {
+        'overall': laplacian_variance(gray),
+        'center': laplacian_variance(gray[top:height - top, left:width - left]),
+        'time': capture_time(file_path),
+    }
+
+class SharpnessScores:
+    """Sharpness scores of the RAW files of one folder, saved in the cache directory
+
+    Scores are kept by file name together with the modification time and
+    size they were computed for, so reopening a folder only scores the
+    files that are new or changed.
+    """
+
+    def __init__(self, directory, cache_dir=None):
+        self.directory = os.path.abspath(directory)
+        digest = hashlib.sha1(self.directory.encode('utf-8')).hexdigest()
+        self.path = os.path.join(cache_dir or os.path.join(default_cache_dir(), 'sharpness'), digest + '.json')
+        self.scores = {}                    # file name -> {'mtime', 'size', 'overall', 'center', 'time'}
+        self.load()
+
+    def load(self):
+        """Read the saved scores, if any"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == SCORES_VERSION:
+            self.scores = data.get('scores', {})
+
+    def save(self):
+        """Write the scores atomically"""
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': SCORES_VERSION, 'directory': self.directory, 'scores': self.scores}, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def is_current(self, file_path):
+        """Check whether a file has a score for its current contents"""
+        entry = self.scores.get(os.path.basename(file_path))
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size
+
+    def stale_files(self, files=None):
+        """Return the files of the folder that have no current score"""
+        files = list_raw_files(self.directory) if files is None else files
+        return [file_path for file_path in files if not self.is_current(file_path)]
+
+    def update(self, file_path, score):
+        """Store the score of a file"""
+        stat = os.stat(file_path)
+        self.scores[os.path.basename(file_path)] = dict(score, mtime=stat.st_mtime, size=stat.st_size)
+
+    def score_missing(self, workers=None, on_progress=None):
+        """Score the new and changed files across a process pool, then save
+
+        on_progress is called with (file path, score, error, done, total)
+        after each file; a file that can't be scored gets the exception
+        instead of a score. Returns the number of files scored.
+        """
+        files = list_raw_files(self.directory)
+        stale = self.stale_files(files)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(stale)))
+        scored = 0
+        if stale:
+            # rawpy's OpenMP runtime can deadlock in forked workers
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as executor:
+                futures = {executor.submit(score_file, file_path): file_path for file_path in stale}
+                for done, future in enumerate(as_completed(futures), 1):
+                    file_path = futures[future]
+                    try:
+                        score, error = future.result(), None
+                        self.update(file_path, score)
+                        scored += 1
+                    except Exception as e:
+                        score, error = None, e
+                    if on_progress:
+                        on_progress(file_path, score, error, done, len(stale))
+        # Forget files that are gone
+        names = {os.path.basename(file_path) for file_path in files}
+        self.scores = {name: score for name, score in self.scores.items() if name in names}
+        self.save()
+        return scored
+
+    def bursts(self, gap=BURST_GAP_SECONDS):
+        """Group the scored files into bursts of frames shot less than gap seconds apart
+
+        Returns lists of paths in capture order.
+        """
+        ordered = sorted(self.scores.items(), key=lambda item: (item[1]['time'], item[0]))
+        groups = []
+        previous = None
+        for name, score in ordered:
+            if previous is None or score['time'] - previous > gap:
+                groups.append([])
+            groups[-1].append(os.path.join(self.directory, name))
+            previous = score['time']
+        return groups
+
+    def score_of(self, file_path):
+        return self.scores.get(os.path.basename(file_path))
+
+    def burst_of(self, file_path, gap=BURST_GAP_SECONDS):
+        """Return the burst a file belongs to, or None if it has no score"""
+        file_path = os.path.join(self.directory, os.path.basename(file_path))
+        for burst in self.bursts(gap):
+            if file_path in burst:
+                return burst
+        return None
+
+    def rank_key(self, file_path):
+        """Sort key of a scored file, sharper frames last; the center decides before the whole frame"""
+        score = self.score_of(file_path)
+        return (score['center'], score['overall'])
+
+    def sharpest(self, files):
+        """Return the sharpest of some scored files"""
+        return max(files, key=self.rank_key)
+
+def emit(event, **fields):
+    """Write one JSON progress line to stdout"""
+    print(json.dumps({'event': event, **fields}), flush=True)
+
+def parse_arguments(argv):
+    """Parse command line arguments for the sharpness subcommand"""
+    parser = argparse.ArgumentParser(prog='fastraw sharpness',
+                                     description='Score the sharpness of the RAW files of a folder and group bursts')
+    parser.add_argument('directory', help='Folder of RAW files')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--gap', type=float, default=BURST_GAP_SECONDS, metavar='SECONDS',
+                        help=f'Largest gap between frames of one burst (default: {BURST_GAP_SECONDS})')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Score a folder, streaming progress and then one line per burst as JSON"""
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+    scores = SharpnessScores(args.directory)
+    start = time.perf_counter()
+    emit('start', directory=scores.directory, stale=len(scores.stale_files()), workers=args.workers)
+
+    errors = 0
+
+    def progress(file_path, score, error, done, total):
+        nonlocal errors
+        if error is not None:
+            errors += 1
+            emit('file', source=file_path, status='error', error=str(error), done=done, remaining=total - done)
+        else:
+            emit('file', source=file_path, status='scored', overall=round(score['overall'], 2),
+                 center=round(score['center'], 2), done=done, remaining=total - done)
+
+    scored = scores.score_missing(args.workers, progress)
+    bursts = scores.bursts(args.gap)
+    for burst in bursts:
+        emit('burst', files=burst, best=scores.sharpest(burst))
+    emit('done', scored=scored, errors=errors, files=len(scores.scores), bursts=len(bursts),
+         seconds=round(time.perf_counter() - start, 3))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
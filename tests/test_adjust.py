@@ -0,0 +1,43 @@
+import numpy as np
+from adjust import build_tone_lut
+
+def test_lut_shape_and_ends():
+    lut = build_tone_lut(1.0, 0)
+    assert lut.shape == (65536,)
+    assert lut.dtype == np.uint8
+    assert lut[0] == 0
+    assert lut[-1] == 255
+
+def test_lut_is_monotonic():
+    for gain, highlights in [(1.0, 0), (2.5, 0), (0.5, 0), (1.0, 50), (3.0, 100)]:
+        assert np.all(np.diff(build_tone_lut(gain, highlights).astype(np.int16)) >= 0)
+
+def test_gain_clips_to_white():
+    lut = build_tone_lut(2.0, 0)
+    assert lut[32768] == 255
+    assert lut[-1] == 255
+    assert lut[16384] == build_tone_lut(1.0, 0)[32768]
+
+def test_highlights_roll_off_instead_of_clipping():
+    hard = build_tone_lut(2.0, 0)
+    soft = build_tone_lut(2.0, 100)
+    # Below the knee the curve is unchanged
+    assert np.array_equal(soft[:6000], hard[:6000])
+    assert soft[40000] < hard[40000] == 255
+    assert soft[-1] < 255
+
+def test_plan_linear_decode(tmp_path):
+    from benchmarks.fixtures import make_dng
+    from adjust import decode_linear, plan_linear_decode
+    from decode import open_raw
+    path = str(tmp_path / 'small.dng')
+    make_dng(path, width=64, height=48, preview_size=(32, 24))
+    with open_raw(path) as raw:
+        assert plan_linear_decode(raw, (20, 15)) is True
+        assert plan_linear_decode(raw, (64, 48)) is False
+        assert plan_linear_decode(raw) is False
+        # A full resolution decode over budget drops to half size, or to nothing at all
+        assert plan_linear_decode(raw, None, 0.04) is True
+        assert plan_linear_decode(raw, (20, 15), 0.01) is None
+    assert decode_linear(path, None, 0.04).size == (32, 24)
+    assert decode_linear(path, (20, 15)).size == (20, 15)
@@ -0,0 +1,52 @@
+import pytest
+from benchmarks.fixtures import make_dng
+from decode import (decode_full_image, decode_level_of, open_raw, plan_full_decode, requested_level_of,
+                    satisfies_level)
+from decode_engine import ProcessDecodeEngine
+
+# Leaves room for a half size decode of the fixture below, not for a full one
+BUDGET_MB = 0.03
+
+@pytest.fixture(scope='module')
+def dng(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('raw') / 'small.dng')
+    make_dng(path, width=64, height=48, preview_size=(32, 24))
+    return path
+
+def test_plan_falls_back_to_half_size(dng):
+    with open_raw(dng) as raw:
+        assert plan_full_decode(raw) == (16, False)
+        assert plan_full_decode(raw, 100) == (8, False)
+        assert plan_full_decode(raw, BUDGET_MB) == (8, True)
+
+def test_full_decode_is_labelled(dng):
+    img = decode_full_image(dng)
+    assert img.size == (64, 48)
+    assert decode_level_of(img) == 'full'
+    assert requested_level_of(img) == 'full'
+
+@pytest.mark.parametrize('level', ['full', 'fast'])
+def test_budget_fallback_is_labelled_half(dng, level):
+    img = decode_full_image(dng, BUDGET_MB, level)
+    assert img.size == (32, 24)
+    assert decode_level_of(img) == 'half'
+    assert requested_level_of(img) == level
+
+def test_satisfies_level(dng):
+    capped = decode_full_image(dng, BUDGET_MB, 'fast')
+    assert satisfies_level(capped, 'half')
+    assert satisfies_level(capped, 'fast')
+    # A full decode was never tried, it is worth asking for
+    assert not satisfies_level(capped, 'full')
+    assert satisfies_level(decode_full_image(dng, BUDGET_MB, 'full'), 'full')
+
+def test_process_engine_keeps_label(dng):
+    engine = ProcessDecodeEngine(workers=1, memory_budget_mb=BUDGET_MB)
+    try:
+        with open(dng, 'rb') as f:
+            img = engine.decode(f.read(), level='full')
+    finally:
+        engine.shutdown()
+    assert img.size == (32, 24)
+    assert decode_level_of(img) == 'half'
+    assert requested_level_of(img) == 'full'
@@ -0,0 +1,49 @@
+import io
+import struct
+from PIL import Image
+from embedded import find_embedded_jpeg
+
+def make_jpeg(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (120, 80, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def make_tiff(jpegs, order='<'):
+    """Little TIFF whose IFD chain holds one JPEGInterchangeFormat preview per IFD"""
+    header = (b'II*\x00' if order == '<' else b'MM\x00*') + struct.pack(order + 'I', 8)
+    ifd_size = 2 + 2 * 12 + 4
+    data_offset = 8 + ifd_size * len(jpegs)
+    ifds = b''
+    data = b''
+    for index, jpeg in enumerate(jpegs):
+        next_ifd = 8 + ifd_size * (index + 1) if index + 1 < len(jpegs) else 0
+        ifds += struct.pack(order + 'H', 2)
+        ifds += struct.pack(order + 'HHII', 0x201, 4, 1, data_offset + len(data))
+        ifds += struct.pack(order + 'HHII', 0x202, 4, 1, len(jpeg))
+        ifds += struct.pack(order + 'I', next_ifd)
+        data += jpeg
+    return header + ifds + data
+
+def test_finds_largest_jpeg():
+    small = make_jpeg((32, 24))
+    large = make_jpeg((64, 48))
+    buf = make_tiff([small, large])
+    offset, length, width, height = find_embedded_jpeg(buf)
+    assert (width, height) == (64, 48)
+    assert buf[offset:offset + length] == large
+
+def test_big_endian():
+    jpeg = make_jpeg((40, 30))
+    offset, length, width, height = find_embedded_jpeg(make_tiff([jpeg], order='>'))
+    assert (length, width, height) == (len(jpeg), 40, 30)
+
+def test_unknown_format():
+    assert find_embedded_jpeg(b'\x89PNG\r\n\x1a\n' + b'\0' * 32) is None
+
+def test_truncated_file():
+    buf = make_tiff([make_jpeg((32, 24))])
+    assert find_embedded_jpeg(buf[:20]) is None
+    assert find_embedded_jpeg(buf[:-10]) is None
+
+def test_not_a_jpeg():
+    assert find_embedded_jpeg(make_tiff([b'\0' * 64])) is None
@@ -0,0 +1,91 @@
+import io
+import os
+from PIL import Image
+from imagecache import PreviewDiskCache
+
+def make_raws(directory, count):
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f'img{index}.dng')
+        with open(path, 'wb') as f:
+            f.write(bytes([index]) * 64)
+        paths.append(path)
+    return paths
+
+def jpeg_bytes(size):
+    """A small JPEG padded to exactly size bytes"""
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffer, 'JPEG')
+    return buffer.getvalue().ljust(size, b'\0')
+
+def test_eviction_keeps_most_recently_used(tmp_path):
+    raws = make_raws(str(tmp_path), 5)
+    cache = PreviewDiskCache(str(tmp_path / 'cache'), max_mb=2500 / (1024 * 1024))
+    img = Image.new('RGB', (4, 4))
+    for path in raws[:2]:
+        cache.put(path, img, jpeg_bytes(1000))
+    # Reading the first entry makes the second one the least recently used
+    cache._touch(cache._entry_path(cache.fingerprint(raws[0])), 1000)
+    cache.put(raws[2], img, jpeg_bytes(1000))
+    kept = [os.path.exists(cache._entry_path(cache.fingerprint(path))) for path in raws[:3]]
+    assert kept == [True, False, True]
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['bytes'] == 2000
+
+def test_directory_is_scanned_once(tmp_path, monkeypatch):
+    raws = make_raws(str(tmp_path), 5)
+    directory = str(tmp_path / 'cache')
+    img = Image.new('RGB', (4, 4))
+    first = PreviewDiskCache(directory)
+    first.put(raws[0], img, jpeg_bytes(3000))
+
+    cache = PreviewDiskCache(directory, max_mb=5000 / (1024 * 1024))
+    scans = []
+    scan = cache._scan
+    monkeypatch.setattr(cache, '_scan', lambda: scans.append(1) or scan())
+    for path in raws[1:]:
+        cache.put(path, img, jpeg_bytes(1000))
+    assert len(scans) == 1
+    # The entry left by the previous session is the oldest and went first
+    assert not os.path.exists(cache._entry_path(cache.fingerprint(raws[0])))
+    assert cache.stats() == {'directory': directory, 'entries': 4, 'bytes': 4000, 'max_bytes': 5000}
+
+def test_rewriting_an_entry_replaces_its_size(tmp_path):
+    raws = make_raws(str(tmp_path), 1)
+    cache = PreviewDiskCache(str(tmp_path / 'cache'))
+    img = Image.new('RGB', (4, 4))
+    cache.put(raws[0], img, jpeg_bytes(1000))
+    cache.put(raws[0], img, jpeg_bytes(1500))
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['bytes'] == 1500
+
+def test_clear(tmp_path):
+    raws = make_raws(str(tmp_path), 2)
+    cache = PreviewDiskCache(str(tmp_path / 'cache'))
+    for path in raws:
+        cache.put(path, Image.new('RGB', (4, 4)), jpeg_bytes(1000))
+    cache.clear()
+    assert cache.stats()['entries'] == 0
+    assert cache.get(raws[0]) is None
+
+def test_large_jpeg_is_capped_even_when_drafted(tmp_path):
+    raws = make_raws(str(tmp_path), 1)
+    cache = PreviewDiskCache(str(tmp_path / 'cache'), max_edge=500)
+    buffer = io.BytesIO()
+    Image.new('RGB', (2000, 1500), (90, 120, 30)).save(buffer, 'JPEG')
+    # Shown as a thumbnail, so decoded well under the cap
+    drafted = Image.open(io.BytesIO(buffer.getvalue()))
+    drafted.draft('RGB', (250, 188))
+    drafted.load()
+    assert max(drafted.size) <= 500
+    cache.put(raws[0], drafted, buffer.getvalue())
+    assert cache.get(raws[0]).size == (500, 375)
+
+def test_small_jpeg_is_stored_verbatim(tmp_path):
+    raws = make_raws(str(tmp_path), 1)
+    cache = PreviewDiskCache(str(tmp_path / 'cache'), max_edge=500)
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 300), (90, 120, 30)).save(buffer, 'JPEG')
+    cache.put(raws[0], Image.new('RGB', (100, 75)), buffer.getvalue())
+    with open(cache._entry_path(cache.fingerprint(raws[0])), 'rb') as f:
+        assert f.read() == buffer.getvalue()
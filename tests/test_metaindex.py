@@ -0,0 +1,44 @@
+import pytest
+from metaindex import SHAPES, parse_filter, parse_number
+
+def test_parse_number():
+    assert parse_number('1600') == 1600
+    assert parse_number('2.8') == 2.8
+    assert parse_number('1/250') == 1 / 250
+
+def test_empty_filter_matches_everything():
+    assert parse_filter('') == ('1', [])
+    assert parse_filter('   ') == ('1', [])
+
+@pytest.mark.parametrize('text, sql, params', [
+    ('iso>=1600', 'iso >= ?', [1600]),
+    ('ISO<400', 'iso < ?', [400]),
+    ('shutter<1/250', 'exposure_time < ?', [1 / 250]),
+    ('f=2.8', 'fnumber = ?', [2.8]),
+    ('rating!=0', 'rating != ?', [0]),
+    ('lens:70-200', 'lens LIKE ?', ['%70-200%']),
+    ('make:Sony', 'make LIKE ?', ['%sony%']),
+    ('portrait', SHAPES['portrait'], []),
+])
+def test_single_terms(text, sql, params):
+    assert parse_filter(text) == (sql, params)
+
+def test_terms_are_combined():
+    sql, params = parse_filter('iso>=1600 lens:70-200 landscape')
+    assert sql == f"iso >= ? AND lens LIKE ? AND {SHAPES['landscape']}"
+    assert params == [1600, '%70-200%']
+
+@pytest.mark.parametrize('text', [
+    'sharp',                # no operator
+    'color=red',            # unknown field
+    'iso:100',              # numeric field with a text match
+    'lens>50',              # text field with a comparison
+])
+def test_unknown_terms(text):
+    with pytest.raises(ValueError, match='Unknown filter term'):
+        parse_filter(text)
+
+@pytest.mark.parametrize('text', ['iso>=high', 'iso>=', 'shutter<1/0', 'focal=50mm'])
+def test_bad_numbers(text):
+    with pytest.raises(ValueError, match='Not a number'):
+        parse_filter(text)
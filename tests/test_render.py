@@ -0,0 +1,30 @@
+from PIL import Image
+from render import CrossfadeBlender
+
+START = (10, 200, 0)
+END = (250, 0, 100)
+
+def pixel(img):
+    return img.getpixel((0, 0))
+
+def test_blend_ends_match_images():
+    blender = CrossfadeBlender(Image.new('RGB', (8, 6), START), Image.new('RGB', (8, 6), END))
+    assert pixel(blender.blend(0)) == START
+    assert pixel(blender.blend(1)) == END
+
+def test_blend_midpoint():
+    blender = CrossfadeBlender(Image.new('RGB', (8, 6), START), Image.new('RGB', (8, 6), END))
+    assert pixel(blender.blend(0.5)) == (130, 100, 50)
+    assert pixel(blender.blend(0.25)) == (70, 150, 25)
+
+def test_blend_clamps_alpha():
+    blender = CrossfadeBlender(Image.new('RGB', (8, 6), START), Image.new('RGB', (8, 6), END))
+    assert pixel(blender.blend(-1)) == START
+    assert pixel(blender.blend(2)) == END
+
+def test_start_is_resized_to_end():
+    blender = CrossfadeBlender(Image.new('L', (16, 12), 40), Image.new('RGB', (8, 6), END))
+    frame = blender.blend(0)
+    assert frame.size == (8, 6)
+    assert frame.mode == 'RGB'
+    assert pixel(frame) == (40, 40, 40)
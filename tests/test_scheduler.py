@@ -0,0 +1,93 @@
+import threading
+import pytest
+from scheduler import (DecodeScheduler, PRIORITY_BACKGROUND, PRIORITY_BACKGROUND_PREVIEW, PRIORITY_FULL,
+                       PRIORITY_PREVIEW)
+
+TIMEOUT = 5
+
+@pytest.fixture
+def scheduler():
+    scheduler = DecodeScheduler(workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+def block_worker(scheduler):
+    """Occupy the only worker until the returned event is set"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def hold(job):
+        started.set()
+        release.wait(TIMEOUT)
+        return 'held'
+
+    future = scheduler.submit('blocker', hold, PRIORITY_PREVIEW)
+    assert started.wait(TIMEOUT)
+    return release, future
+
+def test_duplicate_submit_returns_same_future_and_raises_priority(scheduler):
+    release, _ = block_worker(scheduler)
+    order = []
+    first = scheduler.submit('b', lambda job: order.append('b'), PRIORITY_FULL)
+    future = scheduler.submit('a', lambda job: order.append('a'), PRIORITY_BACKGROUND)
+    again = scheduler.submit('a', lambda job: order.append('a again'), PRIORITY_PREVIEW)
+    assert again is future
+    assert future.job.priority == PRIORITY_PREVIEW
+    assert scheduler.stats()['deduplicated'] == 1
+    release.set()
+    future.result(TIMEOUT)
+    first.result(TIMEOUT)
+    assert order == ['a', 'b']
+
+def test_duplicate_submit_never_lowers_priority(scheduler):
+    release, _ = block_worker(scheduler)
+    future = scheduler.submit('a', lambda job: None, PRIORITY_PREVIEW)
+    assert scheduler.submit('a', lambda job: None, PRIORITY_BACKGROUND) is future
+    assert future.job.priority == PRIORITY_PREVIEW
+    release.set()
+    future.result(TIMEOUT)
+
+def test_cancel_spares_more_urgent_job(scheduler):
+    release, _ = block_worker(scheduler)
+    urgent = scheduler.submit('urgent', lambda job: 'urgent', PRIORITY_PREVIEW)
+    background = scheduler.submit('background', lambda job: 'background', PRIORITY_BACKGROUND)
+    assert not scheduler.cancel('urgent', min_priority=PRIORITY_BACKGROUND_PREVIEW)
+    assert scheduler.cancel('background', min_priority=PRIORITY_BACKGROUND_PREVIEW)
+    assert background.cancelled()
+    release.set()
+    assert urgent.result(TIMEOUT) == 'urgent'
+
+def test_cancel_unknown_key(scheduler):
+    assert not scheduler.cancel('missing')
+
+def test_cancelled_running_job_can_be_resubmitted(scheduler):
+    started = threading.Event()
+    release = threading.Event()
+
+    def decode(job):
+        started.set()
+        release.wait(TIMEOUT)
+        return 'current' if job.generation.is_current(job.token) else 'stale'
+
+    running = scheduler.submit('file', decode, PRIORITY_FULL)
+    assert started.wait(TIMEOUT)
+    assert scheduler.cancel('file')
+    assert running.job.cancelled
+    resubmitted = scheduler.submit('file', lambda job: 'again', PRIORITY_FULL)
+    assert resubmitted is not running
+    release.set()
+    assert running.result(TIMEOUT) == 'stale'
+    assert resubmitted.result(TIMEOUT) == 'again'
+
+def test_reprioritized_job_runs_once(scheduler):
+    release, _ = block_worker(scheduler)
+    runs = []
+    future = scheduler.submit('a', lambda job: runs.append(job.priority), PRIORITY_PREVIEW)
+    assert scheduler.reprioritize('a', PRIORITY_BACKGROUND)
+    assert scheduler.reprioritize('a', PRIORITY_FULL)
+    assert not scheduler.reprioritize('a', PRIORITY_FULL)
+    release.set()
+    future.result(TIMEOUT)
+    # The heap entries left behind by reprioritizing are skipped
+    assert scheduler.submit('b', lambda job: runs.append('b'), PRIORITY_BACKGROUND).result(TIMEOUT) is None
+    assert runs == [PRIORITY_FULL, 'b']
@@ -0,0 +1,41 @@
+import os
+import pytest
+from sharpness import SharpnessScores
+
+def score(time, center=1.0, overall=1.0):
+    return {'time': time, 'center': center, 'overall': overall, 'mtime': 0, 'size': 0}
+
+@pytest.fixture
+def scores(tmp_path):
+    scores = SharpnessScores(str(tmp_path / 'shoot'), cache_dir=str(tmp_path / 'cache'))
+    scores.scores = {
+        'c.dng': score(20.0, center=5.0),
+        'b.dng': score(11.0, center=3.0),
+        'a.dng': score(10.0, center=1.0),
+        'd.dng': score(11.0, center=2.0, overall=9.0),
+        'e.dng': score(22.5),
+    }
+    return scores
+
+def paths(scores, *names):
+    return [os.path.join(scores.directory, name) for name in names]
+
+def test_bursts_group_by_gap_in_capture_order(scores):
+    assert scores.bursts(2.0) == [paths(scores, 'a.dng', 'b.dng', 'd.dng'), paths(scores, 'c.dng'),
+                                  paths(scores, 'e.dng')]
+
+def test_bursts_gap_is_inclusive(scores):
+    assert scores.bursts(2.5) == [paths(scores, 'a.dng', 'b.dng', 'd.dng'), paths(scores, 'c.dng', 'e.dng')]
+
+def test_bursts_wide_gap(scores):
+    assert scores.bursts(60) == [paths(scores, 'a.dng', 'b.dng', 'd.dng', 'c.dng', 'e.dng')]
+
+def test_bursts_empty(tmp_path):
+    assert SharpnessScores(str(tmp_path), cache_dir=str(tmp_path / 'cache')).bursts() == []
+
+def test_burst_of_and_sharpest(scores):
+    burst = scores.burst_of('/elsewhere/d.dng', 2.0)
+    assert burst == paths(scores, 'a.dng', 'b.dng', 'd.dng')
+    # The center decides before the whole frame
+    assert scores.sharpest(burst) == paths(scores, 'b.dng')[0]
+    assert scores.burst_of('missing.dng') is None
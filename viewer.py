@@ -0,0 +1,1624 @@
+import tkinter as tk
+from tkinter import filedialog, simpledialog
+from PIL import ImageTk
+import os
+import threading
+import time
+from decode import (RAW_EXTENSIONS, list_raw_files, file_key, load_preview_image,
+                    decode_level_of, is_better_level, satisfies_level, preview_covers_view,
+                    run_decode_pipeline, DecodeCancelled, Generation)
+from imagecache import DecodedImageCache, PreviewDiskCache
+from scheduler import (DecodeScheduler, PRIORITY_PREVIEW, PRIORITY_FULL, PRIORITY_BACKGROUND_PREVIEW,
+                       PRIORITY_BACKGROUND)
+from decode_engine import ThreadDecodeEngine
+from render import DEFAULT_FADE_MS, CrossfadeBlender, ImagePyramid, TileRenderer, resize_to_fit
+from memory import PeakRSSMonitor
+from browser import ThumbnailGrid
+from watcher import DEFAULT_SETTLE_SECONDS, FolderWatcher
+from adjust import LookAdjustments, decode_linear
+from analysis import DisplayAnalysis
+from sharpness import SharpnessScores
+from metaindex import INDEX_BATCH, SORT_ORDERS, parse_filter
+import profiling
+
+# Zoom steps for the mouse wheel, as a fraction of the image's own resolution
+ZOOM_LEVELS = (0.125, 0.25, 0.5, 1.0, 2.0)
+
+# Status bar names of the decode.DECODE_LEVELS
+DECODE_LEVEL_LABELS = {'preview': 'embedded preview', 'half': 'half-size decode', 'fast': 'AHD decode',
+                       'full': 'DCB decode'}
+
+# Shortest gap between the frames of the preview to full image fade
+FADE_FRAME_INTERVAL_MS = 16
+
+# Histogram panel size and the colours of its red, green, blue and luma curves
+HISTOGRAM_WIDTH = 256
+HISTOGRAM_HEIGHT = 100
+HISTOGRAM_COLORS = ("#E05050", "#50C050", "#5080E0", "#DDDDDD")
+
+# Most new files indexed on the UI thread when listing a folder, e.g. frames arriving in the watch folder;
+# more than that are indexed in the background while the folder is listed by name
+INLINE_INDEX_FILES = 5
+
+class RawImageViewer:
+    def __init__(self, root, cache_mb=1024, prefetch_radius=2, disk_cache=None, decode_engine=None,
+                 fade_ms=DEFAULT_FADE_MS, profiler=None, decode_policy='auto', scheduler=None,
+                 metadata_index=None):
+        self.root = root
+        self.root.title("fastraw")
+        
+        # Configure the main window with dark theme
+        self.root.geometry("1200x800")
+        self.root.minsize(800, 600)
+        self.root.configure(bg="#121212")
+        
+        # Create canvas for image display with dark background
+        self.canvas = tk.Canvas(self.root, bg="#121212", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        
+        # Create minimal status bar with dark theme
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ready")
+        self.status_bar = tk.Label(self.root, textvariable=self.status_var, 
+                                   bg="#1E1E1E", fg="#AAAAAA", 
+                                   anchor=tk.W, padx=10, pady=5)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Create a native button with rounded style
+        self.open_button = tk.Button(
+            self.canvas, 
+            text="Open Image",
+            font=("Helvetica", 12, "bold"),
+            bg="#2D2D2D", 
+            fg="#FFFFFF",
+            activebackground="#3D3D3D",
+            activeforeground="#FFFFFF",
+            relief=tk.FLAT,
+            borderwidth=0,
+            padx=20,
+            pady=10,
+            command=self.open_file
+        )
+        # We'll initialize it in show_open_button
+        self.open_button_window = None
+        
+        # Variables for image display
+        self.current_image_path = None
+        self.preview_image = None           # PhotoImage for display
+        self.full_image = None              # PhotoImage for display
+        self.displayed_image = None         # Current PhotoImage being displayed
+        self.image_id = None                # Canvas image ID
+        
+        # Store PIL versions of images for blending
+        self.preview_pil = None             # PIL version of preview
+        self.full_pil = None                # PIL version of full image
+        self.full_size_img = None           # Full-size decoded image
+        self.preview_source = None          # Preview at its original size
+        self.pyramids = {}                  # id(image) -> ImagePyramid for the current file's images
+        self.preview_target_size = None     # Canvas size that previews are decoded for
+        
+        # Zoom and pan state; zoom is None when fitting the image to the window
+        self.zoom = None
+        self.view_center = (0.5, 0.5)       # Viewport center as a fraction of the image size
+        self.tile_renderer = TileRenderer()
+        self.tile_items = {}                # (tx, ty) -> (canvas item, PhotoImage)
+        self._tile_state = None             # (source, zoom) the tile items were rendered for
+        self._pan_anchor = None
+        
+        # Variables for fade transition
+        self.transition_active = False
+        self.alpha = 0.0
+        self.fade_duration = fade_ms / 1000  # Seconds, 0 disables the fade
+        self.fade_start = 0.0
+        self._fade_frame_cost = 0.0         # Smoothed cost of one fade frame in seconds
+        self.blender = None                 # CrossfadeBlender for the running fade
+        self.fade_image = None              # PhotoImage the fade frames are pasted into
+        self.fade_after_id = None
+        self._resize_job = None
+        
+        # Folder navigation and background prefetching of neighbouring files
+        self.folder_files = []              # RAW files in the current image's directory
+        self.folder_index = -1              # Position of the current image in folder_files
+        self.prefetch_radius = prefetch_radius
+        self.image_cache = DecodedImageCache(max_mb=cache_mb)
+        self.disk_cache = disk_cache        # Optional PreviewDiskCache shared across sessions
+        self.decode_engine = decode_engine or ThreadDecodeEngine()
+        
+        # All decode work runs on one scheduler: the current image first, then its neighbours
+        self.scheduler = scheduler or DecodeScheduler()
+        self.current_jobs = {}              # Scheduler key -> background priority, for the current image
+        self.background_jobs = set()        # Scheduler keys of the neighbour prefetches
+        
+        # 'auto' decodes only as much as the view needs and upgrades on zoom, 'full' always runs DCB
+        self.decode_policy = decode_policy
+        self.decode_level = None            # decode.DECODE_LEVELS entry of full_size_img
+        self.upgrade_future = None          # Future of a better decode of the current file
+        
+        # Thumbnail grid of a whole folder, shown in place of the image canvas
+        self.grid = ThumbnailGrid(self.root, self.open_from_grid, self.scheduler, disk_cache=disk_cache,
+                                  metadata_index=metadata_index)
+        
+        # Optional MetadataIndex: filled in the background for each folder opened, it
+        # answers sorted and filtered folder listings and where each embedded JPEG is
+        self.metadata_index = metadata_index
+        self.sort_order = 'name'            # SORT_ORDERS entry the folder is navigated in
+        self.sort_reversed = False
+        self.folder_filter = None           # metaindex.parse_filter() string, or None
+        self.indexing = None                # Directory being indexed in the background
+        self.indexed_directory = None       # Directory whose index was last brought up to date
+        self.indexed_mtime = None           # Its modification time then; files added or removed change it
+        self.index_job_key = None           # Scheduler key of the queued or running index batch
+        self.order_pending = False          # Apply the sort order and filter once indexing finishes
+        
+        # Watch folder for tethered shooting; new files are opened as soon as they are written
+        self.watcher = None
+        self.capture_time = None            # perf_counter time the current file appeared in the watch folder
+        self.capture_latency_ms = None      # From that time until the file was first on screen
+        
+        # Look adjustments, rendered from linear decodes instead of re-running postprocess
+        self.look = LookAdjustments()
+        self.linear_proxy = None            # LinearProxy of the current file at display resolution
+        self.linear_full = None             # LinearProxy of the current file at full resolution, for zooming
+        self.adjusted_img = None            # Current file rendered with the look, None while it is neutral
+        self.adjusted_full = None           # The same at full resolution, rendered only while zoomed in
+        self.adjust_photo = None            # PhotoImage the adjusted renders are pasted into
+        
+        # Exposure and focus aids, computed from the display buffers rather than the full image
+        self.show_histogram = False
+        self.show_clipping = False
+        self.show_peaking = False
+        self.analysis = DisplayAnalysis()
+        self.display_pil = None             # Fitted image on screen, the buffer the aids are computed from
+        self.display_source = None          # Image display_pil was resized from
+        self.overlay_item = None            # Canvas item of the clipping/peaking overlay in fit mode
+        self.overlay_photo = None
+        self.histogram_items = []           # Canvas items of the histogram panel
+        self._histogram_state = None        # (source, canvas width) the histogram was drawn for
+        
+        # Sharpness scores of the current folder, for jumping to the best frame of a burst
+        self.sharpness = None               # SharpnessScores of the folder last scored
+        self.scoring = False                # True while a background thread scores the folder
+        
+        # Every open gets a new generation token; decode work and UI callbacks
+        # carrying an older token are dropped
+        self.generation = Generation()
+        self.current_token = None
+        self.peak_rss_mb = None             # Peak RSS while decoding the current file
+        self.profiler = profiler or profiling.PROFILER
+        
+        # Bind events
+        self.root.bind("<Configure>", self.on_resize)
+        self.root.bind("<o>", lambda e: self.open_file())     # Keyboard shortcut 'o' to open files
+        self.root.bind("<Right>", lambda e: self.show_next())  # Next RAW file in the folder
+        self.root.bind("<Left>", lambda e: self.show_previous())  # Previous RAW file in the folder
+        self.root.bind("<Escape>", lambda e: root.quit())     # ESC to quit
+        self.root.bind("<z>", lambda e: self.toggle_zoom())   # Toggle between fit and 100%
+        self.root.bind("<Key-0>", lambda e: self.set_zoom(None))
+        self.root.bind("<Key-1>", lambda e: self.set_zoom(1.0))
+        self.root.bind("<Key-2>", lambda e: self.set_zoom(2.0))
+        self.root.bind("<g>", lambda e: self.toggle_grid())   # Thumbnail grid of the folder
+        self.root.bind("<Up>", lambda e: self.grid_step_rows(-1))
+        self.root.bind("<Down>", lambda e: self.grid_step_rows(1))
+        self.root.bind("<Prior>", lambda e: self.grid_step_rows(-self.grid_page_rows()))
+        self.root.bind("<Next>", lambda e: self.grid_step_rows(self.grid_page_rows()))
+        self.root.bind("<Return>", lambda e: self.grid.open_selected() if self.grid.active else None)
+        
+        # Look adjustments: lower case steps down, upper case steps up
+        for key, name in (('e', 'exposure'), ('w', 'temperature'), ('t', 'tint'), ('h', 'highlights')):
+            self.root.bind(f"<{key}>", lambda e, n=name: self.adjust_look(n, -1))
+            self.root.bind(f"<{key.upper()}>", lambda e, n=name: self.adjust_look(n, 1))
+        self.root.bind("<r>", lambda e: self.reset_look())
+        self.root.bind("<i>", lambda e: self.toggle_aid('show_histogram'))
+        self.root.bind("<c>", lambda e: self.toggle_aid('show_clipping'))
+        self.root.bind("<f>", lambda e: self.toggle_aid('show_peaking'))
+        self.root.bind("<b>", lambda e: self.jump_to_sharpest())   # Sharpest frame of the burst
+        self.root.bind("<s>", lambda e: self.cycle_sort_order())
+        self.root.bind("<S>", lambda e: self.reverse_sort_order())
+        self.root.bind("<slash>", lambda e: self.ask_folder_filter())
+        
+        # Mouse wheel zoom (Windows/macOS send <MouseWheel>, X11 sends buttons 4 and 5)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        
+        # Drag to pan while zoomed in
+        self.canvas.bind("<ButtonPress-1>", self.start_pan)
+        self.canvas.bind("<B1-Motion>", self.pan)
+        self.canvas.bind("<ButtonRelease-1>", self.end_pan)
+        
+        # Right-click menu for basic operations
+        self.context_menu = tk.Menu(self.root, tearoff=0, bg="#1E1E1E", fg="#AAAAAA", 
+                                   activebackground="#2D2D2D", activeforeground="#FFFFFF")
+        self.context_menu.add_command(label="Open RAW file", command=self.open_file)
+        self.context_menu.add_command(label="Next image", command=self.show_next)
+        self.context_menu.add_command(label="Previous image", command=self.show_previous)
+        self.context_menu.add_command(label="Browse folder", command=self.open_folder)
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Fit to window", command=lambda: self.set_zoom(None))
+        self.context_menu.add_command(label="Zoom 100%", command=lambda: self.set_zoom(1.0))
+        self.context_menu.add_command(label="Zoom 200%", command=lambda: self.set_zoom(2.0))
+        self.context_menu.add_command(label="Reset adjustments", command=self.reset_look)
+        self.context_menu.add_command(label="Histogram", command=lambda: self.toggle_aid('show_histogram'))
+        self.context_menu.add_command(label="Clipping", command=lambda: self.toggle_aid('show_clipping'))
+        self.context_menu.add_command(label="Focus peaking", command=lambda: self.toggle_aid('show_peaking'))
+        self.context_menu.add_command(label="Sharpest in burst", command=self.jump_to_sharpest)
+        self.context_menu.add_command(label="Sort by next field", command=self.cycle_sort_order)
+        self.context_menu.add_command(label="Filter folder...", command=self.ask_folder_filter)
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Exit", command=root.quit)
+        
+        # Bind right-click to show menu
+        self.root.bind("<Button-3>", self.show_context_menu)
+        
+        # Show the Open Image button initially
+        self.root.after(100, self.show_open_button)
+        
+    def show_context_menu(self, event):
+        """Show the context menu on right-click"""
+        self.context_menu.tk_popup(event.x_root, event.y_root)
+        
+    def open_file(self):
+        """Open a file dialog to select a RAW image file"""
+        file_types = [("RAW Files", " ".join(f"*{ext}" for ext in RAW_EXTENSIONS))]
+        file_path = filedialog.askopenfilename(filetypes=file_types)
+        
+        if file_path:
+            self.open_specific_file(file_path)
+    
+    def open_specific_file(self, file_path):
+        """Open a specific RAW file given its path"""
+        if os.path.isfile(file_path):
+            # Use existing open_file logic after setting the path
+            self.current_image_path = file_path
+            self.current_token = self.generation.advance()
+            self.peak_rss_mb = None
+            self.decode_level = None
+            self.upgrade_future = None
+            self.capture_time = None
+            self.capture_latency_ms = None
+            self.profiler.begin_open(self.current_token, file_path)
+            self.status_var.set(f"Loading: {os.path.basename(file_path)}")
+            self.update_folder_position(file_path)
+            
+            # Stop any fade that was running for the previous image
+            self.cancel_transition()
+            
+            # Clear previous images and hide the button
+            if self.image_id:
+                self.canvas.delete(self.image_id)
+                self.image_id = None
+            self.clear_tiles()
+            if self.open_button_window:
+                self.canvas.delete(self.open_button_window)
+                self.open_button_window = None
+                
+            self.preview_image = None
+            self.preview_pil = None
+            self.full_image = None
+            self.full_pil = None
+            self.full_size_img = None
+            self.preview_source = None
+            self.pyramids = {}
+            self.displayed_image = None
+            self.look = LookAdjustments()
+            self.linear_proxy = None
+            self.linear_full = None
+            self.adjusted_img = None
+            self.adjusted_full = None
+            self.adjust_photo = None
+            self.display_pil = None
+            self.display_source = None
+            self.refresh_aids()
+            
+            # Decode for the canvas as it is now, even before anything was displayed
+            canvas_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+            if canvas_size[0] > 1 and canvas_size[1] > 1:
+                self.preview_target_size = canvas_size
+            
+            # Work for the previous image carries on at background priority; the
+            # prefetch below drops it unless that image is still a neighbour
+            for job_key, priority in self.current_jobs.items():
+                self.scheduler.reprioritize(job_key, priority)
+                self.background_jobs.add(job_key)
+            self.current_jobs = {}
+            
+            key = file_key(file_path)
+            self.image_cache.pin([key])
+            cached_full = self.image_cache.get(key, 'full')
+            cached_preview = self.image_cache.get(key, 'preview')
+            
+            if cached_full:
+                # Already decoded in the background, show full quality at once
+                self.full_size_img = cached_full
+                self.decode_level = decode_level_of(cached_full)
+                self.pyramids[id(cached_full)] = ImagePyramid(cached_full).build_async()
+                self.display_image(cached_full)
+                self.status_var.set(self.loaded_status())
+                # The prefetch may have decoded at a lower level than a zoomed view needs
+                self.upgrade_decode()
+            else:
+                if cached_preview:
+                    # Show the cached preview and continue with the full decode
+                    self.preview_source = cached_preview
+                    self.display_image(cached_preview, is_preview=True)
+                else:
+                    self.request_preview(file_path, self.current_token)
+                self.request_full(file_path, self.current_token, self.wanted_decode_level())
+            
+            self.prefetch_neighbours()
+        else:
+            self.status_var.set(f"Error: File not found - {file_path}")
+            # Show the Open Image button if file loading failed
+            self.show_open_button()
+
+    def preview_job(self, file_path):
+        """Scheduler job: the preview of a file, from the caches or its embedded JPEG"""
+        key = file_key(file_path)
+        img = self.image_cache.get(key, 'preview')
+        if img is None:
+            with self.profiler.bind_token(self.token_for(file_path)):
+                img = load_preview_image(file_path, self.disk_cache, self.preview_target_size, self.metadata_index)
+            self.image_cache.put(key, 'preview', img)
+        return img
+    
+    def full_job(self, file_path, decode_level, job, on_preview=None, on_full=None, on_linear=None):
+        """Scheduler job: decode a file at a level, returning (image, peak RSS in MB)
+
+        The image is None when the preview already covers the view. The
+        pipeline reads the file once and stops at its next check when the
+        job is cancelled. on_full gets the image as soon as it is decoded,
+        before the pipeline makes the look adjustments' proxy for on_linear.
+        """
+        key = file_key(file_path)
+        cached = self.image_cache.get(key, 'full')
+        if cached is not None and (decode_level == 'auto' or satisfies_level(cached, decode_level)):
+            return cached, None
+        result = {}
+        with self.profiler.bind_token(self.token_for(file_path)), PeakRSSMonitor() as monitor:
+            run_decode_pipeline(
+                file_path, job.token, job.generation,
+                on_preview=on_preview or (lambda img: None),
+                on_full=lambda img: (result.update(full=img), on_full and on_full(img)),
+                preview_img=self.image_cache.get(key, 'preview'),
+                image_cache=self.image_cache,
+                disk_cache=self.disk_cache,
+                engine=self.decode_engine,
+                target_size=self.preview_target_size,
+                decode_level=decode_level,
+                metadata_index=self.metadata_index,
+                on_linear=on_linear
+            )
+        return result.get('full'), monitor.peak_mb
+    
+    def token_for(self, file_path):
+        """Return the open token that work on a file is profiled under, None unless it is on screen"""
+        return self.current_token if file_path == self.current_image_path else None
+    
+    def request_preview(self, file_path, token):
+        """Queue the preview of the image being opened at the highest priority"""
+        job_key = ('preview', file_path)
+        future = self.scheduler.submit(job_key, lambda job: self.preview_job(file_path), PRIORITY_PREVIEW)
+        self.current_jobs[job_key] = PRIORITY_BACKGROUND_PREVIEW
+        future.add_done_callback(lambda f: self.preview_done(token, f))
+    
+    def request_full(self, file_path, token, decode_level):
+        """Queue the full decode of the image being opened, right after previews"""
+        job_key = ('full', file_path, decode_level)
+        on_preview = lambda img: self.post_to_ui(token, lambda: self.show_loaded_preview(token, img))
+        shown = {}
+
+        def on_full(img):
+            # Show the image while the pipeline goes on to the linear proxy
+            shown['full'] = img
+            self.prepare_full_image(token, img)
+
+        view_size = self.preview_target_size
+        on_linear = lambda proxy: self.post_to_ui(token, lambda: self.set_linear_proxy(token, view_size, proxy))
+        future = self.scheduler.submit(
+            job_key, lambda job: self.full_job(file_path, decode_level, job, on_preview, on_full, on_linear),
+            PRIORITY_FULL)
+        self.current_jobs[job_key] = PRIORITY_BACKGROUND
+        future.add_done_callback(lambda f: self.full_done(token, f, shown))
+        return future
+    
+    def preview_done(self, token, future):
+        """Hand a finished preview job to the UI thread; called from the worker that ran it"""
+        if future.cancelled() or future.exception() is not None or not self.generation.is_current(token):
+            # A failed preview is reported by the full decode, which retries through rawpy
+            return
+        self.record_queue_wait(token, future)
+        img = future.result()
+        self.post_to_ui(token, lambda: self.show_loaded_preview(token, img))
+    
+    def full_done(self, token, future, shown=None):
+        """Hand a finished full decode job to the UI thread; called from the worker that ran it
+
+        shown holds the image under 'full' when the job already handed it over.
+        """
+        if future.cancelled() or not self.generation.is_current(token):
+            return
+        error = future.exception()
+        if isinstance(error, DecodeCancelled):
+            return
+        if error is not None:
+            self.root.after(0, lambda msg=str(error): self.status_var.set(f"Error: {msg}"))
+            return
+        self.record_queue_wait(token, future)
+        img, peak_mb = future.result()
+        if img is None:
+            self.post_to_ui(token, lambda: self.show_preview_as_full(token))
+        elif shown is None or shown.get('full') is not img:
+            self.prepare_full_image(token, img)
+        if peak_mb is not None:
+            self.root.after(0, lambda: self.show_peak_rss(token, peak_mb))
+    
+    def record_queue_wait(self, token, future):
+        """Add the time a job spent queued to the profile of an open"""
+        job = future.job
+        self.profiler.record('queue_wait', job.submitted_at, job.started_at, token)
+    
+    def wanted_decode_level(self):
+        """Return the decode level to ask the pipeline for in the current view"""
+        if self.decode_policy == 'full' or self.zoom is not None:
+            return 'full'
+        return 'auto'
+    
+    def upgrade_decode(self):
+        """Start a better decode of the current file when the one on screen no longer matches the view"""
+        if not self.current_image_path or self.full_size_img is None:
+            return
+        if self.upgrade_future is not None and not self.upgrade_future.done():
+            return
+        wanted = self.wanted_decode_level()
+        if wanted == 'full':
+            if self.decode_level == 'full':
+                return
+        elif self.decode_level != 'preview' or preview_covers_view(self.preview_source.size, self.preview_target_size):
+            # Lower levels are picked for the canvas size, only an outgrown preview needs another look
+            return
+        self.status_var.set(f"Processing RAW image: {self.describe_current_file()}")
+        self.upgrade_future = self.request_full(self.current_image_path, self.current_token, wanted)
+    
+    def show_loaded_preview(self, token, img):
+        """Display a finished preview unless a newer image, or a full decode of this one, is on screen"""
+        if self.generation.is_current(token) and self.full_size_img is None and self.adjusted_img is None:
+            self.preview_source = img
+            self.display_image(img, is_preview=True)
+            self.status_var.set(f"Processing RAW image: {self.describe_current_file()}{self.capture_latency_status()}")
+    
+    def prepare_full_image(self, token, img):
+        """Build the resize pyramid of a finished full decode, then hand it to the UI thread"""
+        if not self.generation.is_current(token):
+            return
+        with self.profiler.span('pyramid'):
+            pyramid = ImagePyramid(img).build()
+        self.post_to_ui(token, lambda: self.show_loaded_full_image(token, img, pyramid))
+    
+    def post_to_ui(self, token, callback):
+        """Run a callback on the Tk thread, timing its wait in the after queue when profiling"""
+        if not self.profiler.enabled:
+            self.root.after(0, callback)
+            return
+        posted = time.perf_counter()
+        
+        def run():
+            self.profiler.record('tk_after_wait', posted, time.perf_counter(), token)
+            callback()
+        self.root.after(0, run)
+    
+    def make_photo_image(self, img):
+        """Create a Tk PhotoImage from a PIL image"""
+        with self.profiler.span('photoimage'):
+            return ImageTk.PhotoImage(img)
+    
+    def show_loaded_full_image(self, token, img, pyramid=None):
+        """Fade to a finished full decode unless a newer image has been opened since"""
+        if not self.generation.is_current(token):
+            return
+        level = decode_level_of(img)
+        if self.decode_level is not None and not is_better_level(level, self.decode_level):
+            # An upgrade overtook this decode, or the memory budget kept it at the level on screen
+            if not self.transition_active:
+                self.status_var.set(self.loaded_status())
+            return
+        self.decode_level = level
+        if pyramid:
+            self.pyramids[id(img)] = pyramid
+        self.start_transition(img)
+        # The view may have been zoomed while this decode ran
+        self.upgrade_decode()
+    
+    def show_preview_as_full(self, token):
+        """Settle on the preview when it already covers the canvas, skipping the full decode"""
+        if not self.generation.is_current(token) or self.full_size_img is not None:
+            return
+        self.decode_level = 'preview'
+        self.full_size_img = self.preview_source
+        self.status_var.set(self.loaded_status())
+        self.upgrade_decode()
+    
+    def show_peak_rss(self, token, peak_mb):
+        """Record the peak RSS of a finished decode and show it once the image is loaded"""
+        if self.generation.is_current(token) and peak_mb is not None:
+            self.peak_rss_mb = peak_mb
+            if self.full_size_img and not self.transition_active:
+                self.status_var.set(self.loaded_status())
+    
+    def loaded_status(self):
+        """Return the status bar text for a fully loaded image"""
+        status = f"Loaded: {self.describe_current_file()}"
+        if self.decode_level:
+            status += f" | {DECODE_LEVEL_LABELS[self.decode_level]}"
+        if self.peak_rss_mb is not None:
+            status += f" | peak RSS {self.peak_rss_mb:.0f} MB"
+        status += self.capture_latency_status()
+        status += self.sharpness_status()
+        status += self.folder_order_status()
+        breakdown = self.profiler.finish_open(self.current_token)
+        if breakdown:
+            stats = self.scheduler.stats()
+            status += f" | {breakdown} | queue {stats['queued']} · wait p50 {stats['wait_ms_p50']:.0f} ms"
+        return status
+    
+    def adjust_look(self, name, direction):
+        """Step one look adjustment up (1) or down (-1) and show the result"""
+        if not self.current_image_path or self.grid.active:
+            return
+        self.look.step(name, direction)
+        self.apply_look()
+    
+    def reset_look(self):
+        """Go back to the image as decoded"""
+        if not self.current_image_path:
+            return
+        self.look = LookAdjustments()
+        self.apply_look()
+    
+    def apply_look(self):
+        """Show the current file with the look adjustments, rendered from its linear proxy
+        
+        Renders at display resolution take a few milliseconds; only a zoomed
+        view needs the full resolution proxy and render.
+        """
+        if self.look.is_neutral():
+            if self.adjusted_img is not None:
+                self.adjusted_img = None
+                self.adjusted_full = None
+                self.show_unadjusted()
+            return
+        view_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        if self.linear_proxy is None or not self.linear_proxy.covers(view_size):
+            self.request_linear(view_size)
+        if self.zoom is not None and self.linear_full is None:
+            self.request_linear(None)
+        if self.linear_proxy is None:
+            self.status_var.set(f"Preparing adjustments: {self.describe_current_file()}")
+            return
+        
+        start = time.perf_counter()
+        self.adjusted_img = self.linear_proxy.render(self.look)
+        if self.zoom is None:
+            self.adjusted_full = None
+            self.show_adjusted()
+        elif self.linear_full is not None:
+            self.adjusted_full = self.linear_full.render(self.look)
+            self.render_viewport()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.status_var.set(f"{self.look.describe()} ({elapsed_ms:.0f} ms): {self.describe_current_file()}")
+    
+    def show_adjusted(self):
+        """Draw the display resolution render of the look, reusing the PhotoImage when the size allows"""
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        img = self.adjusted_img
+        # The proxy is decoded to fit the canvas, so only a resized window needs a resample
+        scale = min(canvas_width / img.width, canvas_height / img.height)
+        if abs(scale - 1) * max(img.size) >= 1:
+            img = self.resize_image_to_fit(img, canvas_width, canvas_height)
+        self.cancel_transition()
+        if self.adjust_photo is None or (self.adjust_photo.width(), self.adjust_photo.height()) != img.size:
+            self.adjust_photo = self.make_photo_image(img)
+        else:
+            # Pasting into the PhotoImage on screen skips creating a new Tk image per step
+            with self.profiler.span('photoimage'):
+                self.adjust_photo.paste(img)
+        self.place_image(self.adjust_photo, (canvas_width - img.width) // 2, (canvas_height - img.height) // 2)
+        self.displayed_image = self.adjust_photo
+        self.display_pil = img
+        self.display_source = self.adjusted_img
+        self.refresh_aids()
+    
+    def show_unadjusted(self):
+        """Show the current file as decoded again"""
+        if self.zoom is not None:
+            self.render_viewport()
+        else:
+            self.display_image(self.current_source(), is_preview=self.full_size_img is None)
+        if self.full_size_img:
+            self.status_var.set(self.loaded_status())
+    
+    def request_linear(self, view_size):
+        """Queue a linear decode of the current file for the look adjustments, None meaning full resolution"""
+        file_path = self.current_image_path
+        token = self.current_token
+        job_key = ('linear', file_path, view_size)
+        if job_key in self.current_jobs:
+            return
+        self.current_jobs[job_key] = PRIORITY_BACKGROUND
+        budget = self.decode_engine.memory_budget_mb
+        future = self.scheduler.submit(job_key, lambda job: decode_linear(file_path, view_size, budget), PRIORITY_FULL)
+        future.add_done_callback(lambda f: self.post_to_ui(token, lambda: self.linear_done(token, view_size, f)))
+    
+    def linear_done(self, token, view_size, future):
+        """Store a finished linear decode and render the look from it"""
+        if not self.generation.is_current(token) or future.cancelled():
+            return
+        try:
+            proxy = future.result()
+        except Exception as e:
+            self.status_var.set(f"Error: Cannot apply adjustments - {str(e)}")
+            return
+        self.set_linear_proxy(token, view_size, proxy)
+    
+    def set_linear_proxy(self, token, view_size, proxy):
+        """Keep a linear proxy of the current file, None view_size meaning full resolution, and render the look"""
+        if not self.generation.is_current(token):
+            return
+        if view_size is None:
+            self.linear_full = proxy
+        elif self.linear_proxy is None or proxy.size[0] > self.linear_proxy.size[0]:
+            self.linear_proxy = proxy
+        self.apply_look()
+    
+    def toggle_aid(self, name):
+        """Switch the histogram, clipping overlay or focus peaking on or off"""
+        setattr(self, name, not getattr(self, name))
+        if self.zoom is not None and name != 'show_histogram':
+            # The overlays are drawn into the tiles
+            self.clear_tiles()
+            self.render_viewport()
+        else:
+            self.refresh_aids()
+    
+    def refresh_aids(self):
+        """Bring the histogram and the fit mode overlay up to date with what is on screen"""
+        with self.profiler.span('analysis'):
+            self.draw_overlay()
+            self.draw_histogram()
+    
+    def draw_overlay(self):
+        """Lay the clipping/peaking overlay over the fitted image; zoomed views draw it into the tiles"""
+        img = self.display_pil
+        if self.zoom is not None or img is None or not (self.show_clipping or self.show_peaking):
+            if self.overlay_item:
+                self.canvas.delete(self.overlay_item)
+                self.overlay_item = None
+                self.overlay_photo = None
+            return
+        overlay = self.analysis.overlay(img, self.show_clipping, self.show_peaking, self.display_source)
+        self.overlay_photo = self.make_photo_image(overlay)
+        x_pos = (self.canvas.winfo_width() - img.width) // 2
+        y_pos = (self.canvas.winfo_height() - img.height) // 2
+        if self.overlay_item:
+            self.canvas.itemconfig(self.overlay_item, image=self.overlay_photo)
+            self.canvas.coords(self.overlay_item, x_pos, y_pos)
+        else:
+            self.overlay_item = self.canvas.create_image(x_pos, y_pos, anchor=tk.NW, image=self.overlay_photo)
+        self.canvas.tag_raise(self.overlay_item)
+    
+    def draw_histogram(self):
+        """Draw the RGB and luma histograms of the current image in the top-right corner"""
+        # The whole image, also while zoomed in; reduced to about the window size before counting
+        if self.zoom is None:
+            img, source = self.display_pil, self.display_source
+        else:
+            img = source = self.current_source()
+        if not self.show_histogram or img is None:
+            for item in self.histogram_items:
+                self.canvas.delete(item)
+            self.histogram_items = []
+            self._histogram_state = None
+            return
+        canvas_width = self.canvas.winfo_width()
+        state = self._histogram_state
+        if state and state[0] is source and state[1] == canvas_width:
+            # Panning a zoomed view doesn't change the histogram
+            for item in self.histogram_items:
+                self.canvas.tag_raise(item)
+            return
+        self._histogram_state = (source, canvas_width)
+        histogram = self.analysis.histogram(img, (canvas_width, self.canvas.winfo_height()), source)
+        
+        # Scale to the tallest bin away from the ends, so clipped spikes don't flatten the rest
+        peak = max(1, histogram[:, 1:255].max())
+        left, top = canvas_width - HISTOGRAM_WIDTH - 12, 12
+        bottom = top + HISTOGRAM_HEIGHT
+        step = HISTOGRAM_WIDTH / 255
+        lines = []
+        for counts in histogram:
+            coords = []
+            for value, count in enumerate(counts.tolist()):
+                coords += (left + value * step, bottom - min(count / peak, 1.0) * HISTOGRAM_HEIGHT)
+            lines.append(coords)
+        
+        if not self.histogram_items:
+            self.histogram_items = [self.canvas.create_rectangle(0, 0, 0, 0, fill="#1E1E1E", outline="#3D3D3D")]
+            for color in HISTOGRAM_COLORS:
+                self.histogram_items.append(self.canvas.create_line(0, 0, 0, 0, fill=color))
+        self.canvas.coords(self.histogram_items[0], left - 4, top - 4, left + HISTOGRAM_WIDTH + 4, bottom + 4)
+        for item, coords in zip(self.histogram_items[1:], lines):
+            self.canvas.coords(item, *coords)
+        for item in self.histogram_items:
+            self.canvas.tag_raise(item)
+    
+    def capture_latency_status(self):
+        """Return the status bar suffix with the capture-to-screen latency of a watched file"""
+        if self.capture_latency_ms is None:
+            return ""
+        return f" | on screen {self.capture_latency_ms:.0f} ms after capture"
+    
+    def watch_folder(self, directory, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        """Open each new RAW file written to a directory, starting with the newest one already there"""
+        self.stop_watching()
+        try:
+            self.watcher = FolderWatcher(directory, self.on_watched_file, settle_seconds=settle_seconds).start()
+        except Exception as e:
+            self.status_var.set(f"Error: Cannot watch {directory} - {str(e)}")
+            return
+        files = list_raw_files(directory)
+        if files:
+            self.open_specific_file(max(files, key=os.path.getmtime))
+        else:
+            self.status_var.set(f"Watching {directory} for new RAW files ({self.watcher.mode})")
+    
+    def stop_watching(self):
+        """Stop watching the watch folder"""
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+    
+    def on_watched_file(self, file_path, seen_at):
+        """Called from the watcher thread when a new file in the watch folder is fully written"""
+        self.root.after(0, lambda: self.show_watched_file(file_path, seen_at))
+    
+    def show_watched_file(self, file_path, seen_at):
+        """Show a newly captured file right away and measure how long it took to appear"""
+        if self.grid.active:
+            self.hide_grid()
+        self.open_specific_file(file_path)
+        if self.current_image_path == file_path:
+            self.capture_time = seen_at
+            # A cached preview is already on screen
+            if self.displayed_image is not None:
+                self.capture_latency_ms = (time.perf_counter() - seen_at) * 1000
+    
+    def jump_to_sharpest(self):
+        """Open the sharpest frame of the current file's burst, scoring the folder first where needed"""
+        if not self.current_image_path or self.grid.active or self.scoring:
+            return
+        directory = os.path.dirname(os.path.abspath(self.current_image_path))
+        if self.sharpness is None or self.sharpness.directory != directory:
+            self.sharpness = SharpnessScores(directory)
+        scores = self.sharpness
+        stale = scores.stale_files(self.folder_files)
+        if not stale:
+            self.show_sharpest()
+            return
+        
+        # Score on a process pool driven from a thread, so the UI stays responsive
+        self.scoring = True
+        self.status_var.set(f"Scoring sharpness: 0/{len(stale)}")
+        
+        def progress(file_path, score, error, done, total):
+            self.root.after(0, lambda: self.status_var.set(f"Scoring sharpness: {done}/{total}"))
+        
+        def run():
+            try:
+                scores.score_missing(on_progress=progress)
+                self.root.after(0, lambda: self.scores_ready(scores))
+            except Exception as e:
+                self.root.after(0, lambda: self.scores_ready(scores, e))
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def scores_ready(self, scores, error=None):
+        """Continue the jump once the folder has been scored"""
+        self.scoring = False
+        if error is not None:
+            self.status_var.set(f"Error: Cannot score sharpness - {str(error)}")
+        elif scores is self.sharpness and self.current_image_path and not self.grid.active:
+            self.show_sharpest()
+    
+    def show_sharpest(self):
+        """Open the sharpest frame of the current file's burst from the scores"""
+        name = os.path.basename(self.current_image_path)
+        burst = self.sharpness.burst_of(self.current_image_path)
+        if burst is None:
+            self.status_var.set(f"No sharpness score for {name}")
+            return
+        best = self.sharpness.sharpest(burst)
+        if best != os.path.abspath(self.current_image_path):
+            self.open_specific_file(best)
+        elif len(burst) == 1:
+            self.status_var.set(f"{name} is not part of a burst{self.sharpness_status()}")
+        else:
+            self.status_var.set(f"{name} is the sharpest of its burst{self.sharpness_status()}")
+    
+    def sharpness_status(self):
+        """Return the status bar suffix with the current file's sharpness and rank within its burst"""
+        if self.sharpness is None or self.scoring or not self.current_image_path:
+            return ""
+        file_path = os.path.abspath(self.current_image_path)
+        if os.path.dirname(file_path) != self.sharpness.directory:
+            return ""
+        score = self.sharpness.score_of(file_path)
+        burst = self.sharpness.burst_of(file_path)
+        if score is None or burst is None:
+            return ""
+        if len(burst) == 1:
+            return f" | sharpness {score['center']:.1f}"
+        ranked = sorted(burst, key=self.sharpness.rank_key, reverse=True)
+        return f" | sharpness {score['center']:.1f} (#{ranked.index(file_path) + 1} of {len(burst)} in burst)"
+    
+    def update_folder_position(self, file_path):
+        """Locate a file within its directory's RAW files for navigation"""
+        file_path = os.path.abspath(file_path)
+        if file_path not in self.folder_files:
+            # Moved to another folder, or the folder contents changed
+            directory = os.path.dirname(file_path)
+            self.folder_files = self.list_folder(directory)
+            if file_path not in self.folder_files and self.folder_filter:
+                # Opened a file the filter hides, navigate the whole folder again
+                self.folder_filter = None
+                self.folder_files = self.list_folder(directory)
+            self.index_folder(directory)
+        try:
+            self.folder_index = self.folder_files.index(file_path)
+        except ValueError:
+            self.folder_files = [file_path]
+            self.folder_index = 0
+    
+    def describe_current_file(self):
+        """Return the current file name along with its position in the folder"""
+        name = os.path.basename(self.current_image_path)
+        if len(self.folder_files) > 1:
+            return f"{name} ({self.folder_index + 1}/{len(self.folder_files)})"
+        return name
+    
+    def show_next(self):
+        """Open the next RAW file in the current folder"""
+        self.step_image(1)
+    
+    def show_previous(self):
+        """Open the previous RAW file in the current folder"""
+        self.step_image(-1)
+    
+    def open_folder(self):
+        """Pick a folder and show its thumbnail grid"""
+        directory = filedialog.askdirectory()
+        if directory:
+            self.show_grid(directory)
+    
+    def show_grid(self, directory=None):
+        """Replace the image with the thumbnail grid of a folder, the current one by default"""
+        if directory is None:
+            files = self.folder_files
+        else:
+            directory = os.path.abspath(directory)
+            files = self.list_folder(directory)
+            self.index_folder(directory)
+        if not files:
+            self.status_var.set(f"No RAW files in {directory or 'this folder'}")
+            return
+        selected = self.folder_index if files is self.folder_files else 0
+        self.canvas.pack_forget()
+        self.grid.canvas.pack(fill=tk.BOTH, expand=True, before=self.status_bar)
+        self.grid.canvas.focus_set()
+        self.grid.show(files, selected)
+        self.status_var.set(f"Browsing: {os.path.dirname(files[0])} ({len(files)} files)")
+    
+    def current_directory(self):
+        """Return the folder being navigated, or None"""
+        if self.grid.active and self.grid.files:
+            return os.path.dirname(self.grid.files[0])
+        if self.current_image_path:
+            return os.path.dirname(os.path.abspath(self.current_image_path))
+        return None
+    
+    def list_folder(self, directory):
+        """List a folder's RAW files in the current sort order and filter
+
+        Until the folder's index is up to date this is the plain name order,
+        and the order is applied once the index catches up. Raises ValueError
+        for a filter that can't be parsed.
+        """
+        if self.metadata_index is None or (self.sort_order == 'name' and not self.sort_reversed
+                                           and not self.folder_filter):
+            return list_raw_files(directory)
+        if self.indexed_directory != directory:
+            self.order_pending = True
+            return list_raw_files(directory)
+        mtime = os.stat(directory).st_mtime_ns
+        if mtime != self.indexed_mtime:
+            stale = self.metadata_index.stale_files(directory)
+            if len(stale) > INLINE_INDEX_FILES:
+                self.indexed_directory = None
+                self.order_pending = True
+                return list_raw_files(directory)
+            self.metadata_index.index_files(stale)
+            self.indexed_mtime = mtime
+        return self.metadata_index.files(directory, self.sort_order, self.sort_reversed, self.folder_filter)
+    
+    def index_folder(self, directory):
+        """Index the new and changed files of a folder in the background, one batch per scheduler job"""
+        if self.metadata_index is None or self.indexing == directory:
+            return
+        if self.index_job_key:
+            self.scheduler.cancel(self.index_job_key)
+        self.indexing = directory
+        self.queue_index_batch(directory, None, None, 0)
+    
+    def queue_index_batch(self, directory, files, mtime, done):
+        """Queue one batch of a folder's stale files; with files None the job finds them first
+
+        The job returns the files left to index and the folder's modification
+        time from before it was checked for stale files.
+        """
+        def job(job):
+            stale, folder_mtime = files, mtime
+            if stale is None:
+                folder_mtime = os.stat(directory).st_mtime_ns
+                stale = self.metadata_index.stale_files(directory)
+            self.metadata_index.index_files(stale[:INDEX_BATCH])
+            return stale, folder_mtime
+        self.index_job_key = ('index', directory, done)
+        future = self.scheduler.submit(self.index_job_key, job, PRIORITY_BACKGROUND)
+        future.add_done_callback(lambda f: self.root.after(0, lambda: self.index_batch_done(directory, done, f)))
+    
+    def index_batch_done(self, directory, done, future):
+        """Queue the next batch of a folder being indexed, or apply the folder order once it is complete"""
+        if directory != self.indexing or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.indexing = None
+            self.index_job_key = None
+            self.status_var.set(f"Error: Cannot index {directory} - {str(error)}")
+            return
+        stale, mtime = future.result()
+        done += min(len(stale), INDEX_BATCH)
+        if len(stale) > INDEX_BATCH:
+            if self.order_pending:
+                self.status_var.set(f"Indexing {os.path.basename(directory)}: {done}/{done + len(stale) - INDEX_BATCH}")
+            self.queue_index_batch(directory, stale[INDEX_BATCH:], mtime, done)
+            return
+        self.indexing = None
+        self.index_job_key = None
+        self.indexed_directory = directory
+        self.indexed_mtime = mtime
+        if self.order_pending and directory == self.current_directory():
+            self.apply_folder_order()
+    
+    def cycle_sort_order(self):
+        """Navigate the folder in the next SORT_ORDERS order"""
+        orders = list(SORT_ORDERS)
+        self.sort_order = orders[(orders.index(self.sort_order) + 1) % len(orders)]
+        self.sort_reversed = False
+        self.apply_folder_order()
+    
+    def reverse_sort_order(self):
+        """Navigate the folder in the reverse of the current order"""
+        self.sort_reversed = not self.sort_reversed
+        self.apply_folder_order()
+    
+    def ask_folder_filter(self):
+        """Ask for a filter such as 'iso>=1600 lens:70-200 portrait'; an empty one shows every file"""
+        text = simpledialog.askstring(
+            "Filter", "Show files matching, e.g. iso>=1600 shutter<=1/250 f<4 lens:70-200 rating>=3 portrait",
+            initialvalue=self.folder_filter or "", parent=self.root)
+        if text is not None:
+            self.set_folder_filter(text)
+    
+    def set_folder_filter(self, text):
+        """Only navigate the files of the folder that match a filter"""
+        try:
+            parse_filter(text)
+        except ValueError as e:
+            self.status_var.set(f"Error: {str(e)}")
+            return
+        previous = self.folder_filter
+        self.folder_filter = text.strip() or None
+        if not self.apply_folder_order():
+            self.folder_filter = previous
+    
+    def apply_folder_order(self):
+        """Re-list the current folder in the sort order and filter, keeping the current file if it matches
+
+        Returns False when the filter is invalid or matches nothing, leaving
+        the navigation as it was.
+        """
+        directory = self.current_directory()
+        if directory is None:
+            return False
+        if self.metadata_index is None:
+            self.status_var.set("Sorting and filtering need the metadata index")
+            return False
+        self.order_pending = False
+        try:
+            files = self.list_folder(directory)
+        except ValueError as e:
+            self.status_var.set(f"Error: {str(e)}")
+            return False
+        if self.order_pending:
+            self.index_folder(directory)
+            self.status_var.set(f"Indexing {os.path.basename(directory)}...")
+            return True
+        if not files:
+            self.status_var.set(f"No files match '{self.folder_filter}'")
+            return False
+        self.folder_files = files
+        current = os.path.abspath(self.current_image_path) if self.current_image_path else None
+        if self.grid.active:
+            selected = self.grid.files[self.grid.selected] if self.grid.files else None
+            self.grid.show(files, files.index(selected) if selected in files else 0)
+            self.status_var.set(f"Browsing: {directory} ({len(files)} files){self.folder_order_status()}")
+        elif current in files:
+            self.folder_index = files.index(current)
+            self.status_var.set(f"{self.describe_current_file()}{self.folder_order_status()}")
+        else:
+            self.open_specific_file(files[0])
+        return True
+    
+    def folder_order_status(self):
+        """Return the status bar suffix naming the folder's sort order and filter, if not the default"""
+        parts = []
+        if self.sort_order != 'name' or self.sort_reversed:
+            parts.append(f"by {self.sort_order}{' reversed' if self.sort_reversed else ''}")
+        if self.folder_filter:
+            parts.append(f"filter '{self.folder_filter}'")
+        return f" | {', '.join(parts)}" if parts else ""
+    
+    def hide_grid(self):
+        """Go back from the thumbnail grid to the image"""
+        self.grid.hide()
+        self.grid.canvas.pack_forget()
+        self.canvas.pack(fill=tk.BOTH, expand=True, before=self.status_bar)
+    
+    def toggle_grid(self):
+        """Switch between the image and the thumbnail grid of its folder"""
+        if self.grid.active:
+            if self.current_image_path:
+                self.hide_grid()
+                self.status_var.set(self.loaded_status() if self.full_size_img else
+                                    f"Loading: {self.describe_current_file()}")
+        elif self.folder_files:
+            self.show_grid()
+        else:
+            self.open_folder()
+    
+    def open_from_grid(self, file_path):
+        """Open a file picked in the thumbnail grid"""
+        self.hide_grid()
+        self.open_specific_file(file_path)
+    
+    def grid_step_rows(self, rows):
+        """Move the grid selection up or down by whole rows"""
+        if self.grid.active:
+            self.grid.move_selection(rows * self.grid.columns)
+    
+    def grid_page_rows(self):
+        """Return the number of grid rows that fit on screen"""
+        return max(1, self.grid.canvas.winfo_height() // self.grid.cell_size()[1])
+    
+    def step_image(self, offset):
+        """Move through the current folder by the given number of files"""
+        if self.grid.active:
+            self.grid.move_selection(offset)
+            return
+        if not self.folder_files:
+            return
+        index = self.folder_index + offset
+        if 0 <= index < len(self.folder_files):
+            self.open_specific_file(self.folder_files[index])
+    
+    def prefetch_neighbours(self):
+        """Queue background decodes of the files around the current one, nearest first"""
+        neighbours = []
+        for distance in range(1, self.prefetch_radius + 1):
+            for index in (self.folder_index + distance, self.folder_index - distance):
+                if 0 <= index < len(self.folder_files):
+                    neighbours.append(self.folder_files[index])
+        
+        # Embedded previews are cheap, so every neighbour gets one before any full decode starts
+        decode_level = self.wanted_decode_level()
+        wanted = set()
+        for file_path in neighbours:
+            job_key = ('preview', file_path)
+            self.scheduler.submit(job_key, lambda job, p=file_path: self.preview_job(p), PRIORITY_BACKGROUND_PREVIEW)
+            wanted.add(job_key)
+        for file_path in neighbours:
+            job_key = ('full', file_path, decode_level)
+            self.scheduler.submit(job_key, lambda job, p=file_path: self.full_job(p, decode_level, job),
+                                  PRIORITY_BACKGROUND)
+            wanted.add(job_key)
+        
+        # Drop the work for files that are no longer neighbours
+        for job_key in self.background_jobs - wanted - set(self.current_jobs):
+            self.scheduler.cancel(job_key, min_priority=PRIORITY_BACKGROUND_PREVIEW)
+        self.background_jobs = wanted
+    
+    def cancel_transition(self):
+        """Stop a running fade transition"""
+        self.transition_active = False
+        self.blender = None
+        self.fade_image = None
+        if self.fade_after_id:
+            try:
+                self.root.after_cancel(self.fade_after_id)
+            except ValueError:
+                pass
+            self.fade_after_id = None
+    
+    def display_image(self, img, is_preview=False):
+        """Display an image on the canvas with proper scaling"""
+        if img and self.capture_time is not None and self.capture_latency_ms is None:
+            self.capture_latency_ms = (time.perf_counter() - self.capture_time) * 1000
+        if img and self.zoom is not None:
+            # Zoomed in, draw the visible tiles of the current source instead
+            self.displayed_image = img
+            self.render_viewport()
+            if is_preview:
+                self.status_var.set(f"Preview: {self.describe_current_file()}{self.capture_latency_status()}")
+        elif img:
+            # Resize image to fit the canvas
+            canvas_width = self.canvas.winfo_width()
+            canvas_height = self.canvas.winfo_height()
+            self.preview_target_size = (canvas_width, canvas_height)
+            
+            if canvas_width > 1 and canvas_height > 1:
+                img_resized = self.resize_image_to_fit(img, canvas_width, canvas_height)
+                
+                # Convert to PhotoImage for display
+                photo_img = self.make_photo_image(img_resized)
+                
+                # Calculate position to center the image
+                x_pos = (canvas_width - photo_img.width()) // 2
+                y_pos = (canvas_height - photo_img.height()) // 2
+                
+                # Display the image
+                self.place_image(photo_img, x_pos, y_pos)
+                
+                self.display_pil = img_resized
+                self.display_source = img
+                self.refresh_aids()
+                
+                # We need to keep a reference to prevent garbage collection
+                if is_preview:
+                    # Store both the PIL and PhotoImage versions
+                    self.preview_pil = img_resized
+                    self.preview_image = photo_img
+                    self.displayed_image = photo_img
+                    self.status_var.set(f"Preview: {self.describe_current_file()}{self.capture_latency_status()}")
+                else:
+                    self.full_pil = img_resized
+                    self.full_image = photo_img
+                    self.displayed_image = photo_img
+    
+    def start_transition(self, full_img):
+        """Start the transition from preview to full image"""
+        if self.adjusted_img is not None:
+            # The adjusted render stays on screen, the full decode is kept for when the look is reset
+            self.full_size_img = full_img
+            self.status_var.set(self.loaded_status())
+            return
+        if self.zoom is not None:
+            # No fade while zoomed in, just swap in the sharper tiles
+            self.full_size_img = full_img
+            self.display_image(full_img)
+            self.status_var.set(self.loaded_status())
+            return
+        
+        if not self.preview_image or self.fade_duration <= 0:
+            # If no preview was shown or fades are disabled, just display the full image
+            self.full_size_img = full_img
+            self.display_image(full_img)
+            self.status_var.set(self.loaded_status())
+            return
+        
+        # Store the original full-size image
+        self.full_size_img = full_img
+        
+        # Resize to match the current display size
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        
+        # Store the initial transition size for resize detection
+        self._last_transition_size = (canvas_width, canvas_height)
+        
+        # Resize the full image to the same dimensions as the preview
+        if canvas_width > 1 and canvas_height > 1:
+            resized_full = self.resize_image_to_fit(full_img, canvas_width, canvas_height)
+            
+            # Store both PIL and PhotoImage versions
+            self.full_pil = resized_full
+            self.full_image = self.make_photo_image(resized_full)
+            
+            # Cancel any existing fade transition
+            self.cancel_transition()
+            self.prepare_blend()
+            
+            # Start fade transition
+            self.alpha = 0.0
+            self.fade_start = time.perf_counter()
+            self._fade_frame_cost = 0.0
+            self.transition_active = True
+            self.status_var.set("Loading...")
+            
+            # Start the fade transition in the main thread via after()
+            # This will execute in the main thread's event loop ensuring smooth UI
+            self.fade_after_id = self.root.after(0, self.fade_transition)
+    
+    def prepare_blend(self):
+        """Precompute the blend buffers and the single PhotoImage the fade draws into"""
+        self.blender = CrossfadeBlender(self.preview_pil, self.full_pil)
+        self.fade_image = ImageTk.PhotoImage('RGB', self.blender.size)
+    
+    def fade_transition(self):
+        """Draw the next frame of the fade from preview to full image"""
+        if not self.transition_active or not self.preview_pil or not self.full_pil:
+            return
+        
+        frame_start = time.perf_counter()
+        
+        # Progress follows the clock, so slow frames are skipped rather than stretching the fade
+        self.alpha = (frame_start - self.fade_start) / self.fade_duration
+        remaining = self.fade_duration - (frame_start - self.fade_start)
+        
+        # Get current canvas dimensions
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        
+        if self.alpha >= 1.0 or remaining < self._fade_frame_cost:
+            # Transition complete (or no time left for another frame), display the full image
+            self.transition_active = False
+            self.alpha = 1.0
+            
+            x_pos = (canvas_width - self.full_image.width()) // 2
+            y_pos = (canvas_height - self.full_image.height()) // 2
+            self.place_image(self.full_image, x_pos, y_pos)
+            self.displayed_image = self.full_image
+            self.display_pil = self.full_pil
+            self.display_source = self.full_size_img
+            self.refresh_aids()
+            
+            # Release the blend buffers and the resized copies only the fade needed,
+            # and clear any fade timer reference
+            self.blender = None
+            self.fade_image = None
+            self.preview_pil = None
+            self.preview_image = None
+            self.full_pil = None
+            self.fade_after_id = None
+            
+            self.status_var.set(self.loaded_status())
+            return
+        
+        try:
+            # Check if the canvas size has changed during transition
+            w_diff = abs(canvas_width - self._last_transition_size[0])
+            h_diff = abs(canvas_height - self._last_transition_size[1])
+            
+            if w_diff > 5 or h_diff > 5:  # If size changed significantly
+                self.resize_transition(canvas_width, canvas_height)
+            
+            # Blend into the persistent PhotoImage and update the canvas item in place
+            with self.profiler.span('fade_frame'):
+                self.fade_image.paste(self.blender.blend(self.alpha))
+            x_pos = (canvas_width - self.fade_image.width()) // 2
+            y_pos = (canvas_height - self.fade_image.height()) // 2
+            self.place_image(self.fade_image, x_pos, y_pos)
+            self.displayed_image = self.fade_image
+            
+            # Update status
+            self.status_var.set(f"Loading... {int(self.alpha * 100)}%")
+            
+        except Exception as e:
+            # If anything fails, just jump to the full image
+            print(f"Error during transition: {e}")
+            self.transition_active = False
+            if hasattr(self, 'full_size_img') and self.full_size_img:
+                self.display_image(self.full_size_img)
+            return
+        
+        # Leave the event loop at least as much time as a frame takes, so input
+        # stays responsive on large canvases where blending is expensive
+        frame_cost = time.perf_counter() - frame_start
+        self._fade_frame_cost = frame_cost if not self._fade_frame_cost else 0.7 * self._fade_frame_cost + 0.3 * frame_cost
+        delay = max(FADE_FRAME_INTERVAL_MS, int(self._fade_frame_cost * 1000))
+        self.fade_after_id = self.root.after(delay, self.fade_transition)
+    
+    def resize_transition(self, canvas_width, canvas_height):
+        """Resize both sides of a running fade to a new canvas size"""
+        self._last_transition_size = (canvas_width, canvas_height)
+        if self.preview_source:
+            self.preview_pil = self.resize_image_to_fit(self.preview_source, canvas_width, canvas_height)
+        else:
+            self.preview_pil = self.resize_image_to_fit(self.preview_pil, canvas_width, canvas_height)
+        self.full_pil = self.resize_image_to_fit(self.full_size_img, canvas_width, canvas_height)
+        self.full_image = self.make_photo_image(self.full_pil)
+        self.prepare_blend()
+    
+    def place_image(self, photo_img, x_pos, y_pos):
+        """Show a PhotoImage at a position, reusing the canvas item when there is one"""
+        if self.image_id:
+            self.canvas.itemconfig(self.image_id, image=photo_img)
+            self.canvas.coords(self.image_id, x_pos, y_pos)
+        else:
+            self.image_id = self.canvas.create_image(x_pos, y_pos, anchor=tk.NW, image=photo_img)
+    
+    def current_source(self):
+        """Return the best available image for the current file at its own resolution"""
+        if self.zoom is not None:
+            return self.adjusted_full or self.full_size_img or self.preview_source
+        return self.adjusted_img or self.full_size_img or self.preview_source
+    
+    def fit_scale(self):
+        """Return the scale at which the current image fits the canvas"""
+        source = self.current_source()
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        return min(canvas_width / source.width, canvas_height / source.height)
+    
+    def on_mouse_wheel(self, event):
+        """Zoom in or out around the mouse pointer"""
+        direction = 1 if event.num == 4 or getattr(event, 'delta', 0) > 0 else -1
+        self.step_zoom(direction, event.x, event.y)
+    
+    def step_zoom(self, direction, x=None, y=None):
+        """Move to the next zoom level up or down, falling back to fit-to-window"""
+        if not self.current_source():
+            return
+        fit = self.fit_scale()
+        current = self.zoom if self.zoom is not None else fit
+        if direction > 0:
+            larger = [level for level in ZOOM_LEVELS if level > current * 1.001 and level > fit]
+            if larger:
+                self.set_zoom(larger[0], x, y)
+        else:
+            smaller = [level for level in ZOOM_LEVELS if level < current * 0.999 and level > fit]
+            self.set_zoom(smaller[-1] if smaller else None, x, y)
+    
+    def toggle_zoom(self):
+        """Switch between fit-to-window and 100%"""
+        self.set_zoom(1.0 if self.zoom is None else None)
+    
+    def set_zoom(self, zoom, x=None, y=None):
+        """Zoom to a scale (None to fit the window), keeping the point at (x, y) in place"""
+        source = self.current_source()
+        if not source:
+            return
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        if x is None:
+            x, y = canvas_width / 2, canvas_height / 2
+        
+        if zoom is None:
+            # Back to the fit-to-window display
+            if self.zoom is not None:
+                self.zoom = None
+                self.view_center = (0.5, 0.5)
+                self.clear_tiles()
+                self.display_image(source, is_preview=self.full_size_img is None)
+            return
+        
+        # Find the image point under the pointer, then center the view so it stays there
+        old_zoom = self.zoom if self.zoom is not None else self.fit_scale()
+        origin_x, origin_y = self.view_origin(old_zoom)
+        point_x = (x - origin_x) / (source.width * old_zoom)
+        point_y = (y - origin_y) / (source.height * old_zoom)
+        self.view_center = (point_x - (x - canvas_width / 2) / (source.width * zoom),
+                            point_y - (y - canvas_height / 2) / (source.height * zoom))
+        
+        if self.zoom is None:
+            # Leaving fit mode, the tiles replace the single fitted image
+            self.cancel_transition()
+            if self.image_id:
+                self.canvas.delete(self.image_id)
+                self.image_id = None
+        self.zoom = zoom
+        self.render_viewport()
+        self.status_var.set(f"Zoom {zoom * 100:.0f}%: {self.describe_current_file()}")
+        # Pixel peeping needs the full quality decode
+        self.upgrade_decode()
+        if self.adjusted_img is not None and self.adjusted_full is None:
+            self.apply_look()
+    
+    def view_origin(self, zoom):
+        """Return the canvas position of the image's top-left corner at a zoom level"""
+        source = self.current_source()
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        center_x, center_y = self.view_center if self.zoom is not None else (0.5, 0.5)
+        return (round(canvas_width / 2 - center_x * source.width * zoom),
+                round(canvas_height / 2 - center_y * source.height * zoom))
+    
+    def clamp_view_center(self):
+        """Keep the zoomed image covering the viewport, or centered when it is smaller"""
+        source = self.current_source()
+        canvas_size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        center = []
+        for value, image_size, view_size in zip(self.view_center, source.size, canvas_size):
+            zoomed = image_size * self.zoom
+            if zoomed <= view_size:
+                center.append(0.5)
+            else:
+                half = view_size / 2 / zoomed
+                center.append(min(max(value, half), 1 - half))
+        self.view_center = tuple(center)
+    
+    def render_viewport(self):
+        """Draw the tiles of the zoomed image that cross the visible canvas"""
+        source = self.current_source()
+        if not source or self.zoom is None:
+            return
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        
+        self.tile_renderer.set_source(source, self.pyramids.get(id(source)))
+        if not self._tile_state or self._tile_state[0] is not source or self._tile_state[1] != self.zoom:
+            # New image or zoom level, none of the existing tiles apply
+            self.clear_tiles()
+            self._tile_state = (source, self.zoom)
+        
+        self.clamp_view_center()
+        origin_x, origin_y = self.view_origin(self.zoom)
+        tile_size = self.tile_renderer.tile_size
+        visible = self.tile_renderer.visible_tiles(self.zoom, (origin_x, origin_y), (canvas_width, canvas_height))
+        
+        for tx, ty in visible:
+            x = origin_x + tx * tile_size
+            y = origin_y + ty * tile_size
+            item = self.tile_items.get((tx, ty))
+            if item:
+                # Already on the canvas, just move it
+                self.canvas.coords(item[0], x, y)
+            else:
+                tile = self.tile_renderer.tile(self.zoom, tx, ty)
+                if self.show_clipping or self.show_peaking:
+                    tile = self.analysis.composite(tile, self.show_clipping, self.show_peaking)
+                photo = self.make_photo_image(tile)
+                item_id = self.canvas.create_image(x, y, anchor=tk.NW, image=photo)
+                self.tile_items[(tx, ty)] = (item_id, photo)
+        
+        # Drop the tiles that scrolled out of view
+        for key in set(self.tile_items) - set(visible):
+            self.canvas.delete(self.tile_items.pop(key)[0])
+        self.refresh_aids()
+    
+    def clear_tiles(self):
+        """Remove every tile from the canvas"""
+        for item_id, _ in self.tile_items.values():
+            self.canvas.delete(item_id)
+        self.tile_items = {}
+        self._tile_state = None
+    
+    def start_pan(self, event):
+        """Remember where a drag started"""
+        self._pan_anchor = (event.x, event.y)
+    
+    def pan(self, event):
+        """Move the zoomed image along with the mouse"""
+        if self.zoom is None or not self._pan_anchor:
+            return
+        source = self.current_source()
+        dx = event.x - self._pan_anchor[0]
+        dy = event.y - self._pan_anchor[1]
+        self._pan_anchor = (event.x, event.y)
+        self.view_center = (self.view_center[0] - dx / (source.width * self.zoom),
+                            self.view_center[1] - dy / (source.height * self.zoom))
+        self.render_viewport()
+    
+    def end_pan(self, event):
+        """Finish a drag"""
+        self._pan_anchor = None
+    
+    def resize_image_to_fit(self, img, canvas_width, canvas_height):
+        """Resize an image to fit within the canvas while maintaining aspect ratio"""
+        with self.profiler.span('resize'):
+            return resize_to_fit(img, canvas_width, canvas_height, self.pyramids.get(id(img)))
+    
+    def on_resize(self, event):
+        """Handle window resize events"""
+        # Only handle resizing of the main window, not child widgets
+        if event.widget == self.root:
+            # Wait a bit to avoid excessive resizing operations
+            if hasattr(self, '_resize_job') and self._resize_job:
+                try:
+                    self.root.after_cancel(self._resize_job)
+                except ValueError:
+                    # Handle the case where the ID is not valid
+                    pass
+                
+            if self.displayed_image:
+                self._resize_job = self.root.after(100, self.resize_displayed_image)
+            elif self.open_button_window:
+                # If no image is displayed but we have a button, reposition it
+                self._resize_job = self.root.after(100, self.show_open_button)
+    
+    def resize_displayed_image(self):
+        """Resize the currently displayed image to fit the new canvas size"""
+        try:
+            # Get the canvas dimensions
+            canvas_width = self.canvas.winfo_width()
+            canvas_height = self.canvas.winfo_height()
+            
+            if self.zoom is not None:
+                # Only the tiles for the new viewport need rendering
+                self.render_viewport()
+            elif self.transition_active:
+                # Don't cancel the transition, just resize both images and continue
+                if hasattr(self, 'full_size_img') and self.full_size_img:
+                    self.resize_transition(canvas_width, canvas_height)
+            else:
+                # If no transition is active, just resize the current image
+                if self.adjusted_img is not None:
+                    # Re-render, from a proxy that covers the new size once it is decoded
+                    self.apply_look()
+                elif hasattr(self, 'full_size_img') and self.full_size_img:
+                    # If we have the full image loaded, resize and display it
+                    self.display_image(self.full_size_img)
+                    # A larger canvas may have outgrown the preview
+                    self.upgrade_decode()
+                elif hasattr(self, 'preview_pil') and self.preview_pil:
+                    # If only the preview is loaded, resize and display it
+                    self.display_image(self.preview_pil, is_preview=True)
+                
+        except Exception as e:
+            print(f"Error during resize: {e}")
+            
+        # Reset the resize job ID to prevent further errors
+        self._resize_job = None
+
+    def show_open_button(self):
+        """Display a native button in the center of the canvas"""
+        # Get canvas dimensions
+        canvas_width = self.canvas.winfo_width()
+        canvas_height = self.canvas.winfo_height()
+        
+        if canvas_width <= 1 or canvas_height <= 1:
+            # Canvas not yet properly sized, schedule this again
+            self.root.after(100, self.show_open_button)
+            return
+        
+        # Configure the button style
+        if hasattr(self, '_init_button_style') and not self._init_button_style:
+            # Round the button corners using custom styling
+            # Initialize a custom style for the button
+            self.open_button.config(
+                highlightthickness=0,
+                highlightbackground="#2D2D2D",
+                cursor="hand2"  # Change cursor to hand when hovering
+            )
+            
+            # Configure hover effects
+            self.open_button.bind("<Enter>", lambda e: e.widget.config(bg="#3D3D3D"))
+            self.open_button.bind("<Leave>", lambda e: e.widget.config(bg="#2D2D2D"))
+            
+            self._init_button_style = True
+        
+        # Position the button in the center of the canvas
+        button_width = 180  # Fixed width
+        button_height = 50  # Fixed height
+        
+        x = (canvas_width - button_width) // 2
+        y = (canvas_height - button_height) // 2
+        
+        # Configure the button size
+        self.open_button.config(width=15, height=2)  # Approximate size in characters/lines
+        
+        # Create or update the button window on the canvas
+        if self.open_button_window:
+            self.canvas.coords(self.open_button_window, x, y)
+        else:
+            self.open_button_window = self.canvas.create_window(x, y, window=self.open_button, anchor=tk.NW)
+            self._init_button_style = False  # Trigger style initialization
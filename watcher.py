@@ -0,0 +1,187 @@
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from decode import is_raw_file
+from defaults import DEFAULT_SETTLE_SECONDS
+
+# inotify event flags (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, 'O_NONBLOCK') else 0
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Events meaning a file is complete: its writer closed it, or it was renamed into place
+IN_COMPLETE = IN_CLOSE_WRITE | IN_MOVED_TO
+
+# With inotify the size check is only a backstop for writers that never close, so it waits longer
+INOTIFY_SETTLE_SECONDS = 10.0
+
+# After a close or rename the size must still hold this long, in case the writer reopens the file to append
+CLOSED_SETTLE_SECONDS = 0.25
+
+# With inotify the directory is still scanned this often, for writes it never sees, e.g. over NFS or SMB
+FALLBACK_POLL_SECONDS = 2.0
+
+# Header of one struct inotify_event: wd, mask, cookie, name length
+_EVENT_HEADER = struct.Struct('iIII')
+
+def _open_inotify(directory):
+    """Return an inotify descriptor watching a directory, or None where inotify isn't available"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (AttributeError, OSError):
+        return None
+
+def _read_inotify_events(fd):
+    """Return the (file name, event mask) pairs of the queued inotify events"""
+    try:
+        data = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return []
+    events = []
+    position = 0
+    while position + _EVENT_HEADER.size <= len(data):
+        _, mask, _, length = _EVENT_HEADER.unpack_from(data, position)
+        position += _EVENT_HEADER.size
+        name = data[position:position + length].rstrip(b'\0')
+        position += length
+        if name:
+            events.append((os.fsdecode(name), mask))
+    return events
+
+def _file_state(path):
+    """Return (size, mtime_ns) of a file, or None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+class FolderWatcher:
+    """Report RAW files that appear in a directory once they are fully written
+
+    Uses inotify on Linux and polls the directory elsewhere. A file is
+    complete once its size has stayed the same for long enough: with
+    inotify, CLOSED_SETTLE_SECONDS after its writer closes it or it is
+    renamed into place, or INOTIFY_SETTLE_SECONDS without either as a
+    backstop. Files only the directory scan finds, which is all of them when
+    polling and those written by another machine to a network share
+    otherwise, need settle_seconds, so a copy that stalls for less than that
+    is never opened half-written. With inotify the scan still runs every
+    FALLBACK_POLL_SECONDS. A file that changes again after it was reported
+    is reported again. on_file is called from the watcher thread with the
+    path and the time.perf_counter() time the file was first seen.
+    """
+
+    def __init__(self, directory, on_file, poll_interval=0.5, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.directory = directory
+        self.on_file = on_file
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self._known = self._scan()          # name -> (size, mtime_ns) when last reported, or already there
+        self._pending = {}                  # path -> [first seen, last size, time of last size change, settle]
+        self._fd = _open_inotify(directory)
+        self._closed_settle = min(settle_seconds, CLOSED_SETTLE_SECONDS)
+        self._open_settle = max(settle_seconds, INOTIFY_SETTLE_SECONDS)
+        self._next_poll = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def mode(self):
+        return 'inotify' if self._fd is not None else 'polling'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Check pending files often enough to report them soon after they settle
+            timeout = min(state[3] for state in self._pending.values()) / 2 if self._pending else self.poll_interval
+            if self._fd is not None:
+                ready, _, _ = select.select([self._fd], [], [], min(timeout, self.poll_interval))
+                events = _read_inotify_events(self._fd) if ready else []
+            else:
+                self._stop.wait(timeout)
+                events = []
+            now = time.perf_counter()
+            for name, mask in events:
+                if not is_raw_file(name):
+                    continue
+                path = os.path.join(self.directory, name)
+                state = self._pending.setdefault(path, [now, -1, now, self._open_settle])
+                if mask & IN_COMPLETE:
+                    # The size has to hold from the close on
+                    state[2] = now
+                    state[3] = self._closed_settle
+                else:
+                    # Writing again after a close means the file isn't complete after all
+                    state[3] = self._open_settle
+            if self._fd is None or now >= self._next_poll:
+                self._next_poll = now + FALLBACK_POLL_SECONDS
+                for name in self._changed_names():
+                    self._pending.setdefault(os.path.join(self.directory, name), [now, -1, now, self.settle_seconds])
+            self._check_pending(now)
+
+    def _scan(self):
+        """Return {name: (size, mtime_ns)} of the RAW files in the directory"""
+        files = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if is_raw_file(entry.name):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            pass
+        return files
+
+    def _changed_names(self):
+        """Return the names of the RAW files that are new or changed since they were last reported"""
+        return sorted(name for name, state in self._scan().items() if self._known.get(name) != state)
+
+    def _check_pending(self, now):
+        """Report the pending files whose size has held for their settle time"""
+        for path, state in list(self._pending.items()):
+            file_state = _file_state(path)
+            if file_state is None:
+                # Removed or renamed again before it was complete
+                del self._pending[path]
+                continue
+            size = file_state[0]
+            if size != state[1]:
+                state[1] = size
+                state[2] = now
+            if size > 0 and now - state[2] >= state[3]:
+                del self._pending[path]
+                name = os.path.basename(path)
+                # Closing a file without changing it isn't news
+                if self._known.get(name) != file_state:
+                    self._known[name] = file_state
+                    self.on_file(path, state[0])